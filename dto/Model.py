@@ -1,5 +1,108 @@
 import re
+from functools import lru_cache
+from typing import Dict, Iterable, List, NamedTuple, Optional
 from pydantic import BaseModel
+from pkg.instaloader_4 import instaloader
+
+_INSTAGRAM_LINK = re.compile(r'(?:https?://)?(?:www\.)?instagram\.com/(?P<path>[^?#]*)(?:\?(?P<query>[^#]*))?')
+_IMG_INDEX = re.compile(r'(?:^|&)img_index=(\d+)')
+_MEDIA_ID_PARAM = re.compile(r'(?:^|&)media_id=(\d+)')
+_SHORTCODE = re.compile(r'[A-Za-z0-9_-]{1,64}')
+# Media ids, optionally followed by the owner id, as in 3141592653589793238_25025320
+_MEDIA_ID = re.compile(r'(\d{12,})(?:_\d+)?')
+# First path segment of a link of each kind; posts and reels are followed by the shortcode
+_LINK_KINDS = {'p': 'post', 'tv': 'post', 'reel': 'reel', 'reels': 'reel', 'stories': 'story',
+               'highlights': 'highlight'}
+
+
+class InstagramLink(NamedTuple):
+    """An Instagram link, parsed once.
+
+    kind is one of post, reel, story, highlight or other; shortcode is set for posts and reels."""
+    kind: str
+    shortcode: Optional[str] = None
+    img_index: Optional[int] = None
+
+    @property
+    def is_story(self) -> bool:
+        return self.kind in ('story', 'highlight')
+
+
+@lru_cache(maxsize=4096)
+def classify_link(url: str) -> Optional[InstagramLink]:
+    """Parse an Instagram link, or return None if url is not one. Recently parsed links are cached."""
+    match = _INSTAGRAM_LINK.match(url)
+    if match is None:
+        return None
+    segments = [segment for segment in match.group('path').split('/') if segment]
+    img_index = _IMG_INDEX.search(match.group('query') or '')
+    img_index = int(img_index.group(1)) if img_index else None
+    media_id = _MEDIA_ID_PARAM.search(match.group('query') or '')
+    media_id = media_id.group(1) if media_id else None
+    # Posts may also be linked below the profile, as in instagram.com/<username>/p/<shortcode>/
+    for position, segment in enumerate(segments[:2]):
+        kind = _LINK_KINDS.get(segment)
+        if kind is None:
+            continue
+        if kind == 'story' and segments[position + 1:position + 2] == ['highlights']:
+            kind = 'highlight'
+        shortcode = None
+        if kind in ('post', 'reel'):
+            # As in instagram.com/p/?media_id=<media id>
+            shortcode = segments[position + 1] if position + 1 < len(segments) else media_id
+        return InstagramLink(kind, shortcode, img_index)
+    if media_id:
+        return InstagramLink('post', media_id, img_index)
+    return InstagramLink('other', None, img_index)
+
+
+class InvalidLinkError(ValueError):
+    """A link that does not lead to a post or reel that could be downloaded."""
+
+
+def parse_shortcode(url: str) -> str:
+    """Return the validated shortcode of a post or reel link, converting media ids to shortcodes.
+
+    This needs no network access, so that malformed links do not cost rate-limited queries.
+
+    :raises InvalidLinkError: If url is not a post or reel link or its shortcode is malformed."""
+    return shortcode_from_link(classify_link(url), url)
+
+
+def shortcode_from_link(link: Optional[InstagramLink], url: str) -> str:
+    """Like :func:`parse_shortcode`, for a link that has been classified already."""
+    if link is None:
+        raise InvalidLinkError(f"Not an Instagram link: {url}")
+    if link.kind not in ('post', 'reel'):
+        raise InvalidLinkError(f"Not a post or reel link ({link.kind}): {url}")
+    if link.shortcode is None:
+        raise InvalidLinkError(f"No shortcode in link: {url}")
+    media_id = _MEDIA_ID.fullmatch(link.shortcode)
+    try:
+        if media_id:
+            return instaloader.Post.mediaid_to_shortcode(int(media_id.group(1)))
+        if not _SHORTCODE.fullmatch(link.shortcode) or (len(link.shortcode) <= 11 and
+                                                        instaloader.Post.shortcode_to_mediaid(link.shortcode) == 0):
+            raise InvalidLinkError(f"Invalid shortcode {link.shortcode!r} in link: {url}")
+    except instaloader.InvalidArgumentException as e:
+        raise InvalidLinkError(f"{e}: {url}") from e
+    return link.shortcode
+
+
+def classify_links(urls: Iterable[str]) -> List[Optional[InstagramLink]]:
+    """Parse a batch of links, each distinct one only once."""
+    parsed: Dict[str, Optional[InstagramLink]] = {}
+    links = []
+    for url in urls:
+        if url not in parsed:
+            parsed[url] = classify_link(url)
+        links.append(parsed[url])
+    return links
+
+
+def classify_records(records: Iterable["IgRecord"]) -> Dict[str, Optional[InstagramLink]]:
+    """Parsed image links of a batch of records, by record id."""
+    return {record.id: record.link for record in records}
 
 
 class IgRecord(BaseModel):
@@ -9,17 +112,31 @@ class IgRecord(BaseModel):
     def __repr__(self) -> str:
         return f"IgRecord(id='{self.id}', image_link='{self.image_link}')"
 
+    @property
+    def link(self) -> Optional[InstagramLink]:
+        """The parsed image_link, or None if it is not an Instagram link.
+
+        This follows changes of image_link, e.g. by model_copy(update=...), as it is looked up in the cache of
+        :func:`classify_link` on each access."""
+        return classify_link(self.image_link)
+
+    def parse_shortcode(self) -> str:
+        """The validated shortcode of image_link, see :func:`parse_shortcode`."""
+        return shortcode_from_link(self.link, self.image_link)
+
+    @property
+    def is_syncable(self) -> bool:
+        """Whether image_link is an Instagram link other than a story."""
+        return self.link is not None and not self.link.is_story
+
     def is_instagram_story_url(self, url: str) -> bool:
-        story_pattern = r'https?://(www\.)?instagram\.com/(stories|highlights)/.*'
-        return bool(re.match(story_pattern, url))
+        link = classify_link(url)
+        return link is not None and link.is_story
 
     def is_instagram_url(self, url: str) -> bool:
-        pattern = r'(https?:\/\/)?(www\.)?instagram\.com\/.*'
-        return bool(re.match(pattern, url)) and not self.is_instagram_story_url(url)
+        link = classify_link(url)
+        return link is not None and not link.is_story
 
     def has_img_index_greater_than_one(self, url: str) -> bool:
-        match = re.search(r'img_index=(\d+)', url)
-        if match:
-            img_index_value = int(match.group(1))
-            return img_index_value > 1
-        return False
+        link = classify_link(url)
+        return link is not None and link.img_index is not None and link.img_index > 1
@@ -1,5 +1,16 @@
+import argparse
 from scripts.automated_syncer import AutomatedSyncer
 
 if __name__ == "__main__":
-    syncer = AutomatedSyncer()
-    syncer.start_sync()
+    parser = argparse.ArgumentParser(description="Sync Instagram images from Airtable to the platform")
+    parser.add_argument("--stream", action="store_true",
+                        help="fetch, download and push records concurrently instead of phase by phase")
+    parser.add_argument("--incremental", action="store_true",
+                        help="only fetch the Airtable rows modified since the last complete fetch")
+    args = parser.parse_args()
+
+    syncer = AutomatedSyncer(incremental=args.incremental)
+    if args.stream:
+        syncer.start_streaming()
+    else:
+        syncer.start_sync()
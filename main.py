@@ -1,16 +1,29 @@
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request
 from dto.Model import IgRecord
-from services.post_service import PostService
-from services.image_service import ImageService
+from services.job_service import JobManager
+from services.loader_pool import LoaderPool
 from typing import List
 from fastapi import HTTPException
+from fastapi.responses import StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from dotenv import load_dotenv
 
 # Load environment variables from .env file
 load_dotenv()
 
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # One loader pool for the lifetime of the app, shared by all requests
+    app.state.loader_pool = LoaderPool()
+    app.state.job_manager = JobManager(app.state.loader_pool)
+    yield
+    app.state.job_manager.close()
+    app.state.loader_pool.close()
+
+
+app = FastAPI(lifespan=lifespan)
 
 # Mount static files
 app.mount("/downloads", StaticFiles(directory="downloads"), name="downloads")
@@ -22,26 +35,44 @@ async def root():
 
 
 @app.post("/bulk/post")
-async def bulk_post(items: List[IgRecord]):
-    post_service = PostService(items)
+async def bulk_post(items: List[IgRecord], request: Request):
     try:
-        data = post_service.process()
+        job = request.app.state.job_manager.submit_posts(items)
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         print(e)
         raise HTTPException(status_code=500, detail="An unexpected error occurred.")
-    return {"data": data}
+    return {"data": job.to_dict()}
 
 
 @app.post("/bulk/image")
-async def bulk_image(items: List[IgRecord]):
-    image_service = ImageService(items)
+async def bulk_image(items: List[IgRecord], request: Request):
     try:
-        data = image_service.process()
+        job = request.app.state.job_manager.submit_images(items)
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         print(e)
         raise HTTPException(status_code=500, detail="An unexpected error occurred.")
-    return {"data": data}
+    return {"data": job.to_dict()}
+
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str, request: Request):
+    job = request.app.state.job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found.")
+    return {"data": job.to_dict()}
+
+
+@app.get("/jobs/{job_id}/zip")
+async def get_job_zip(job_id: str, request: Request):
+    job_manager = request.app.state.job_manager
+    job = job_manager.get(job_id)
+    if job is None or job.kind != "post":
+        raise HTTPException(status_code=404, detail="Job not found.")
+    if job.finished_at is None:
+        raise HTTPException(status_code=409, detail="Job has not finished yet.")
+    return StreamingResponse(job_manager.iter_post_zip(job), media_type="application/zip",
+                             headers={"Content-Disposition": f'attachment; filename="{job.id}.zip"'})
@@ -15,7 +15,16 @@ else:
 from .exceptions import *
 from .instaloader import Instaloader
 from .instaloadercontext import InstaloaderContext, RateController
-from .lateststamps import LatestStamps
+try:
+    # requires the optional httpx dependency
+    from .asyncinstaloadercontext import AsyncInstaloaderContext
+except ImportError:
+    pass
+from .lateststamps import LatestStamps, SqliteLatestStamps
+from .mediastore import MediaStore
+from .metadatacache import MetadataCache
+from .sharedratecontroller import SharedRateController
+from .sectioniterator import SectionIterator, FrozenSectionIterator
 from .nodeiterator import NodeIterator, FrozenNodeIterator, resumable_iteration
 from .structures import (Hashtag, Highlight, Post, PostSidecarNode, PostComment, PostCommentAnswer, PostLocation,
                          Profile, Story, StoryItem, TopSearchResults, TitlePic,
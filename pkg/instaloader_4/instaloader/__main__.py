@@ -14,7 +14,7 @@ from . import (AbortDownloadException, BadCredentialsException, Instaloader, Ins
                TwoFactorAuthRequiredException, __version__, load_structure_from_file)
 from .instaloader import (get_default_session_filename, get_default_stamps_filename)
 from .instaloadercontext import default_user_agent
-from .lateststamps import LatestStamps
+from .lateststamps import LatestStamps, SqliteLatestStamps
 try:
     import browser_cookie3
     bc3_library = True
@@ -130,6 +130,7 @@ def _main(instaloader: Instaloader, targetlist: List[str],
           download_igtv: bool = False,
           fast_update: bool = False,
           latest_stamps_file: Optional[str] = None,
+          import_latest_stamps_file: Optional[str] = None,
           max_count: Optional[int] = None, post_filter_str: Optional[str] = None,
           storyitem_filter_str: Optional[str] = None,
           browser: Optional[str] = None,
@@ -146,8 +147,14 @@ def _main(instaloader: Instaloader, targetlist: List[str],
         instaloader.context.log('Only download storyitems with property "{}".'.format(storyitem_filter_str))
     latest_stamps = None
     if latest_stamps_file is not None:
-        latest_stamps = LatestStamps(latest_stamps_file)
+        if latest_stamps_file.endswith(SqliteLatestStamps.FILE_SUFFIXES):
+            latest_stamps = SqliteLatestStamps(latest_stamps_file)
+        else:
+            latest_stamps = LatestStamps(latest_stamps_file)
         instaloader.context.log(f"Using latest stamps from {latest_stamps_file}.")
+        if import_latest_stamps_file is not None and isinstance(latest_stamps, SqliteLatestStamps):
+            imported = latest_stamps.import_ini(import_latest_stamps_file)
+            instaloader.context.log(f"Imported latest stamps of {imported} profiles from {import_latest_stamps_file}.")
     # load cookies if browser is not None
     if browser and bc3_library:
         import_session(browser.lower(), instaloader, cookiefile)
@@ -192,7 +199,7 @@ def _main(instaloader: Instaloader, targetlist: List[str],
     try:
         # Generate set of profiles, already downloading non-profile targets
         for target in targetlist:
-            if (target.endswith('.json') or target.endswith('.json.xz')) and os.path.isfile(target):
+            if target.endswith(('.json', '.json.xz', '.json.zst')) and os.path.isfile(target):
                 with instaloader.context.error_catcher(target):
                     structure = load_structure_from_file(instaloader.context, target)
                     if isinstance(structure, Post):
@@ -296,6 +303,9 @@ def _main(instaloader: Instaloader, targetlist: List[str],
         print("\nInterrupted by user.", file=sys.stderr)
     except AbortDownloadException as exc:
         print("\nDownload aborted: {}.".format(exc), file=sys.stderr)
+    finally:
+        if latest_stamps is not None:
+            latest_stamps.close()
     # Save session if it is useful
     if instaloader.context.is_logged_in:
         instaloader.save_session_to_file(sessionfile)
@@ -335,7 +345,7 @@ def main():
                            help="Download the posts that you marked as saved. Requires --login.")
     g_targets.add_argument('_singlepost', nargs='*', metavar="-- -shortcode",
                            help="Download the post with the given shortcode")
-    g_targets.add_argument('_json', nargs='*', metavar="filename.json[.xz]",
+    g_targets.add_argument('_json', nargs='*', metavar="filename.json[.xz|.zst]",
                            help="Re-Download the given object.")
     g_targets.add_argument('_fromfile', nargs='*', metavar="+args.txt",
                            help="Read targets (and options) from given textfile.")
@@ -399,7 +409,12 @@ def main():
     g_cond.add_argument('--latest-stamps', nargs='?', metavar='STAMPSFILE', const=get_default_stamps_filename(),
                         help='Store the timestamps of latest media scraped for each profile. This allows updating '
                              'your personal Instagram archive even if you delete the destination directories. '
-                             'If STAMPSFILE is not provided, defaults to ' + get_default_stamps_filename())
+                             'If STAMPSFILE is not provided, defaults to ' + get_default_stamps_filename() + '. '
+                             'If STAMPSFILE ends in .db, .sqlite or .sqlite3, it is an SQLite database, which is '
+                             'faster for many profiles and can be shared by concurrent Instaloader processes.')
+    g_cond.add_argument('--import-latest-stamps', metavar='INIFILE',
+                        help='Import the timestamps of a --latest-stamps INI file into the SQLite database given with '
+                             '--latest-stamps, overwriting the values stored so far for the profiles in INIFILE.')
     g_cond.add_argument('--post-filter', '--only-if', metavar='filter',
                         help='Expression that, if given, must evaluate to True for each post to be downloaded. Must be '
                              'a syntactically valid python expression. Variables are evaluated to '
@@ -472,6 +487,10 @@ def main():
                             'retry logic.')
     g_how.add_argument('--no-iphone', action='store_true',
                         help='Do not attempt to download iPhone version of images and videos.')
+    g_how.add_argument('--prefetch-pages', action='store_true',
+                       help='Query the next page of posts in the background while downloading the current one. Each '
+                            'prefetch is a rate-limited query, which is wasted if the download stops before reaching '
+                            'that page, e.g. due to --count.')
 
     g_misc = parser.add_argument_group('Miscellaneous Options')
     g_misc.add_argument('-q', '--quiet', action='store_true',
@@ -515,6 +534,12 @@ def main():
         if args.login and args.load_cookies:
             raise SystemExit('--load-cookies and --login cannot be used together.')
 
+        if args.import_latest_stamps:
+            if not (args.latest_stamps or '').endswith(SqliteLatestStamps.FILE_SUFFIXES):
+                raise SystemExit('--import-latest-stamps requires --latest-stamps with an SQLite database.')
+            if not os.path.isfile(args.import_latest_stamps):
+                raise SystemExit('--import-latest-stamps: {} does not exist.'.format(args.import_latest_stamps))
+
         # Determine what to download
         download_profile_pic = not args.no_profile_pic or args.profile_pic_only
         download_posts = not (args.no_posts or args.stories_only or args.profile_pic_only)
@@ -537,7 +562,8 @@ def main():
                              fatal_status_codes=args.abort_on,
                              iphone_support=not args.no_iphone,
                              title_pattern=args.title_pattern,
-                             sanitize_paths=args.sanitize_paths)
+                             sanitize_paths=args.sanitize_paths,
+                             prefetch_pages=args.prefetch_pages)
         _main(loader,
               args.profile,
               username=args.login.lower() if args.login is not None else None,
@@ -551,6 +577,7 @@ def main():
               download_igtv=args.igtv,
               fast_update=args.fast_update,
               latest_stamps_file=args.latest_stamps,
+              import_latest_stamps_file=args.import_latest_stamps,
               max_count=int(args.count) if args.count is not None else None,
               post_filter_str=args.post_filter,
               storyitem_filter_str=args.storyitem_filter,
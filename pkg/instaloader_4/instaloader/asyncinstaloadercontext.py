@@ -0,0 +1,327 @@
+import asyncio
+import hashlib
+import json
+import os
+import random
+import time
+import urllib.parse
+from typing import Any, Dict, NoReturn, Optional
+
+import httpx
+import requests.utils
+
+from .exceptions import *
+from .instaloadercontext import JSON_QUERY_PROXY_URL, InstaloaderContext
+
+
+class AsyncInstaloaderContext:
+    """Awaitable counterpart of :class:`InstaloaderContext`, backed by :class:`httpx.AsyncClient`.
+
+    It wraps an existing :class:`InstaloaderContext` and shares its session cookies and headers (i.e. its login),
+    its :class:`RateController` and its error log, so it can be used side by side with the blocking context::
+
+       L = Instaloader()
+       async with AsyncInstaloaderContext(L.context) as async_context:
+           post = await Post.from_shortcode_async(async_context, SHORTCODE)
+           await L.download_pic_async(async_context, filename, post.url, post.date_local)
+
+    Many requests may be in flight on one event loop at the same time. Rate controlling is done with
+    :meth:`RateController.wait_before_query_async`, which does not block the event loop.
+
+    It provides :meth:`get_json`, :meth:`graphql_query`, :meth:`get_iphone_json`, :meth:`get_raw`,
+    :meth:`get_and_write_raw` and :meth:`head`, with the same semantics as the blocking methods of the same name.
+
+    :param context: The :class:`InstaloaderContext` to share state with.
+    :param max_connections: Maximum number of simultaneously open connections per client.
+
+    .. versionadded:: 4.11
+    """
+
+    def __init__(self, context: InstaloaderContext, max_connections: int = 100):
+        self.context = context
+        limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+        timeout = httpx.Timeout(context.request_timeout)
+        # JSON queries are routed through the same proxy as InstaloaderContext.get_json()
+        self._json_client = httpx.AsyncClient(proxy=JSON_QUERY_PROXY_URL, verify=False, limits=limits,
+                                              timeout=timeout)
+        # Media is downloaded anonymously, see InstaloaderContext.get_raw()
+        self._raw_client = httpx.AsyncClient(headers=context._default_http_header(empty_session_only=True),
+                                             limits=limits, timeout=timeout)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        await self.aclose()
+
+    async def aclose(self):
+        """Close the underlying HTTP clients. The wrapped :class:`InstaloaderContext` is left open."""
+        await self._json_client.aclose()
+        await self._raw_client.aclose()
+
+    async def do_sleep(self):
+        """Sleep a short time if context.sleep is set. Called before each request to instagram.com."""
+        if self.context.sleep:
+            await asyncio.sleep(min(random.expovariate(0.6), 15.0))
+
+    def _session_headers(self) -> Dict[str, str]:
+        # pylint:disable=protected-access
+        return dict(self.context._session.headers)
+
+    def _session_cookies(self) -> Dict[str, str]:
+        # pylint:disable=protected-access
+        return requests.utils.dict_from_cookiejar(self.context._session.cookies)
+
+    @staticmethod
+    def _cookie_header(cookies: Dict[str, str]) -> str:
+        return '; '.join('{}={}'.format(key, value) for key, value in cookies.items())
+
+    async def get_json(self, path: str, params: Dict[str, Any], host: str = 'www.instagram.com',
+                       headers: Optional[Dict[str, str]] = None, _attempt=1,
+                       response_headers: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """JSON request to Instagram.
+
+        :param path: URL, relative to the given domain which defaults to www.instagram.com/
+        :param params: GET parameters
+        :param host: Domain part of the URL from where to download the requested JSON; defaults to www.instagram.com
+        :param headers: Request headers, or None to use the headers and cookies of the context's session
+        :return: Decoded response dictionary
+        :raises QueryReturnedBadRequestException: When the server responds with a 400.
+        :raises QueryReturnedNotFoundException: When the server responds with a 404.
+        :raises ConnectionException: When query repeatedly failed.
+        """
+        is_graphql_query = 'query_hash' in params and 'graphql/query' in path
+        is_iphone_query = host == 'i.instagram.com'
+        is_other_query = not is_graphql_query and host == "www.instagram.com"
+        if headers is None:
+            headers = self._session_headers()
+            headers['Cookie'] = self._cookie_header(self._session_cookies())
+        # pylint:disable=protected-access
+        rate_controller = self.context._rate_controller
+        try:
+            await self.do_sleep()
+            if is_graphql_query:
+                await rate_controller.wait_before_query_async(params['query_hash'])
+            if is_iphone_query:
+                await rate_controller.wait_before_query_async('iphone')
+            if is_other_query:
+                await rate_controller.wait_before_query_async('other')
+            resp = await self._json_client.get('https://{0}/{1}'.format(host, path), params=params, headers=headers,
+                                               follow_redirects=False)
+            if resp.status_code in self.context.fatal_status_codes:
+                redirect = " redirect to {}".format(resp.headers['location']) if 'location' in resp.headers else ""
+                body = ""
+                if resp.headers.get('Content-Type', '').startswith('application/json'):
+                    body = ': ' + resp.text[:500] + ('…' if len(resp.text) > 501 else '')
+                raise AbortDownloadException("Query to https://{}/{} responded with \"{} {}\"{}{}".format(
+                    host, path, resp.status_code, resp.reason_phrase, redirect, body
+                ))
+            while resp.is_redirect:
+                redirect_url = resp.headers['location']
+                self.context.log('\nHTTP redirect from https://{0}/{1} to {2}'.format(host, path, redirect_url))
+                if (redirect_url.startswith('https://www.instagram.com/accounts/login') or
+                    redirect_url.startswith('https://i.instagram.com/accounts/login')):
+                    if not self.context.is_logged_in:
+                        raise LoginRequiredException("Redirected to login page. Use --login.")
+                    raise AbortDownloadException("Redirected to login page. You've been logged out, please wait " +
+                                                 "some time, recreate the session and try again")
+                if redirect_url.startswith('https://{}/'.format(host)):
+                    resp = await self._json_client.get(redirect_url if redirect_url.endswith('/')
+                                                       else redirect_url + '/',
+                                                       params=params, headers=headers, follow_redirects=False)
+                else:
+                    break
+            if response_headers is not None:
+                response_headers.clear()
+                response_headers.update(resp.headers)
+            if resp.status_code == 400:
+                raise QueryReturnedBadRequestException("400 Bad Request")
+            if resp.status_code == 404:
+                raise QueryReturnedNotFoundException("404 Not Found")
+            if resp.status_code == 429:
+                raise TooManyRequestsException("429 Too Many Requests")
+            if resp.status_code != 200:
+                raise ConnectionException("HTTP error code {}.".format(resp.status_code))
+            else:
+                resp_json = resp.json()
+            if 'status' in resp_json and resp_json['status'] != "ok":
+                if 'message' in resp_json:
+                    raise ConnectionException("Returned \"{}\" status, message \"{}\".".format(resp_json['status'],
+                                                                                               resp_json['message']))
+                else:
+                    raise ConnectionException("Returned \"{}\" status.".format(resp_json['status']))
+            return resp_json
+        except (ConnectionException, json.decoder.JSONDecodeError, httpx.HTTPError) as err:
+            error_string = "JSON Query to {}: {}".format(path, err)
+            if _attempt == self.context.max_connection_attempts:
+                if isinstance(err, QueryReturnedNotFoundException):
+                    raise QueryReturnedNotFoundException(error_string) from err
+                else:
+                    raise ConnectionException(error_string) from err
+            self.context.error(error_string + " [retrying]", repeat_at_end=False)
+            if isinstance(err, TooManyRequestsException):
+                if is_graphql_query:
+                    await rate_controller.handle_429_async(params['query_hash'])
+                if is_iphone_query:
+                    await rate_controller.handle_429_async('iphone')
+                if is_other_query:
+                    await rate_controller.handle_429_async('other')
+            return await self.get_json(path=path, params=params, host=host, headers=headers, _attempt=_attempt + 1,
+                                       response_headers=response_headers)
+
+    async def graphql_query(self, query_hash: str, variables: Dict[str, Any],
+                            referer: Optional[str] = None, rhx_gis: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Do a GraphQL Query.
+
+        :param query_hash: Query identifying hash.
+        :param variables: Variables for the Query.
+        :param referer: HTTP Referer, or None.
+        :param rhx_gis: 'rhx_gis' variable as somewhere returned by Instagram, needed to 'sign' request
+        :return: The server's response dictionary.
+        """
+        headers = self._session_headers()
+        # pylint:disable=protected-access
+        headers.update(self.context._default_http_header(empty_session_only=True))
+        del headers['Connection']
+        del headers['Content-Length']
+        headers['authority'] = 'www.instagram.com'
+        headers['scheme'] = 'https'
+        headers['accept'] = '*/*'
+        headers['Cookie'] = self._cookie_header(self._session_cookies())
+        if referer is not None:
+            headers['referer'] = urllib.parse.quote(referer)
+
+        variables_json = json.dumps(variables, separators=(',', ':'))
+
+        if rhx_gis:
+            values = "{}:{}".format(rhx_gis, variables_json)
+            headers['x-instagram-gis'] = hashlib.md5(values.encode()).hexdigest()
+
+        resp_json = await self.get_json('graphql/query',
+                                        params={'query_hash': query_hash,
+                                                'variables': variables_json},
+                                        headers=headers)
+        if 'status' not in resp_json:
+            self.context.error("GraphQL response did not contain a \"status\" field.")
+        return resp_json
+
+    async def get_iphone_json(self, path: str, params: Dict[str, Any]) -> Dict[str, Any]:
+        """JSON request to ``i.instagram.com``.
+
+        :param path: URL, relative to ``i.instagram.com/``
+        :param params: GET parameters
+        :return: Decoded response dictionary
+        :raises QueryReturnedBadRequestException: When the server responds with a 400.
+        :raises QueryReturnedNotFoundException: When the server responds with a 404.
+        :raises ConnectionException: When query repeatedly failed."""
+        headers = self._session_headers()
+        cookies = self._session_cookies()
+        # Set headers to simulate an API request from iPad
+        headers['ig-intended-user-id'] = str(self.context.user_id)
+        headers['x-pigeon-rawclienttime'] = '{:.6f}'.format(time.time())
+
+        # Add headers obtained from previous iPad request
+        headers.update(self.context.iphone_headers)
+
+        # Map the cookie value to the matching HTTP request header, see InstaloaderContext.get_iphone_json()
+        header_cookies_mapping = {'x-mid': 'mid',
+                                  'ig-u-ds-user-id': 'ds_user_id',
+                                  'x-ig-device-id': 'ig_did',
+                                  'x-ig-family-device-id': 'ig_did',
+                                  'family_device_id': 'ig_did'}
+        for key, value in header_cookies_mapping.items():
+            if value in cookies:
+                if key not in headers:
+                    headers[key] = cookies[value]
+                else:
+                    cookies.pop(value, None)
+
+        if 'rur' in cookies:
+            if 'ig-u-rur' not in headers:
+                headers['ig-u-rur'] = cookies['rur'].strip('\"').encode('utf-8').decode('unicode_escape')
+            else:
+                cookies.pop('rur', None)
+
+        # Remove headers specific to Desktop version
+        for header in ['Host', 'Origin', 'X-Instagram-AJAX', 'X-Requested-With', 'Referer']:
+            headers.pop(header, None)
+
+        # No need for cookies if we have a bearer token
+        if 'authorization' not in headers:
+            headers['Cookie'] = self._cookie_header(cookies)
+
+        response_headers = dict()    # type: Dict[str, Any]
+        response = await self.get_json(path, params, 'i.instagram.com', headers, response_headers=response_headers)
+
+        # Extract the ig-set-* headers and use them in the next request
+        for key, value in response_headers.items():
+            if key.startswith('ig-set-'):
+                self.context.iphone_headers[key.replace('ig-set-', '')] = value
+            elif key.startswith('x-ig-set-'):
+                self.context.iphone_headers[key.replace('x-ig-set-', 'x-ig-')] = value
+
+        return response
+
+    @staticmethod
+    def _raise_for_raw_status(resp: httpx.Response, url: str) -> NoReturn:
+        if resp.status_code == 403:
+            # suspected invalid URL signature
+            raise QueryReturnedForbiddenException("403 when accessing {}.".format(url))
+        if resp.status_code == 404:
+            # 404 not worth retrying.
+            raise QueryReturnedNotFoundException("404 when accessing {}.".format(url))
+        raise ConnectionException("HTTP error code {}.".format(resp.status_code))
+
+    async def get_raw(self, url: str) -> httpx.Response:
+        """Downloads a file anonymously.
+
+        The returned response is streamed; its body has to be consumed with :meth:`write_raw` or released with
+        :meth:`httpx.Response.aclose`.
+
+        :raises QueryReturnedNotFoundException: When the server responds with a 404.
+        :raises QueryReturnedForbiddenException: When the server responds with a 403.
+        :raises ConnectionException: When download failed."""
+        try:
+            resp = await self._raw_client.send(self._raw_client.build_request('GET', url), stream=True)
+        except httpx.HTTPError as err:
+            raise ConnectionException("Download of {} failed: {}".format(url, err)) from err
+        if resp.status_code == 200:
+            return resp
+        await resp.aclose()
+        self._raise_for_raw_status(resp, url)
+
+    async def write_raw(self, resp: httpx.Response, filename: str) -> None:
+        """Write a streamed response into a file."""
+        self.context.log(filename, end=' ', flush=True)
+        try:
+            with open(filename + '.temp', 'wb') as file:
+                async for chunk in resp.aiter_bytes():
+                    file.write(chunk)
+        except httpx.HTTPError as err:
+            raise ConnectionException("Download to {} failed: {}".format(filename, err)) from err
+        finally:
+            await resp.aclose()
+        os.replace(filename + '.temp', filename)
+
+    async def get_and_write_raw(self, url: str, filename: str) -> None:
+        """Downloads and writes anonymously-requested raw data into a file.
+
+        :raises QueryReturnedNotFoundException: When the server responds with a 404.
+        :raises QueryReturnedForbiddenException: When the server responds with a 403.
+        :raises ConnectionException: When download failed."""
+        await self.write_raw(await self.get_raw(url), filename)
+
+    async def head(self, url: str, allow_redirects: bool = False) -> httpx.Response:
+        """HEAD a URL anonymously.
+
+        :raises QueryReturnedNotFoundException: When the server responds with a 404.
+        :raises QueryReturnedForbiddenException: When the server responds with a 403.
+        :raises ConnectionException: When request failed."""
+        try:
+            resp = await self._raw_client.head(url, follow_redirects=allow_redirects)
+        except httpx.HTTPError as err:
+            raise ConnectionException("HEAD of {} failed: {}".format(url, err)) from err
+        if resp.status_code == 200:
+            return resp
+        self._raise_for_raw_status(resp, url)
@@ -7,12 +7,14 @@ import shutil
 import string
 import sys
 import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
 from contextlib import contextmanager, suppress
 from datetime import datetime, timezone
 from functools import wraps
 from io import BytesIO
 from pathlib import Path
-from typing import Any, Callable, IO, Iterator, List, Optional, Set, Union, cast
+from typing import TYPE_CHECKING, Any, Callable, Dict, IO, Iterator, List, Optional, Set, Tuple, Union, cast
 from urllib.parse import urlparse
 
 import requests
@@ -21,10 +23,16 @@ import urllib3  # type: ignore
 from .exceptions import *
 from .instaloadercontext import InstaloaderContext, RateController
 from .lateststamps import LatestStamps
+from .mediastore import MediaStore
+from .metadatacache import MetadataCache
 from .nodeiterator import NodeIterator, resumable_iteration
 from .sectioniterator import SectionIterator
-from .structures import (Hashtag, Highlight, JsonExportable, Post, PostLocation, Profile, Story, StoryItem,
-                         load_structure_from_file, save_structure_to_file, PostSidecarNode, TitlePic)
+from .structures import (JSON_SERIALIZERS, Hashtag, Highlight, JsonExportable, Post, PostLocation, Profile, Story,
+                         StoryItem, load_structure_from_file, save_structure_to_file, PostSidecarNode, TitlePic,
+                         zstandard)
+
+if TYPE_CHECKING:
+    from .asyncinstaloadercontext import AsyncInstaloaderContext
 
 
 def _get_config_dir() -> str:
@@ -105,8 +113,11 @@ def _retry_on_connection_error(func: Callable) -> Callable:
                     kwargs['_attempt'] += 1
                 else:
                     kwargs['_attempt'] = 2
-                instaloader.context.do_sleep()
-                return call(instaloader, *args, **kwargs)
+                with instaloader._skippable_retry() as skip:
+                    instaloader.context.do_sleep(interrupt=skip)
+                    if skip is not None and skip.is_set():
+                        raise KeyboardInterrupt
+                    return call(instaloader, *args, **kwargs)
             except KeyboardInterrupt:
                 instaloader.context.error("[skipped by user]", repeat_at_end=False)
                 raise ConnectionException(error_string) from None
@@ -202,6 +213,17 @@ class Instaloader:
     :param fatal_status_codes: :option:`--abort-on`
     :param iphone_support: not :option:`--no-iphone`
     :param sanitize_paths: :option:`--sanitize-paths`
+    :param anonymous_pool_size: Number of keep-alive connections per host kept for anonymous media downloads
+    :param anonymous_pool_idle_timeout: Seconds after which an unused media download connection pool is discarded
+    :param media_store: :class:`MediaStore` to deduplicate downloaded media in, or None
+    :param metadata_cache: :class:`MetadataCache` to look up Post metadata in before querying it, or None
+    :param json_serializer: 'json', or 'orjson' to write and read metadata JSON files with orjson if it is installed,
+       e.g. with the ``orjson`` extra
+    :param zstd_level: Zstandard compression level to compress metadata JSON files with instead of LZMA, or None.
+       Requires the zstandard package, e.g. with the ``zstd`` extra. The files are named '.json.zst' then.
+    :param sidecar_workers: Number of threads that download the media of a sidecar post concurrently, 1 to download
+       them one after another
+    :param prefetch_pages: Whether to query the next page of posts in the background while downloading the current one
 
     .. attribute:: context
 
@@ -234,7 +256,15 @@ class Instaloader:
                  iphone_support: bool = True,
                  title_pattern: Optional[str] = None,
                  proxies=None,
-                 sanitize_paths: bool = False):
+                 sanitize_paths: bool = False,
+                 anonymous_pool_size: int = 10,
+                 anonymous_pool_idle_timeout: float = 60.0,
+                 media_store: Optional[MediaStore] = None,
+                 metadata_cache: Optional[MetadataCache] = None,
+                 prefetch_pages: bool = False,
+                 json_serializer: str = 'json',
+                 zstd_level: Optional[int] = None,
+                 sidecar_workers: int = 4):
         if proxies:
             self.context = InstaloaderContext(sleep, quiet, user_agent, max_connection_attempts,
                                               request_timeout, rate_controller, fatal_status_codes,
@@ -242,7 +272,9 @@ class Instaloader:
 
         self.context = InstaloaderContext(sleep, quiet, user_agent, max_connection_attempts,
                                           request_timeout, rate_controller, fatal_status_codes,
-                                          iphone_support)
+                                          iphone_support, anonymous_pool_size=anonymous_pool_size,
+                                          anonymous_pool_idle_timeout=anonymous_pool_idle_timeout,
+                                          metadata_cache=metadata_cache, prefetch_pages=prefetch_pages)
 
         # configuration parameters
         self.dirname_pattern = dirname_pattern or "{target}"
@@ -263,12 +295,24 @@ class Instaloader:
         self.download_comments = download_comments
         self.save_metadata = save_metadata
         self.compress_json = compress_json
+        if json_serializer not in JSON_SERIALIZERS:
+            raise InvalidArgumentException("Unknown JSON serializer {}.".format(json_serializer))
+        if zstd_level is not None and zstandard is None:
+            raise InvalidArgumentException("zstd_level requires the zstandard package, "
+                                           "'pip install instaloader[zstd]'.")
+        self.json_serializer = json_serializer
+        self.zstd_level = zstd_level
+        self.sidecar_workers = max(1, sidecar_workers)
+        # Events by thread that skip the retry running in a worker thread, see _skippable_retry()
+        self._retry_skips: Dict[int, threading.Event] = {}
+        self._retry_skips_lock = threading.Lock()
         self.post_metadata_txt_pattern = '{caption}' if post_metadata_txt_pattern is None \
             else post_metadata_txt_pattern
         self.storyitem_metadata_txt_pattern = '' if storyitem_metadata_txt_pattern is None \
             else storyitem_metadata_txt_pattern
         self.resume_prefix = resume_prefix
         self.check_resume_bbd = check_resume_bbd
+        self.media_store = media_store
 
         self.slide = slide or ""
         self.slide_start = 0
@@ -320,7 +364,15 @@ class Instaloader:
             slide=self.slide,
             fatal_status_codes=self.context.fatal_status_codes,
             iphone_support=self.context.iphone_support,
-            sanitize_paths=self.sanitize_paths)
+            sanitize_paths=self.sanitize_paths,
+            anonymous_pool_size=self.context.anonymous_pool_size,
+            anonymous_pool_idle_timeout=self.context.anonymous_pool_idle_timeout,
+            media_store=self.media_store,
+            metadata_cache=self.context.metadata_cache,
+            prefetch_pages=self.context.prefetch_pages,
+            json_serializer=self.json_serializer,
+            zstd_level=self.zstd_level,
+            sidecar_workers=self.sidecar_workers)
         yield new_loader
         self.context.error_log.extend(new_loader.context.error_log)
         new_loader.context.error_log = []  # avoid double-printing of errors
@@ -336,6 +388,20 @@ class Instaloader:
     def __exit__(self, *args):
         self.close()
 
+    @staticmethod
+    def _nominal_pic_filename(filename: str, url: str) -> str:
+        urlmatch = re.search('\\.[a-z0-9]*\\?', url)
+        file_extension = url[-3:] if urlmatch is None else urlmatch.group(0)[1:-1]
+        return filename + '.' + file_extension
+
+    @staticmethod
+    def _header_pic_filename(filename: str, nominal_filename: str, content_type: Optional[str]) -> str:
+        if content_type:
+            header_extension = '.' + content_type.split(';')[0].split('/')[-1]
+            header_extension = header_extension.lower().replace('jpeg', 'jpg')
+            return filename + header_extension
+        return nominal_filename
+
     @_retry_on_connection_error
     def download_pic(self, filename: str, url: str, mtime: datetime,
                      filename_suffix: Optional[str] = None, _attempt: int = 1) -> bool:
@@ -343,34 +409,88 @@ class Instaloader:
         Returns true, if file was actually downloaded, i.e. updated."""
         if filename_suffix is not None:
             filename += '_' + filename_suffix
-        urlmatch = re.search('\\.[a-z0-9]*\\?', url)
-        file_extension = url[-3:] if urlmatch is None else urlmatch.group(0)[1:-1]
-        nominal_filename = filename + '.' + file_extension
+        nominal_filename = self._nominal_pic_filename(filename, url)
         if os.path.isfile(nominal_filename):
             self.context.log(nominal_filename + ' exists', end=' ', flush=True)
             return False
+        stored = self._link_from_media_store(filename, url, mtime)
+        if stored is not None:
+            return stored
         resp = self.context.get_raw(url)
-        if 'Content-Type' in resp.headers and resp.headers['Content-Type']:
-            header_extension = '.' + resp.headers['Content-Type'].split(';')[0].split('/')[-1]
-            header_extension = header_extension.lower().replace('jpeg', 'jpg')
-            filename += header_extension
-        else:
-            filename = nominal_filename
+        filename = self._header_pic_filename(filename, nominal_filename, resp.headers.get('Content-Type'))
         if filename != nominal_filename and os.path.isfile(filename):
+            resp.close()
             self.context.log(filename + ' exists', end=' ', flush=True)
             return False
         self.context.write_raw(resp, filename)
         os.utime(filename, (datetime.now().timestamp(), mtime.timestamp()))
+        if self.media_store is not None:
+            self.media_store.add(url, filename)
+        return True
+
+    def _link_from_media_store(self, filename: str, url: str, mtime: datetime) -> Optional[bool]:
+        """Link the media behind url into place from :attr:`media_store`, if it has been downloaded before.
+
+        :return: None if the media is not in the store, otherwise whether a file was created, i.e. False if it
+           existed already."""
+        if self.media_store is None:
+            return None
+        try:
+            stored_filename = self.media_store.link_into_place(url, filename, mtime.timestamp())
+        except FileExistsError as err:
+            self.context.log(err.filename + ' exists', end=' ', flush=True)
+            return False
+        if stored_filename is None:
+            return None
+        self.context.log(stored_filename + ' (stored)', end=' ', flush=True)
+        return True
+
+    async def download_pic_async(self, async_context: 'AsyncInstaloaderContext', filename: str, url: str,
+                                 mtime: datetime, filename_suffix: Optional[str] = None) -> bool:
+        """Awaitable variant of :meth:`download_pic`, downloading with the given :class:`AsyncInstaloaderContext`.
+
+        .. versionadded:: 4.11"""
+        if filename_suffix is not None:
+            filename += '_' + filename_suffix
+        nominal_filename = self._nominal_pic_filename(filename, url)
+        if os.path.isfile(nominal_filename):
+            self.context.log(nominal_filename + ' exists', end=' ', flush=True)
+            return False
+        stored = self._link_from_media_store(filename, url, mtime)
+        if stored is not None:
+            return stored
+        attempt = 1
+        while True:
+            try:
+                resp = await async_context.get_raw(url)
+                target_filename = self._header_pic_filename(filename, nominal_filename,
+                                                            resp.headers.get('Content-Type'))
+                if target_filename != nominal_filename and os.path.isfile(target_filename):
+                    await resp.aclose()
+                    self.context.log(target_filename + ' exists', end=' ', flush=True)
+                    return False
+                await async_context.write_raw(resp, target_filename)
+                break
+            except ConnectionException as err:
+                error_string = "download_pic_async({!r}, {!r}): {}".format(filename, url, err)
+                if attempt == self.context.max_connection_attempts:
+                    raise ConnectionException(error_string) from None
+                self.context.error(error_string + " [retrying]", repeat_at_end=False)
+                attempt += 1
+                await async_context.do_sleep()
+        os.utime(target_filename, (datetime.now().timestamp(), mtime.timestamp()))
+        if self.media_store is not None:
+            self.media_store.add(url, target_filename)
         return True
 
     def save_metadata_json(self, filename: str, structure: JsonExportable) -> None:
         """Saves metadata JSON file of a structure."""
         if self.compress_json:
-            filename += '.json.xz'
+            filename += '.json.zst' if self.zstd_level is not None else '.json.xz'
         else:
             filename += '.json'
         os.makedirs(os.path.dirname(filename), exist_ok=True)
-        save_structure_to_file(structure, filename)
+        save_structure_to_file(structure, filename, self.json_serializer, self.zstd_level)
         if isinstance(structure, (Post, StoryItem)):
             # log 'json ' message when saving Post or StoryItem
             self.context.log('json', end=' ', flush=True)
@@ -433,7 +553,7 @@ class Instaloader:
             with resumable_iteration(
                     context=self.context,
                     iterator=comments_iterator,
-                    load=load_structure_from_file,
+                    load=lambda context, path: load_structure_from_file(context, path, self.json_serializer),
                     save=save_structure_to_file,
                     format_path=lambda magic: "{}_{}_{}.json.xz".format(base_filename, self.resume_prefix, magic),
                     check_bbd=self.check_resume_bbd,
@@ -548,6 +668,7 @@ class Instaloader:
         if os.path.isfile(filename) and (not self.context.is_logged_in or
                                          (content_length is not None and
                                           os.path.getsize(filename) >= int(content_length))):
+            http_response.close()
             self.context.log(filename + ' already exists')
             return
         os.makedirs(os.path.dirname(filename), exist_ok=True)
@@ -686,6 +807,55 @@ class Instaloader:
         .. versionadded:: 4.1"""
         return _PostPathFormatter(item, self.sanitize_paths).format(self.filename_pattern, target=target)
 
+    @contextmanager
+    def _skippable_retry(self):
+        """Context of a retry in :func:`_retry_on_connection_error`, which yields None on the main thread, where ^C
+        raises KeyboardInterrupt. In a worker thread, it yields an event that :meth:`_download_sidecar_pics` sets to
+        skip the retry when the main thread receives ^C. Nested retries of a thread share its event."""
+        if threading.current_thread() is threading.main_thread():
+            yield None
+            return
+        ident = threading.get_ident()
+        with self._retry_skips_lock:
+            outermost = ident not in self._retry_skips
+            skip = self._retry_skips.setdefault(ident, threading.Event())
+        try:
+            yield skip
+        finally:
+            if outermost:
+                with self._retry_skips_lock:
+                    del self._retry_skips[ident]
+
+    def _download_sidecar_pics(self, downloads: List[Tuple[str, str, Optional[str]]], mtime: datetime) -> List[bool]:
+        """Download the (filename, url, filename_suffix) media of a sidecar with :meth:`download_pic`, up to
+        :attr:`sidecar_workers` at once. Media are fetched from the CDN, which is not rate controlled.
+
+        As without threads, ^C while downloads are being retried skips just those, and otherwise stops the post. A
+        failed download does not keep the other media from being downloaded, its error is raised afterwards."""
+        if self.sidecar_workers == 1 or len(downloads) <= 1:
+            return [self.download_pic(filename=filename, url=url, mtime=mtime, filename_suffix=suffix)
+                    for filename, url, suffix in downloads]
+        with ThreadPoolExecutor(max_workers=min(self.sidecar_workers, len(downloads)),
+                                thread_name_prefix="sidecar") as executor:
+            futures = [executor.submit(self.download_pic, filename=filename, url=url, mtime=mtime,
+                                       filename_suffix=suffix)
+                       for filename, url, suffix in downloads]
+            while True:
+                try:
+                    wait(futures)
+                    break
+                except KeyboardInterrupt:
+                    with self._retry_skips_lock:
+                        skips = list(self._retry_skips.values())
+                    if not skips:
+                        # Do not start the remaining downloads
+                        for future in futures:
+                            future.cancel()
+                        raise
+                    for skip in skips:
+                        skip.set()
+        return [future.result() for future in futures]
+
     def download_post(self, post: Post, target: Union[str, Path]) -> bool:
         """
         Download everything associated with one instagram post node, i.e. picture, caption and video.
@@ -731,6 +901,8 @@ class Instaloader:
                             start=self.slide_start % post.mediacount + 1
                         )
                 ):
+                    # Collect the media first, so that they can be downloaded concurrently
+                    sidecar_downloads = []
                     for edge_number, sidecar_node in enumerate(
                             post.get_sidecar_nodes(self.slide_start, self.slide_end),
                             start=self.slide_start % post.mediacount + 1
@@ -743,15 +915,15 @@ class Instaloader:
                             sidecar_filename = self.__prepare_filename(filename_template,
                                                                        lambda: sidecar_node.display_url)
                             # Download sidecar picture or video thumbnail (--no-pictures implies --no-video-thumbnails)
-                            downloaded &= self.download_pic(filename=sidecar_filename, url=sidecar_node.display_url,
-                                                            mtime=post.date_local, filename_suffix=suffix)
+                            sidecar_downloads.append((sidecar_filename, sidecar_node.display_url, suffix))
                         if sidecar_node.is_video and self.download_videos:
                             # pylint:disable=cell-var-from-loop
                             sidecar_filename = self.__prepare_filename(filename_template,
                                                                        lambda: sidecar_node.video_url)
                             # Download sidecar video if desired
-                            downloaded &= self.download_pic(filename=sidecar_filename, url=sidecar_node.video_url,
-                                                            mtime=post.date_local, filename_suffix=suffix)
+                            sidecar_downloads.append((sidecar_filename, sidecar_node.video_url, suffix))
+                    for sidecar_downloaded in self._download_sidecar_pics(sidecar_downloads, post.date_local):
+                        downloaded &= sidecar_downloaded
                 else:
                     downloaded = False
         elif post.typename == 'GraphImage':
@@ -1034,7 +1206,7 @@ class Instaloader:
         with resumable_iteration(
                 context=self.context,
                 iterator=posts,
-                load=load_structure_from_file,
+                load=lambda context, path: load_structure_from_file(context, path, self.json_serializer),
                 save=save_structure_to_file,
                 format_path=lambda magic: self.format_filename_within_target_path(
                     sanitized_target, owner_profile, self.resume_prefix or '', magic, 'json.xz'
@@ -1042,46 +1214,51 @@ class Instaloader:
                 check_bbd=self.check_resume_bbd,
                 enabled=self.resume_prefix is not None
         ) as (is_resuming, start_index):
-            for number, post in enumerate(posts, start=start_index + 1):
-                should_stop = not takewhile(post)
-                if should_stop and number <= possibly_pinned:
-                    continue
-                if (max_count is not None and number > max_count) or should_stop:
-                    break
-                if displayed_count is not None:
-                    self.context.log("[{0:{w}d}/{1:{w}d}] ".format(number, displayed_count,
-                                                                   w=len(str(displayed_count))),
-                                     end="", flush=True)
-                else:
-                    self.context.log("[{:3d}] ".format(number), end="", flush=True)
-                if post_filter is not None:
-                    try:
-                        if not post_filter(post):
-                            self.context.log("{} skipped".format(post))
-                            continue
-                    except (InstaloaderException, KeyError, TypeError) as err:
-                        self.context.error("{} skipped. Filter evaluation failed: {}".format(post, err))
+            try:
+                for number, post in enumerate(posts, start=start_index + 1):
+                    should_stop = not takewhile(post)
+                    if should_stop and number <= possibly_pinned:
                         continue
-                with self.context.error_catcher("Download {} of {}".format(post, target)):
-                    # The PostChangedException gets raised if the Post's id/shortcode changed while obtaining
-                    # additional metadata. This is most likely the case if a HTTP redirect takes place while
-                    # resolving the shortcode URL.
-                    # The `post_changed` variable keeps the fast-update functionality alive: A Post which is
-                    # obained after a redirect has probably already been downloaded as a previous Post of the
-                    # same Profile.
-                    # Observed in issue #225: https://github.com/instaloader/instaloader/issues/225
-                    post_changed = False
-                    while True:
+                    if (max_count is not None and number > max_count) or should_stop:
+                        break
+                    if displayed_count is not None:
+                        self.context.log("[{0:{w}d}/{1:{w}d}] ".format(number, displayed_count,
+                                                                       w=len(str(displayed_count))),
+                                         end="", flush=True)
+                    else:
+                        self.context.log("[{:3d}] ".format(number), end="", flush=True)
+                    if post_filter is not None:
                         try:
-                            downloaded = self.download_post(post, target=target)
-                            break
-                        except PostChangedException:
-                            post_changed = True
+                            if not post_filter(post):
+                                self.context.log("{} skipped".format(post))
+                                continue
+                        except (InstaloaderException, KeyError, TypeError) as err:
+                            self.context.error("{} skipped. Filter evaluation failed: {}".format(post, err))
                             continue
-                    if fast_update and not downloaded and not post_changed and number > possibly_pinned:
-                        # disengage fast_update for first post when resuming
-                        if not is_resuming or number > 0:
-                            break
+                    with self.context.error_catcher("Download {} of {}".format(post, target)):
+                        # The PostChangedException gets raised if the Post's id/shortcode changed while obtaining
+                        # additional metadata. This is most likely the case if a HTTP redirect takes place while
+                        # resolving the shortcode URL.
+                        # The `post_changed` variable keeps the fast-update functionality alive: A Post which is
+                        # obained after a redirect has probably already been downloaded as a previous Post of the
+                        # same Profile.
+                        # Observed in issue #225: https://github.com/instaloader/instaloader/issues/225
+                        post_changed = False
+                        while True:
+                            try:
+                                downloaded = self.download_post(post, target=target)
+                                break
+                            except PostChangedException:
+                                post_changed = True
+                                continue
+                        if fast_update and not downloaded and not post_changed and number > possibly_pinned:
+                            # disengage fast_update for first post when resuming
+                            if not is_resuming or number > 0:
+                                break
+            finally:
+                # Do not prefetch pages the loop stopped before, e.g. due to max_count or takewhile
+                if isinstance(posts, (NodeIterator, SectionIterator)):
+                    posts.close()
 
     @_requires_login
     def get_feed_posts(self) -> Iterator[Post]:
@@ -1147,7 +1324,7 @@ class Instaloader:
                                  max_count=max_count, total_count=node_iterator.count)
 
     @_requires_login
-    def get_location_posts(self, location: str) -> Iterator[Post]:
+    def get_location_posts(self, location: str) -> SectionIterator[Post]:
         """Get Posts which are listed by Instagram for a given Location.
 
         :return:  Iterator over Posts of a location's posts
@@ -1157,8 +1334,12 @@ class Instaloader:
 
         .. versionchanged:: 4.2.9
            Require being logged in (as required by Instagram)
+
+        .. versionchanged:: 4.11
+           Return the :class:`SectionIterator`, so that :meth:`download_location` can resume. As before, the first
+           page is only queried when the first Post is requested.
         """
-        yield from SectionIterator(
+        return SectionIterator(
             self.context,
             lambda d: d["native_location_data"]["recent"],
             lambda m: Post.from_iphone_struct(self.context, m),
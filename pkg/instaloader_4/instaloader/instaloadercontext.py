@@ -1,3 +1,4 @@
+import asyncio
 import hashlib
 import json
 import os
@@ -6,21 +7,30 @@ import random
 import shutil
 import sys
 import textwrap
+import threading
 import time
 import urllib.parse
 import uuid
+from collections import deque
 from contextlib import contextmanager
 from datetime import datetime, timedelta
 from functools import partial
-from typing import Any, Callable, Dict, Iterator, List, Optional, Union
+from typing import Any, Callable, Deque, Dict, Iterator, List, Optional, Union
 
 import requests
+import requests.adapters
 import requests.utils
 
 from .exceptions import *
+from .metadatacache import MetadataCache
 import urllib3
 
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+
+# Proxy that all JSON queries to Instagram are routed through
+JSON_QUERY_PROXY_URL = "http://85e4a54f6f2440b090fffdd4cf10855a25cbf49d53e:@proxy.scrape.do:8080"
+
+
 def copy_session(session: requests.Session, request_timeout: Optional[float] = None) -> requests.Session:
     """Duplicates a requests.Session."""
     new = requests.Session()
@@ -84,7 +94,9 @@ class InstaloaderContext:
                  max_connection_attempts: int = 3, request_timeout: float = 300.0,
                  rate_controller: Optional[Callable[["InstaloaderContext"], "RateController"]] = None,
                  fatal_status_codes: Optional[List[int]] = None,
-                 iphone_support: bool = True, proxies: Optional[Dict[str, str]] = None):
+                 iphone_support: bool = True, proxies: Optional[Dict[str, str]] = None,
+                 anonymous_pool_size: int = 10, anonymous_pool_idle_timeout: float = 60.0,
+                 metadata_cache: Optional[MetadataCache] = None, prefetch_pages: bool = False):
 
         self.user_agent = user_agent if user_agent is not None else default_user_agent()
         self.request_timeout = request_timeout
@@ -114,6 +126,22 @@ class InstaloaderContext:
         # Cache profile from id (mapping from id to Profile)
         self.profile_id_cache: Dict[int, Any] = dict()
 
+        # Persistent cache of Post metadata by shortcode, may be shared by several contexts
+        self.metadata_cache = metadata_cache
+
+        # Whether NodeIterators query the next page in the background while the current one is consumed
+        self.prefetch_pages = prefetch_pages
+
+        # Response time of the last JSON query, per thread, see last_response_elapsed
+        self._response_elapsed = threading.local()
+
+        # Long-lived anonymous session for media downloads, see _get_pooled_anonymous_session()
+        self.anonymous_pool_size = anonymous_pool_size
+        self.anonymous_pool_idle_timeout = anonymous_pool_idle_timeout
+        self._pooled_anonymous_session: Optional[requests.Session] = None
+        self._pooled_anonymous_session_last_used = 0.0
+        self._pooled_anonymous_session_lock = threading.Lock()
+
     @contextmanager
     def anonymous_copy(self):
         session = self._session
@@ -138,6 +166,15 @@ class InstaloaderContext:
         """True, if this Instaloader instance is logged in."""
         return bool(self.username)
 
+    @property
+    def last_response_elapsed(self) -> Optional[float]:
+        """Seconds Instagram took to respond to the last JSON query of the calling thread, or None.
+
+        This excludes sleeping and waiting for the rate controller.
+
+        .. versionadded:: 4.11"""
+        return getattr(self._response_elapsed, 'value', None)
+
     def log(self, *msg, sep='', end='\n', flush=False):
         """Log a message to stdout that can be suppressed with --quiet."""
         if not self.quiet:
@@ -160,6 +197,10 @@ class InstaloaderContext:
             for err in self.error_log:
                 print(err, file=sys.stderr)
         self._session.close()
+        with self._pooled_anonymous_session_lock:
+            if self._pooled_anonymous_session is not None:
+                self._pooled_anonymous_session.close()
+                self._pooled_anonymous_session = None
 
     @contextmanager
     def error_catcher(self, extra_info: Optional[str] = None):
@@ -210,6 +251,31 @@ class InstaloaderContext:
             session.proxies.update(proxies)
         return session
 
+    def _get_pooled_anonymous_session(self) -> requests.Session:
+        """Returns the long-lived anonymous session used by :meth:`get_raw` and :meth:`head`.
+
+        It keeps up to :attr:`anonymous_pool_size` keep-alive connections per host, so that consecutive media
+        downloads from the same CDN host do not pay a new TCP and TLS handshake each. The session is replaced by a
+        new one if it has not been used for :attr:`anonymous_pool_idle_timeout` seconds, as idle connections are
+        likely to have been closed by the server meanwhile. The old session is not closed, as other threads may still
+        be streaming a response from it; its connections are released when it is garbage-collected."""
+        with self._pooled_anonymous_session_lock:
+            now = time.monotonic()
+            if (self._pooled_anonymous_session is not None and
+                    now - self._pooled_anonymous_session_last_used > self.anonymous_pool_idle_timeout):
+                self._pooled_anonymous_session = None
+            if self._pooled_anonymous_session is None:
+                session = self.get_anonymous_session()
+                # Not blocking when the pool is exhausted: further connections are opened and discarded after use,
+                # so that a response that is never closed cannot stall later downloads
+                adapter = requests.adapters.HTTPAdapter(pool_connections=self.anonymous_pool_size,
+                                                        pool_maxsize=self.anonymous_pool_size)
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                self._pooled_anonymous_session = session
+            self._pooled_anonymous_session_last_used = now
+            return self._pooled_anonymous_session
+
     def save_session(self):
         """Not meant to be used directly, use :meth:`Instaloader.save_session`."""
         return requests.utils.dict_from_cookiejar(self._session.cookies)
@@ -350,10 +416,18 @@ class InstaloaderContext:
         self.username = user
         self.two_factor_auth_pending = None
 
-    def do_sleep(self):
-        """Sleep a short time if self.sleep is set. Called before each request to instagram.com."""
+    def do_sleep(self, interrupt: Optional[threading.Event] = None):
+        """Sleep a short time if self.sleep is set. Called before each request to instagram.com.
+
+        :param interrupt: Event that ends the sleep early when it is set.
+
+        .. versionchanged:: 4.11
+           Add ``interrupt``."""
         if self.sleep:
-            time.sleep(min(random.expovariate(0.6), 15.0))
+            if interrupt is not None:
+                interrupt.wait(min(random.expovariate(0.6), 15.0))
+            else:
+                time.sleep(min(random.expovariate(0.6), 15.0))
 
     def get_json(self, path: str, params: Dict[str, Any], host: str = 'www.instagram.com',
                  session: Optional[requests.Session] = None, _attempt=1,
@@ -374,10 +448,9 @@ class InstaloaderContext:
         is_other_query = not is_graphql_query and host == "www.instagram.com"
         sess = session if session else self._session
 
-        proxy_url = "http://85e4a54f6f2440b090fffdd4cf10855a25cbf49d53e:@proxy.scrape.do:8080"
         proxies = {
-            "http": proxy_url,
-            "https": proxy_url,
+            "http": JSON_QUERY_PROXY_URL,
+            "https": JSON_QUERY_PROXY_URL,
         }
 
         sess.proxies.update(proxies)
@@ -393,6 +466,7 @@ class InstaloaderContext:
             if is_other_query:
                 self._rate_controller.wait_before_query('other')
             resp = sess.get('https://{0}/{1}'.format(host, path), params=params, allow_redirects=False, verify=False)
+            self._response_elapsed.value = resp.elapsed.total_seconds()
             if resp.status_code in self.fatal_status_codes:
                 redirect = " redirect to {}".format(resp.headers['location']) if 'location' in resp.headers else ""
                 body = ""
@@ -601,7 +675,11 @@ class InstaloaderContext:
         self.log(filename, end=' ', flush=True)
         with open(filename + '.temp', 'wb') as file:
             if isinstance(resp, requests.Response):
-                shutil.copyfileobj(resp.raw, file)
+                try:
+                    shutil.copyfileobj(resp.raw, file)
+                finally:
+                    # Return the connection to the pool, also if the download broke off
+                    resp.close()
             else:
                 file.write(resp)
         os.replace(filename + '.temp', filename)
@@ -614,12 +692,13 @@ class InstaloaderContext:
         :raises ConnectionException: When download failed.
 
         .. versionadded:: 4.2.1"""
-        with self.get_anonymous_session() as anonymous_session:
-            resp = anonymous_session.get(url, stream=True)
+        resp = self._get_pooled_anonymous_session().get(url, stream=True)
         if resp.status_code == 200:
             resp.raw.decode_content = True
             return resp
         else:
+            # The body of a streamed response is not read, so release its connection explicitly
+            resp.close()
             if resp.status_code == 403:
                 # suspected invalid URL signature
                 raise QueryReturnedForbiddenException("403 when accessing {}.".format(url))
@@ -645,8 +724,7 @@ class InstaloaderContext:
 
         .. versionadded:: 4.7.6
         """
-        with self.get_anonymous_session() as anonymous_session:
-            resp = anonymous_session.head(url, allow_redirects=allow_redirects)
+        resp = self._get_pooled_anonymous_session().head(url, allow_redirects=allow_redirects)
         if resp.status_code == 200:
             return resp
         else:
@@ -670,6 +748,39 @@ class InstaloaderContext:
         return self._root_rhx_gis or None
 
 
+class _SlidingWindow:
+    """Timestamps of the requests within the last *length* seconds, oldest first.
+
+    Timestamps are added in ascending order, so expired ones are always at the left end and counting the requests in
+    the window or finding the oldest one is amortized O(1).
+
+    Expiry is destructive: timestamps that have left the window ending at some current_time are dropped. Thus
+    current_time must not decrease between calls, as with the monotonic clock of :class:`RateController`; if it does,
+    e.g. because a wall clock was stepped back, the dropped history is lost for good."""
+
+    def __init__(self, length: float):
+        self.length = length
+        self._timestamps: Deque[float] = deque()
+
+    def add(self, timestamp: float) -> None:
+        self._timestamps.append(timestamp)
+
+    def _expire(self, current_time: float) -> None:
+        timestamps = self._timestamps
+        while timestamps and timestamps[0] <= current_time - self.length:
+            timestamps.popleft()
+
+    def count(self, current_time: float) -> int:
+        """Number of requests within the window ending at current_time."""
+        self._expire(current_time)
+        return len(self._timestamps)
+
+    def oldest(self, current_time: float) -> float:
+        """Time of the oldest request within the window ending at current_time, or current_time if there is none."""
+        self._expire(current_time)
+        return self._timestamps[0] if self._timestamps else current_time
+
+
 class RateController:
     """
     Class providing request tracking and rate controlling to stay within rate limits.
@@ -684,13 +795,22 @@ class RateController:
                raise MyCustomException()
 
        L = instaloader.Instaloader(rate_controller=lambda ctx: MyRateController(ctx))
+
+    A single RateController may be shared by several contexts that are used from different threads or coroutines;
+    the request bookkeeping is guarded by a lock, so that concurrent workers account against one common budget.
     """
 
     def __init__(self, context: InstaloaderContext):
         self._context = context
-        self._query_timestamps: Dict[str, List[float]] = dict()
+        # Timestamps of the last hour by query type, for _dump_query_timestamps()
+        self._query_timestamps: Dict[str, Deque[float]] = dict()
+        # Sliding windows checked by query_waittime(), updated incrementally as queries are recorded
+        self._per_type_windows: Dict[str, _SlidingWindow] = dict()
+        self._iphone_window = _SlidingWindow(1800)
+        self._graphql_window = _SlidingWindow(600)
         self._earliest_next_request_time = 0.0
         self._iphone_earliest_next_request_time = 0.0
+        self._lock = threading.RLock()
 
     def sleep(self, secs: float):
         """Wait given number of seconds."""
@@ -698,6 +818,10 @@ class RateController:
         # whether we are logged in.
         time.sleep(secs)
 
+    def _current_time(self) -> float:
+        """Clock that query timestamps are taken from."""
+        return time.monotonic()
+
     def _dump_query_timestamps(self, current_time: float, failed_query_type: str):
         windows = [10, 11, 20, 22, 30, 60]
         self._context.error("Number of requests within last {} minutes grouped by type:"
@@ -721,61 +845,59 @@ class RateController:
         # whether we are logged in.
         return 75 if query_type == 'other' else 200
 
-    def _reqs_in_sliding_window(self, query_type: Optional[str], current_time: float, window: float) -> List[float]:
-        if query_type is not None:
-            # timestamps of type query_type
-            relevant_timestamps = self._query_timestamps[query_type]
-        else:
+    def _per_type_window(self, query_type: str) -> _SlidingWindow:
+        if query_type not in self._per_type_windows:
+            self._per_type_windows[query_type] = _SlidingWindow(660)
+            self._query_timestamps[query_type] = deque()
+        return self._per_type_windows[query_type]
+
+    def _record_query(self, query_type: str, current_time: float) -> None:
+        self._per_type_window(query_type).add(current_time)
+        if query_type == 'iphone':
+            self._iphone_window.add(current_time)
+        elif query_type != 'other':
             # all GraphQL queries, i.e. not 'iphone' or 'other'
-            graphql_query_timestamps = filter(lambda tp: tp[0] not in ['iphone', 'other'],
-                                              self._query_timestamps.items())
-            relevant_timestamps = [t for times in (tp[1] for tp in graphql_query_timestamps) for t in times]
-        return list(filter(lambda t: t > current_time - window, relevant_timestamps))
+            self._graphql_window.add(current_time)
+        history = self._query_timestamps[query_type]
+        history.append(current_time)
+        while history[0] <= current_time - 60 * 60:
+            history.popleft()
 
     def query_waittime(self, query_type: str, current_time: float, untracked_queries: bool = False) -> float:
         """Calculate time needed to wait before query can be executed."""
         per_type_sliding_window = 660
         iphone_sliding_window = 1800
-        if query_type not in self._query_timestamps:
-            self._query_timestamps[query_type] = []
-        self._query_timestamps[query_type] = list(filter(lambda t: t > current_time - 60 * 60,
-                                                         self._query_timestamps[query_type]))
+        per_type_window = self._per_type_window(query_type)
 
         def per_type_next_request_time():
-            reqs_in_sliding_window = self._reqs_in_sliding_window(query_type, current_time, per_type_sliding_window)
-            if len(reqs_in_sliding_window) < self.count_per_sliding_window(query_type):
+            if per_type_window.count(current_time) < self.count_per_sliding_window(query_type):
                 return 0.0
             else:
-                return min(reqs_in_sliding_window) + per_type_sliding_window + 6
+                return per_type_window.oldest(current_time) + per_type_sliding_window + 6
 
         def gql_accumulated_next_request_time():
             if query_type in ['iphone', 'other']:
                 return 0.0
-            gql_accumulated_sliding_window = 600
             gql_accumulated_max_count = 275
-            reqs_in_sliding_window = self._reqs_in_sliding_window(None, current_time, gql_accumulated_sliding_window)
-            if len(reqs_in_sliding_window) < gql_accumulated_max_count:
+            if self._graphql_window.count(current_time) < gql_accumulated_max_count:
                 return 0.0
             else:
-                return min(reqs_in_sliding_window) + gql_accumulated_sliding_window
+                return self._graphql_window.oldest(current_time) + self._graphql_window.length
 
         def untracked_next_request_time():
             if untracked_queries:
                 if query_type == "iphone":
-                    reqs_in_sliding_window = self._reqs_in_sliding_window(query_type, current_time,
-                                                                          iphone_sliding_window)
-                    self._iphone_earliest_next_request_time = min(reqs_in_sliding_window) + iphone_sliding_window + 18
+                    self._iphone_earliest_next_request_time = (self._iphone_window.oldest(current_time) +
+                                                               iphone_sliding_window + 18)
                 else:
-                    reqs_in_sliding_window = self._reqs_in_sliding_window(query_type, current_time,
-                                                                          per_type_sliding_window)
-                    self._earliest_next_request_time = min(reqs_in_sliding_window) + per_type_sliding_window + 6
+                    self._earliest_next_request_time = (per_type_window.oldest(current_time) +
+                                                        per_type_sliding_window + 6)
             return max(self._iphone_earliest_next_request_time, self._earliest_next_request_time)
 
         def iphone_next_request():
             if query_type == "iphone":
-                reqs_in_sliding_window = self._reqs_in_sliding_window(query_type, current_time, iphone_sliding_window)
-                if len(reqs_in_sliding_window) >= 199:
-                    return min(reqs_in_sliding_window) + iphone_sliding_window + 18
+                if self._iphone_window.count(current_time) >= 199:
+                    return self._iphone_window.oldest(current_time) + iphone_sliding_window + 18
             return 0.0
 
         return max(0.0,
@@ -786,34 +908,53 @@ class RateController:
                        iphone_next_request(),
                    ) - current_time)
 
+    def _reserve_query(self, query_type: str) -> float:
+        """Record a query of the given type and return 0.0 if it can be done right away. Otherwise, return the time
+        to wait before trying again, without recording anything."""
+        with self._lock:
+            current_time = self._current_time()
+            waittime = self.query_waittime(query_type, current_time, False)
+            assert waittime >= 0
+            if waittime == 0:
+                self._record_query(query_type, current_time)
+            elif waittime > 15:
+                formatted_waittime = ("{} seconds".format(round(waittime)) if waittime <= 666 else
+                                      "{} minutes".format(round(waittime / 60)))
+                self._context.log("\nToo many queries in the last time. Need to wait {}, until {:%H:%M}."
+                                  .format(formatted_waittime, datetime.now() + timedelta(seconds=waittime)))
+            return waittime
+
     def wait_before_query(self, query_type: str) -> None:
         """This method is called before a query to Instagram.
 
         It calls :meth:`RateController.query_waittime` to determine the time needed to wait and then calls
         :meth:`RateController.sleep` to wait until the request can be made."""
-        waittime = self.query_waittime(query_type, time.monotonic(), False)
-        assert waittime >= 0
-        if waittime > 15:
-            formatted_waittime = ("{} seconds".format(round(waittime)) if waittime <= 666 else
-                                  "{} minutes".format(round(waittime / 60)))
-            self._context.log("\nToo many queries in the last time. Need to wait {}, until {:%H:%M}."
-                              .format(formatted_waittime, datetime.now() + timedelta(seconds=waittime)))
-        if waittime > 0:
+        while (waittime := self._reserve_query(query_type)) > 0:
             self.sleep(waittime)
-        if query_type not in self._query_timestamps:
-            self._query_timestamps[query_type] = [time.monotonic()]
-        else:
-            self._query_timestamps[query_type].append(time.monotonic())
 
-    def handle_429(self, query_type: str) -> None:
-        """This method is called to handle a 429 Too Many Requests response.
+    async def sleep_async(self, secs: float):
+        """Wait given number of seconds without blocking the event loop.
 
-        It calls :meth:`RateController.query_waittime` to determine the time needed to wait and then calls
-        :meth:`RateController.sleep` to wait until we can repeat the same request."""
-        current_time = time.monotonic()
-        waittime = self.query_waittime(query_type, current_time, True)
-        assert waittime >= 0
-        self._dump_query_timestamps(current_time, query_type)
+        .. versionadded:: 4.11"""
+        await asyncio.sleep(secs)
+
+    async def wait_before_query_async(self, query_type: str) -> None:
+        """Awaitable variant of :meth:`RateController.wait_before_query`, used by :class:`AsyncInstaloaderContext`.
+
+        The bookkeeping runs in the default executor, as it may block, e.g. on the database of a
+        :class:`SharedRateController`.
+
+        .. versionadded:: 4.11"""
+        loop = asyncio.get_running_loop()
+        while (waittime := await loop.run_in_executor(None, self._reserve_query, query_type)) > 0:
+            await self.sleep_async(waittime)
+
+    def _handle_429_waittime(self, query_type: str) -> float:
+        with self._lock:
+            current_time = self._current_time()
+            waittime = self.query_waittime(query_type, current_time, True)
+            assert waittime >= 0
+            self._dump_query_timestamps(current_time, query_type)
         text_for_429 = ("Instagram responded with HTTP error \"429 - Too Many Requests\". Please do not run multiple "
                         "instances of Instaloader in parallel or within short sequence. Also, do not use any Instagram "
                         "App while Instaloader is running.")
@@ -824,5 +965,22 @@ class RateController:
             self._context.error("The request will be retried in {}, at {:%H:%M}."
                                 .format(formatted_waittime, datetime.now() + timedelta(seconds=waittime)),
                                 repeat_at_end=False)
+        return waittime
+
+    def handle_429(self, query_type: str) -> None:
+        """This method is called to handle a 429 Too Many Requests response.
+
+        It calls :meth:`RateController.query_waittime` to determine the time needed to wait and then calls
+        :meth:`RateController.sleep` to wait until we can repeat the same request."""
+        waittime = self._handle_429_waittime(query_type)
         if waittime > 0:
             self.sleep(waittime)
+
+    async def handle_429_async(self, query_type: str) -> None:
+        """Awaitable variant of :meth:`RateController.handle_429`. Like :meth:`wait_before_query_async`, it does the
+        bookkeeping in the default executor.
+
+        .. versionadded:: 4.11"""
+        waittime = await asyncio.get_running_loop().run_in_executor(None, self._handle_429_waittime, query_type)
+        if waittime > 0:
+            await self.sleep_async(waittime)
@@ -1,6 +1,8 @@
 import configparser
+import sqlite3
+import threading
 from datetime import datetime, timezone
-from typing import Optional
+from typing import Dict, Optional, Tuple
 from os.path import dirname
 from os import makedirs
 
@@ -24,7 +26,10 @@ class LatestStamps:
     def __init__(self, latest_stamps_file):
         self.file = latest_stamps_file
         self.data = configparser.ConfigParser()
-        self.data.read(latest_stamps_file)
+        self._load()
+
+    def _load(self):
+        self.data.read(self.file)
 
     def _save(self):
         if dn := dirname(self.file):
@@ -36,18 +41,32 @@ class LatestStamps:
         if not self.data.has_section(section):
             self.data.add_section(section)
 
+    def _get_option(self, section: str, option: str) -> Optional[str]:
+        try:
+            return self.data.get(section, option)
+        except configparser.Error:
+            return None
+
+    def _set_option(self, section: str, option: str, value: str):
+        self._ensure_section(section)
+        self.data.set(section, option, value)
+        self._save()
+
+    def close(self):
+        """Writes pending changes. Every change is written immediately, so this does nothing.
+
+        .. versionadded:: 4.11"""
+
     def get_profile_id(self, profile_name: str) -> Optional[int]:
         """Returns stored ID of profile."""
         try:
-            return self.data.getint(profile_name, self.PROFILE_ID)
-        except (configparser.Error, ValueError):
+            return int(self._get_option(profile_name, self.PROFILE_ID))
+        except (TypeError, ValueError):
             return None
 
     def save_profile_id(self, profile_name: str, profile_id: int):
         """Stores ID of profile."""
-        self._ensure_section(profile_name)
-        self.data.set(profile_name, self.PROFILE_ID, str(profile_id))
-        self._save()
+        self._set_option(profile_name, self.PROFILE_ID, str(profile_id))
 
     def rename_profile(self, old_profile: str, new_profile: str):
         """Renames a profile."""
@@ -62,14 +81,12 @@ class LatestStamps:
 
     def _get_timestamp(self, section: str, key: str) -> datetime:
         try:
-            return datetime.strptime(self.data.get(section, key), self.ISO_FORMAT)
-        except (configparser.Error, ValueError):
+            return datetime.strptime(self._get_option(section, key), self.ISO_FORMAT)
+        except (TypeError, ValueError):
             return datetime.fromtimestamp(0, timezone.utc)
 
     def _set_timestamp(self, section: str, key: str, timestamp: datetime):
-        self._ensure_section(section)
-        self.data.set(section, key, timestamp.strftime(self.ISO_FORMAT))
-        self._save()
+        self._set_option(section, key, timestamp.strftime(self.ISO_FORMAT))
 
     def get_last_post_timestamp(self, profile_name: str) -> datetime:
         """Returns timestamp of last download of a profile's posts."""
@@ -105,13 +122,114 @@ class LatestStamps:
 
     def get_profile_pic(self, profile_name: str) -> str:
         """Returns filename of profile's last downloaded profile pic."""
-        try:
-            return self.data.get(profile_name, self.PROFILE_PIC)
-        except configparser.Error:
-            return ""
+        profile_pic = self._get_option(profile_name, self.PROFILE_PIC)
+        return profile_pic if profile_pic is not None else ""
 
     def set_profile_pic(self, profile_name: str, profile_pic: str):
         """Sets filename of profile's last downloaded profile pic."""
-        self._ensure_section(profile_name)
-        self.data.set(profile_name, self.PROFILE_PIC, profile_pic)
-        self._save()
+        self._set_option(profile_name, self.PROFILE_PIC, profile_pic)
+
+
+class SqliteLatestStamps(LatestStamps):
+    """:class:`LatestStamps` stored in an SQLite database instead of an INI file.
+
+    Updates do not rewrite the whole file. They are collected and written in one transaction once
+    ``batch_size`` of them are pending, at the latest ``flush_interval`` seconds after the first of them, and when
+    :meth:`flush` or :meth:`close` is called. Pending updates are visible to the getters immediately, and to other
+    processes once written. The database is in WAL mode, so that several Instaloader processes can share it.
+
+    An existing :option:`--latest-stamps` INI file can be imported with :meth:`import_ini`, or with
+    :option:`--import-latest-stamps`.
+
+    :param latest_stamps_file: path to the database file.
+    :param batch_size: Number of updates to collect before writing them.
+    :param flush_interval: Seconds after which collected updates are written, also while no further updates come.
+
+    .. versionadded:: 4.11"""
+
+    FILE_SUFFIXES = ('.db', '.sqlite', '.sqlite3')
+
+    def __init__(self, latest_stamps_file, batch_size: int = 100, flush_interval: float = 5.0):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._pending: Dict[Tuple[str, str], str] = {}
+        # Writes the pending updates flush_interval seconds after the first of them
+        self._flush_timer: Optional[threading.Timer] = None
+        super().__init__(latest_stamps_file)
+
+    def _load(self):
+        if dn := dirname(self.file):
+            makedirs(dn, exist_ok=True)
+        self._connection = sqlite3.connect(self.file, timeout=30, check_same_thread=False, isolation_level=None)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("CREATE TABLE IF NOT EXISTS stamps ("
+                                 "profile TEXT NOT NULL, option TEXT NOT NULL, value TEXT NOT NULL, "
+                                 "PRIMARY KEY (profile, option))")
+
+    def _get_option(self, section: str, option: str) -> Optional[str]:
+        with self._lock:
+            if (section, option) in self._pending:
+                return self._pending[(section, option)]
+            row = self._connection.execute("SELECT value FROM stamps WHERE profile = ? AND option = ?",
+                                           (section, option)).fetchone()
+        return row[0] if row else None
+
+    def _set_option(self, section: str, option: str, value: str):
+        with self._lock:
+            self._pending[(section, option)] = value
+            if len(self._pending) >= self.batch_size:
+                self._flush()
+            elif self._flush_timer is None:
+                self._flush_timer = threading.Timer(self.flush_interval, self.flush)
+                self._flush_timer.daemon = True
+                self._flush_timer.start()
+
+    def _flush(self):
+        if self._flush_timer is not None:
+            self._flush_timer.cancel()
+            self._flush_timer = None
+        if self._pending:
+            self._connection.execute("BEGIN IMMEDIATE")
+            self._connection.executemany("INSERT OR REPLACE INTO stamps VALUES (?, ?, ?)",
+                                         ((section, option, value)
+                                          for (section, option), value in self._pending.items()))
+            self._connection.execute("COMMIT")
+            self._pending.clear()
+
+    def flush(self):
+        """Writes pending updates."""
+        with self._lock:
+            self._flush()
+
+    def close(self):
+        """Writes pending updates and closes the database."""
+        with self._lock:
+            self._flush()
+            self._connection.close()
+
+    def rename_profile(self, old_profile: str, new_profile: str):
+        """Renames a profile."""
+        with self._lock:
+            self._flush()
+            self._connection.execute("BEGIN IMMEDIATE")
+            self._connection.execute("INSERT OR REPLACE INTO stamps "
+                                     "SELECT ?, option, value FROM stamps WHERE profile = ?",
+                                     (new_profile, old_profile))
+            self._connection.execute("DELETE FROM stamps WHERE profile = ?", (old_profile,))
+            self._connection.execute("COMMIT")
+
+    def import_ini(self, latest_stamps_file: str) -> int:
+        """Imports the profiles of a :option:`--latest-stamps` INI file, overwriting their values stored so far.
+
+        :return: Number of imported profiles."""
+        data = configparser.ConfigParser(interpolation=None)
+        data.read(latest_stamps_file)
+        with self._lock:
+            self._flush()
+            self._connection.execute("BEGIN IMMEDIATE")
+            self._connection.executemany("INSERT OR REPLACE INTO stamps VALUES (?, ?, ?)",
+                                         ((section, option, value) for section in data.sections()
+                                          for option, value in data.items(section)))
+            self._connection.execute("COMMIT")
+        return len(data.sections())
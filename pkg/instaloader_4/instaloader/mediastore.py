@@ -0,0 +1,143 @@
+import errno
+import hashlib
+import os
+import re
+import shutil
+import time
+import uuid
+from typing import Optional
+from urllib.parse import parse_qs, urlparse
+
+
+def _temp_name(path: str) -> str:
+    return '{}.{}.temp'.format(path, uuid.uuid4().hex)
+
+
+def _link(source: str, target: str) -> None:
+    """Hardlink source to target, falling back to a copy where hardlinks are not possible.
+
+    :raises FileExistsError: If target exists."""
+    try:
+        os.link(source, target)
+    except FileExistsError:
+        raise
+    except OSError:
+        temp = _temp_name(target)
+        shutil.copy2(source, temp)
+        try:
+            os.link(temp, target)
+        finally:
+            os.unlink(temp)
+
+
+def _has_mtime(path: str, mtime: float) -> bool:
+    return abs(os.stat(path).st_mtime - mtime) < 0.001
+
+
+class MediaStore:
+    """Content-addressed store for downloaded media files.
+
+    Every file written by :meth:`Instaloader.download_pic` is hashed and stored once under ``blobs/``, named by its
+    SHA-256 digest; the file at the requested location becomes a hardlink to that blob. Identical media downloaded
+    for several targets thus occupies disk space only once.
+
+    Additionally, ``keys/`` maps the media identity derived from the CDN URL (see :meth:`media_key`) to the blob, so
+    that a media file that has been downloaded before is linked into place without any network access.
+
+    Hardlinks and the atomicity of :func:`os.link` make the store safe to share between threads and processes. Where
+    hardlinks are not supported, files are copied instead.
+
+    All hardlinks of a blob share its modification time, so files whose mtime differs from the blob's, e.g. as
+    they belong to another post, are stored as copies instead of links, and the mtime of a linked file must not be
+    changed.
+
+    :param root: Directory of the store.
+
+    .. versionadded:: 4.11
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+
+    @staticmethod
+    def media_key(url: str) -> Optional[str]:
+        """Identity of the media behind a CDN URL, independent of the URL's signature and expiry parameters.
+
+        It is the file name of the URL path plus, if present, the ``stp`` parameter which selects the rendition."""
+        parsed = urlparse(url)
+        basename = os.path.basename(parsed.path)
+        if not basename:
+            return None
+        stp = parse_qs(parsed.query).get('stp')
+        key = basename if not stp else '{}_{}'.format(stp[0], basename)
+        return re.sub(r'[^\w.\-]', '_', key)[-200:]
+
+    def _key_path(self, url: str) -> Optional[str]:
+        key = self.media_key(url)
+        return os.path.join(self.root, 'keys', key) if key else None
+
+    def _blob_path(self, digest: str, extension: str) -> str:
+        return os.path.join(self.root, 'blobs', digest[:2], digest + extension)
+
+    def lookup(self, url: str) -> Optional[str]:
+        """Path of the stored file for the media behind url, or None if it has not been downloaded yet."""
+        key_path = self._key_path(url)
+        return key_path if key_path is not None and os.path.isfile(key_path) else None
+
+    def link_into_place(self, url: str, filename: str, mtime: Optional[float] = None) -> Optional[str]:
+        """Link the stored media behind url to filename plus the stored file extension.
+
+        If mtime is given and differs from the stored file's, a copy with that mtime is created instead of a link.
+
+        :return: The created file name, or None if the media is not in the store.
+        :raises FileExistsError: If the file exists already."""
+        key_path = self.lookup(url)
+        if key_path is None:
+            return None
+        with open(key_path + '.ext', 'r') as f:
+            target = filename + f.read()
+        if os.path.isfile(target):
+            raise FileExistsError(errno.EEXIST, os.strerror(errno.EEXIST), target)
+        os.makedirs(os.path.dirname(target) or '.', exist_ok=True)
+        temp = _temp_name(target)
+        if mtime is None or _has_mtime(key_path, mtime):
+            _link(key_path, temp)
+        else:
+            shutil.copyfile(key_path, temp)
+            os.utime(temp, (time.time(), mtime))
+        os.replace(temp, target)
+        return target
+
+    def add(self, url: str, filename: str) -> None:
+        """Move a freshly downloaded file into the store, replacing it with a link to the (possibly already
+        existing) blob of identical content, and remember url's media key.
+
+        The file's mtime has to be set before. If it differs from the mtime of an existing blob of identical
+        content, the file is kept as a copy."""
+        digest = hashlib.sha256()
+        with open(filename, 'rb') as f:
+            while chunk := f.read(1024 * 1024):
+                digest.update(chunk)
+        extension = os.path.splitext(filename)[1]
+        blob_path = self._blob_path(digest.hexdigest(), extension)
+        os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+        try:
+            _link(filename, blob_path)
+        except FileExistsError:
+            # Same content is already stored, keep only one copy of it unless the mtimes differ
+            if not os.path.samefile(filename, blob_path) and _has_mtime(blob_path, os.stat(filename).st_mtime):
+                temp = _temp_name(filename)
+                _link(blob_path, temp)
+                os.replace(temp, filename)
+        key_path = self._key_path(url)
+        if key_path is not None and not os.path.isfile(key_path):
+            os.makedirs(os.path.dirname(key_path), exist_ok=True)
+            # The extension is written before the key is linked, so that a visible key always has one
+            temp = _temp_name(key_path + '.ext')
+            with open(temp, 'w') as f:
+                f.write(extension)
+            os.replace(temp, key_path + '.ext')
+            try:
+                _link(blob_path, key_path)
+            except FileExistsError:
+                pass
@@ -0,0 +1,97 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional
+
+
+class MetadataCache:
+    """Persistent cache of Post metadata, keyed by shortcode.
+
+    When set as :attr:`InstaloaderContext.metadata_cache`, :class:`Post` consults it before doing the GraphQL query
+    for its full metadata (e.g. in :meth:`Post.from_shortcode`), and stores the result of that query in it. Thus
+    repeatedly requested posts do not use up the rate limit budget.
+
+    The cache is a SQLite database, so it can be shared by threads and processes. Entries expire after *ttl*
+    seconds, which should be shorter than the lifetime of the signed media URLs contained in the metadata. When the
+    stored metadata exceeds *max_size* bytes, least recently used entries are evicted.
+
+    :param path: Path of the SQLite database file.
+    :param ttl: Seconds after which an entry is not used anymore.
+    :param max_size: Maximum total size of the stored metadata in bytes.
+
+    .. versionadded:: 4.11
+    """
+
+    def __init__(self, path: str, ttl: float = 12 * 60 * 60, max_size: int = 256 * 1024 * 1024):
+        self.path = path
+        self.ttl = ttl
+        self.max_size = max_size
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("CREATE TABLE IF NOT EXISTS post_metadata ("
+                                 "shortcode TEXT PRIMARY KEY, data TEXT NOT NULL, size INTEGER NOT NULL, "
+                                 "created REAL NOT NULL, accessed REAL NOT NULL)")
+        self._connection.execute("CREATE INDEX IF NOT EXISTS post_metadata_accessed ON post_metadata (accessed)")
+        self._connection.execute("CREATE INDEX IF NOT EXISTS post_metadata_created ON post_metadata (created)")
+        # Running total of the stored sizes, kept by triggers so that put() need not sum up the whole table
+        self._connection.execute("BEGIN IMMEDIATE")
+        self._connection.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+        self._connection.execute("INSERT OR IGNORE INTO meta "
+                                 "SELECT 'total_size', COALESCE(SUM(size), 0) FROM post_metadata")
+        self._connection.execute("CREATE TRIGGER IF NOT EXISTS post_metadata_insert AFTER INSERT ON post_metadata "
+                                 "BEGIN UPDATE meta SET value = value + NEW.size WHERE key = 'total_size'; END")
+        self._connection.execute("CREATE TRIGGER IF NOT EXISTS post_metadata_update AFTER UPDATE OF size "
+                                 "ON post_metadata BEGIN "
+                                 "UPDATE meta SET value = value + NEW.size - OLD.size WHERE key = 'total_size'; END")
+        self._connection.execute("CREATE TRIGGER IF NOT EXISTS post_metadata_delete AFTER DELETE ON post_metadata "
+                                 "BEGIN UPDATE meta SET value = value - OLD.size WHERE key = 'total_size'; END")
+        self._connection.execute("COMMIT")
+
+    def get(self, shortcode: str) -> Optional[Dict[str, Any]]:
+        """Return the cached metadata of the given shortcode, or None if not cached or expired."""
+        now = time.time()
+        with self._lock:
+            row = self._connection.execute("SELECT data, created FROM post_metadata WHERE shortcode = ?",
+                                           (shortcode,)).fetchone()
+            if row is None:
+                return None
+            if row[1] < now - self.ttl:
+                self._connection.execute("DELETE FROM post_metadata WHERE shortcode = ?", (shortcode,))
+                return None
+            self._connection.execute("UPDATE post_metadata SET accessed = ? WHERE shortcode = ?", (now, shortcode))
+        return json.loads(row[0])
+
+    def put(self, shortcode: str, metadata: Dict[str, Any]) -> None:
+        """Store metadata of the given shortcode and evict entries that are expired or exceed the size limit."""
+        data = json.dumps(metadata, separators=(',', ':'))
+        now = time.time()
+        with self._lock:
+            self._connection.execute("BEGIN IMMEDIATE")
+            try:
+                # An upsert rather than INSERT OR REPLACE, whose implicit delete would not fire the delete trigger
+                self._connection.execute("INSERT INTO post_metadata VALUES (?, ?, ?, ?, ?) ON CONFLICT (shortcode) "
+                                         "DO UPDATE SET data = excluded.data, size = excluded.size, "
+                                         "created = excluded.created, accessed = excluded.accessed",
+                                         (shortcode, data, len(data), now, now))
+                self._connection.execute("DELETE FROM post_metadata WHERE created < ?", (now - self.ttl,))
+                total_size = self._connection.execute("SELECT value FROM meta WHERE key = 'total_size'").fetchone()[0]
+                if total_size > self.max_size:
+                    for row_shortcode, size in self._connection.execute(
+                            "SELECT shortcode, size FROM post_metadata ORDER BY accessed").fetchall():
+                        if total_size <= self.max_size:
+                            break
+                        self._connection.execute("DELETE FROM post_metadata WHERE shortcode = ?", (row_shortcode,))
+                        total_size -= size
+                self._connection.execute("COMMIT")
+            except BaseException:
+                self._connection.execute("ROLLBACK")
+                raise
+
+    def close(self) -> None:
+        with self._lock:
+            self._connection.close()
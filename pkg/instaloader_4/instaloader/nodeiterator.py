@@ -2,13 +2,16 @@ import base64
 import hashlib
 import json
 import os
+import threading
+from concurrent.futures import Future
 from contextlib import contextmanager
 from datetime import datetime, timedelta
 from lzma import LZMAError
-from typing import Any, Callable, Dict, Iterable, Iterator, NamedTuple, Optional, Tuple, TypeVar
+from typing import Any, Callable, Dict, Iterable, Iterator, NamedTuple, Optional, Tuple, TypeVar, Union
 
 from .exceptions import AbortDownloadException, InvalidArgumentException, QueryReturnedBadRequestException
 from .instaloadercontext import InstaloaderContext
+from .sectioniterator import FrozenSectionIterator, SectionIterator
 
 class FrozenNodeIterator(NamedTuple):
     query_hash: str
@@ -19,6 +22,7 @@ class FrozenNodeIterator(NamedTuple):
     best_before: Optional[float]
     remaining_data: Optional[Dict]
     first_node: Optional[Dict]
+    page_length: Optional[int] = None
 FrozenNodeIterator.query_hash.__doc__ = """The GraphQL ``query_hash`` parameter."""
 FrozenNodeIterator.query_variables.__doc__ = """The GraphQL ``query_variables`` parameter."""
 FrozenNodeIterator.query_referer.__doc__ = """The HTTP referer used for the GraphQL query."""
@@ -28,6 +32,7 @@ FrozenNodeIterator.best_before.__doc__ = """Date when parts of the stored nodes
 FrozenNodeIterator.remaining_data.__doc__ = \
     """The already-retrieved, yet-unprocessed ``edges`` and the ``page_info`` at time of freezing."""
 FrozenNodeIterator.first_node.__doc__ = """Node data of the first item, if an item has been produced."""
+FrozenNodeIterator.page_length.__doc__ = """Number of items the iterator queried per page, or ``None``."""
 
 T = TypeVar('T')
 
@@ -64,9 +69,24 @@ class NodeIterator(Iterator[T]):
     NodeIterators are matching if and only if they have the same magic.
 
     See also :func:`resumable_iteration` for a high-level context manager that handles a resumable iteration.
+
+    With ``prefetch``, which defaults to :attr:`InstaloaderContext.prefetch_pages`, the next page is queried in a
+    background thread once half of the current page has been returned, so that paginating overlaps with processing
+    the items. The query is rate controlled like any other, and its error is raised when the page is reached. Call
+    :meth:`close` when abandoning the iteration early, to not prefetch further pages. A prefetched page that has not
+    been reached yet is not part of the frozen state; it is queried again after thawing.
+
+    Each iterator adapts the number of items it queries per page: The page length grows while full pages are
+    returned quickly, which saves rate-limited queries, and shrinks on slow responses and on HTTP 400 errors.
+
+    .. versionchanged:: 4.11
+       Added ``prefetch`` and :meth:`close`. The page length is adapted per iterator.
     """
 
     _graphql_page_length = 50
+    _min_graphql_page_length = 12
+    _max_graphql_page_length = 100
+    _slow_response = 5.0
     _shelf_life = timedelta(days=29)
 
     def __init__(self,
@@ -77,7 +97,8 @@ class NodeIterator(Iterator[T]):
                  query_variables: Optional[Dict[str, Any]] = None,
                  query_referer: Optional[str] = None,
                  first_data: Optional[Dict[str, Any]] = None,
-                 is_first: Optional[Callable[[T, Optional[T]], bool]] = None):
+                 is_first: Optional[Callable[[T, Optional[T]], bool]] = None,
+                 prefetch: Optional[bool] = None):
         self._context = context
         self._query_hash = query_hash
         self._edge_extractor = edge_extractor
@@ -86,6 +107,14 @@ class NodeIterator(Iterator[T]):
         self._query_referer = query_referer
         self._page_index = 0
         self._total_index = 0
+        self._prefetch = prefetch if prefetch is not None else context.prefetch_pages
+        self._page_length = NodeIterator._graphql_page_length
+        # Largest page length to grow to, lowered below a page length that was rejected
+        self._page_length_limit = NodeIterator._max_graphql_page_length
+        # Guards the page length, which is also adapted by prefetch threads
+        self._page_length_lock = threading.Lock()
+        # End cursor of the page being prefetched and its future (data, best before date)
+        self._prefetched: Optional[Tuple[str, Future]] = None
         if first_data is not None:
             self._data = first_data
             self._best_before = datetime.now() + NodeIterator._shelf_life
@@ -95,7 +124,13 @@ class NodeIterator(Iterator[T]):
         self._is_first = is_first
 
     def _query(self, after: Optional[str] = None) -> Dict:
-        pagination_variables: Dict[str, Any] = {'first': NodeIterator._graphql_page_length}
+        data, self._best_before = self._query_page(after)
+        return data
+
+    def _query_page(self, after: Optional[str] = None) -> Tuple[Dict, datetime]:
+        """Query a page, without changing the state of the iteration. Returns the page and its best before date."""
+        page_length = self._page_length
+        pagination_variables: Dict[str, Any] = {'first': page_length}
         if after is not None:
             pagination_variables['after'] = after
         try:
@@ -104,17 +139,67 @@ class NodeIterator(Iterator[T]):
                     self._query_hash, {**self._query_variables, **pagination_variables}, self._query_referer
                 )
             )
-            self._best_before = datetime.now() + NodeIterator._shelf_life
-            return data
         except QueryReturnedBadRequestException:
-            new_page_length = int(NodeIterator._graphql_page_length / 2)
-            if new_page_length >= 12:
-                NodeIterator._graphql_page_length = new_page_length
+            new_page_length = int(page_length / 2)
+            if new_page_length >= NodeIterator._min_graphql_page_length:
+                with self._page_length_lock:
+                    self._page_length_limit = min(self._page_length_limit, page_length - 1)
+                    self._page_length = min(self._page_length, new_page_length)
                 self._context.error("HTTP Error 400 (Bad Request) on GraphQL Query. Retrying with shorter page length.",
                                     repeat_at_end=False)
-                return self._query(after)
+                return self._query_page(after)
             else:
                 raise
+        self._adapt_page_length(data, self._context.last_response_elapsed)
+        return data, datetime.now() + NodeIterator._shelf_life
+
+    def _adapt_page_length(self, data: Dict, elapsed: Optional[float]) -> None:
+        """Shrink the page length after a slow response, grow it after a full page that was returned quickly."""
+        with self._page_length_lock:
+            if elapsed is not None and elapsed > NodeIterator._slow_response:
+                self._page_length = max(self._page_length * 2 // 3, NodeIterator._min_graphql_page_length)
+            elif len(data.get('edges', [])) >= self._page_length and data.get('page_info', {}).get('has_next_page'):
+                self._page_length = min(self._page_length * 3 // 2, self._page_length_limit)
+
+    def _start_prefetch(self) -> None:
+        """Query the page following the current one in a background thread, once half of the current page has been
+        returned, unless that has been started already."""
+        if not self._data.get('page_info', {}).get('has_next_page'):
+            return
+        if self._page_index * 2 < len(self._data['edges']):
+            return
+        end_cursor = self._data['page_info']['end_cursor']
+        if self._prefetched is not None and self._prefetched[0] == end_cursor:
+            return
+        future: Future = Future()
+
+        def prefetch():
+            if future.set_running_or_notify_cancel():
+                try:
+                    future.set_result(self._query_page(end_cursor))
+                except BaseException as exc:  # pylint:disable=broad-except
+                    future.set_exception(exc)
+
+        self._prefetched = (end_cursor, future)
+        threading.Thread(target=prefetch, name="nodeiterator-prefetch", daemon=True).start()
+
+    def _next_page(self, after: str) -> Tuple[Dict, datetime]:
+        """The page after the given end cursor, taken from the prefetch if there is one for it."""
+        prefetched, self._prefetched = self._prefetched, None
+        if prefetched is not None and prefetched[0] == after:
+            # The error of a failed prefetch is raised here rather than spending another query on the same page
+            return prefetched[1].result()
+        return self._query_page(after)
+
+    def close(self) -> None:
+        """Stop prefetching pages, e.g. when the iteration is abandoned before its end. A prefetch that has not
+        started yet is cancelled. Iterating further is still possible, without prefetching.
+
+        .. versionadded:: 4.11"""
+        self._prefetch = False
+        prefetched, self._prefetched = self._prefetched, None
+        if prefetched is not None:
+            prefetched[1].cancel()
 
     def __iter__(self):
         return self
@@ -136,16 +221,19 @@ class NodeIterator(Iterator[T]):
             else:
                 if self._first_node is None:
                     self._first_node = node
+            if self._prefetch:
+                self._start_prefetch()
             return item
         if self._data.get('page_info', {}).get('has_next_page'):
-            query_response = self._query(self._data['page_info']['end_cursor'])
+            query_response, best_before = self._next_page(self._data['page_info']['end_cursor'])
             if self._data['edges'] != query_response['edges'] and len(query_response['edges']) > 0:
-                page_index, data = self._page_index, self._data
+                page_index, data, old_best_before = self._page_index, self._data, self._best_before
                 try:
                     self._page_index = 0
                     self._data = query_response
+                    self._best_before = best_before
                 except KeyboardInterrupt:
-                    self._page_index, self._data = page_index, data
+                    self._page_index, self._data, self._best_before = page_index, data, old_best_before
                     raise
                 return self.__next__()
         raise StopIteration()
@@ -160,6 +248,13 @@ class NodeIterator(Iterator[T]):
         """Number of items that have already been returned."""
         return self._total_index
 
+    @property
+    def current_page_length(self) -> int:
+        """Number of items this iterator currently queries per page.
+
+        .. versionadded:: 4.11"""
+        return self._page_length
+
     @property
     def magic(self) -> str:
         """Magic string for easily identifying a matching iterator file for resuming (hash of some parameters)."""
@@ -203,6 +298,7 @@ class NodeIterator(Iterator[T]):
             best_before=self._best_before.timestamp() if self._best_before else None,
             remaining_data=remaining_data,
             first_node=self._first_node,
+            page_length=self._page_length,
         )
 
     def thaw(self, frozen: FrozenNodeIterator) -> None:
@@ -229,6 +325,10 @@ class NodeIterator(Iterator[T]):
         self._total_index = frozen.total_index
         self._best_before = datetime.fromtimestamp(frozen.best_before)
         self._data = frozen.remaining_data
+        self._prefetched = None
+        if frozen.page_length is not None:
+            self._page_length = min(max(frozen.page_length, NodeIterator._min_graphql_page_length),
+                                    NodeIterator._max_graphql_page_length)
         if frozen.first_node is not None:
             self._first_node = frozen.first_node
 
@@ -237,7 +337,7 @@ class NodeIterator(Iterator[T]):
 def resumable_iteration(context: InstaloaderContext,
                         iterator: Iterable,
                         load: Callable[[InstaloaderContext, str], Any],
-                        save: Callable[[FrozenNodeIterator, str], None],
+                        save: Callable[[Union[FrozenNodeIterator, FrozenSectionIterator], str], None],
                         format_path: Callable[[str], str],
                         check_bbd: bool = True,
                         enabled: bool = True) -> Iterator[Tuple[bool, int]]:
@@ -261,23 +361,28 @@ def resumable_iteration(context: InstaloaderContext,
 
     It yields a tuple (is_resuming, start_index).
 
-    When the passed iterator is not a :class:`NodeIterator`, it behaves as if ``resumable_iteration`` was not used,
-    just executing the inner body.
+    When the passed iterator is neither a :class:`NodeIterator` nor a :class:`SectionIterator`, it behaves as if
+    ``resumable_iteration`` was not used, just executing the inner body.
 
     :param context: The :class:`InstaloaderContext`.
-    :param iterator: The fresh :class:`NodeIterator`.
-    :param load: Loads a FrozenNodeIterator from given path. The object is ignored if it has a different type.
-    :param save: Saves the given FrozenNodeIterator to the given path.
+    :param iterator: The fresh :class:`NodeIterator` or :class:`SectionIterator`.
+    :param load: Loads a FrozenNodeIterator or FrozenSectionIterator from given path. The object is ignored if it does
+       not match the type of the iterator.
+    :param save: Saves the given FrozenNodeIterator or FrozenSectionIterator to the given path.
     :param format_path: Returns the path to the resume file for the given magic.
     :param check_bbd: Whether to check the best before date and reject an expired FrozenNodeIterator.
     :param enabled: Set to False to disable all functionality and simply execute the inner body.
 
     .. versionchanged:: 4.7
        Also interrupt on :class:`AbortDownloadException`.
+
+    .. versionchanged:: 4.11
+       Also resume :class:`SectionIterator`.
     """
-    if not enabled or not isinstance(iterator, NodeIterator):
+    if not enabled or not isinstance(iterator, (NodeIterator, SectionIterator)):
         yield False, 0
         return
+    frozen_type = FrozenNodeIterator if isinstance(iterator, NodeIterator) else FrozenSectionIterator
     is_resuming = False
     start_index = 0
     resume_file_path = format_path(iterator.magic)
@@ -285,7 +390,7 @@ def resumable_iteration(context: InstaloaderContext,
     if resume_file_exists:
         try:
             fni = load(context, resume_file_path)
-            if not isinstance(fni, FrozenNodeIterator):
+            if not isinstance(fni, frozen_type):
                 raise InvalidArgumentException("Invalid type.")
             if check_bbd and fni.best_before and datetime.fromtimestamp(fni.best_before) < datetime.now():
                 raise InvalidArgumentException("\"Best before\" date exceeded.")
@@ -1,27 +1,75 @@
-from typing import Any, Callable, Dict, Iterator, Optional, TypeVar
+import base64
+import hashlib
+import json
+import threading
+from concurrent.futures import Future
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, Iterator, NamedTuple, Optional, Tuple, TypeVar
 
+from .exceptions import InvalidArgumentException
 from .instaloadercontext import InstaloaderContext
 
+
+class FrozenSectionIterator(NamedTuple):
+    query_path: str
+    context_username: Optional[str]
+    total_index: int
+    best_before: Optional[float]
+    remaining_data: Optional[Dict]
+FrozenSectionIterator.query_path.__doc__ = """The path of the sections query."""
+FrozenSectionIterator.context_username.__doc__ = """The username who created the iterator, or ``None``."""
+FrozenSectionIterator.total_index.__doc__ = """Number of items that have already been returned."""
+FrozenSectionIterator.best_before.__doc__ = """Date when parts of the stored medias might have expired."""
+FrozenSectionIterator.remaining_data.__doc__ = \
+    """The already-retrieved, yet-unprocessed ``sections`` and the pagination fields at time of freezing."""
+
 T = TypeVar('T')
 
 
 class SectionIterator(Iterator[T]):
     """Iterator for the new 'sections'-style responses.
 
-    .. versionadded:: 4.9"""
+    Like :class:`NodeIterator`, it can be frozen with :meth:`SectionIterator.freeze` and resumed with
+    :meth:`SectionIterator.thaw` on an equally-constructed SectionIterator, and is thus supported by
+    :func:`resumable_iteration`.
+
+    With ``prefetch``, which defaults to :attr:`InstaloaderContext.prefetch_pages`, the next page is queried in a
+    background thread once half of the sections of the current page have been returned. Call :meth:`close` when
+    abandoning the iteration early, to not prefetch further pages.
+
+    .. versionadded:: 4.9
+
+    .. versionchanged:: 4.11
+       Added ``prefetch``, :meth:`close`, :meth:`freeze` and :meth:`thaw`. Without ``first_data``, the first page
+       is queried by the first :func:`next` rather than by the constructor."""
+
+    _shelf_life = timedelta(days=29)
+
     def __init__(self,
                  context: InstaloaderContext,
                  sections_extractor: Callable[[Dict[str, Any]], Dict[str, Any]],
                  media_wrapper: Callable[[Dict], T],
                  query_path: str,
-                 first_data: Optional[Dict[str, Any]] = None):
+                 first_data: Optional[Dict[str, Any]] = None,
+                 prefetch: Optional[bool] = None):
         self._context = context
         self._sections_extractor = sections_extractor
         self._media_wrapper = media_wrapper
         self._query_path = query_path
-        self._data = first_data or self._query()
+        self._prefetch = prefetch if prefetch is not None else context.prefetch_pages
+        # max_id of the page being prefetched and its future (data, best before date)
+        self._prefetched: Optional[Tuple[str, Future]] = None
+        self._data: Optional[Dict[str, Any]] = None
+        self._best_before: Optional[datetime] = None
+        if first_data:
+            self._data = first_data
+            self._best_before = datetime.now() + SectionIterator._shelf_life
+        # Otherwise, the first page is queried by the first __next__(), unless thaw() provides it
         self._page_index = 0
         self._section_index = 0
+        self._total_index = 0
+        # Page and section index of the item returned last, which freeze() resumes from
+        self._last_position = (0, 0)
 
     def __iter__(self):
         return self
@@ -32,15 +80,129 @@ class SectionIterator(Iterator[T]):
             self._context.get_json(self._query_path, params={"__a": 1, "__d": "dis", **pagination_variables})
         )
 
+    def _query_page(self, max_id: Optional[str] = None) -> Tuple[Dict[str, Any], datetime]:
+        return self._query(max_id), datetime.now() + SectionIterator._shelf_life
+
+    def _start_prefetch(self) -> None:
+        """Query the page following the current one in a background thread, once half of its sections have been
+        returned, unless that has been started already."""
+        if not self._data['more_available']:
+            return
+        if self._page_index * 2 < len(self._data['sections']):
+            return
+        max_id = self._data["next_max_id"]
+        if self._prefetched is not None and self._prefetched[0] == max_id:
+            return
+        future: Future = Future()
+
+        def prefetch():
+            if future.set_running_or_notify_cancel():
+                try:
+                    future.set_result(self._query_page(max_id))
+                except BaseException as exc:  # pylint:disable=broad-except
+                    future.set_exception(exc)
+
+        self._prefetched = (max_id, future)
+        threading.Thread(target=prefetch, name="sectioniterator-prefetch", daemon=True).start()
+
+    def _next_page(self, max_id: str) -> Tuple[Dict[str, Any], datetime]:
+        """The page for the given max_id, taken from the prefetch if there is one for it."""
+        prefetched, self._prefetched = self._prefetched, None
+        if prefetched is not None and prefetched[0] == max_id:
+            # The error of a failed prefetch is raised here rather than spending another query on the same page
+            return prefetched[1].result()
+        return self._query_page(max_id)
+
+    def close(self) -> None:
+        """Stop prefetching pages, like :meth:`NodeIterator.close`.
+
+        .. versionadded:: 4.11"""
+        self._prefetch = False
+        prefetched, self._prefetched = self._prefetched, None
+        if prefetched is not None:
+            prefetched[1].cancel()
+
     def __next__(self) -> T:
+        if self._data is None:
+            self._data, self._best_before = self._query_page()
         if self._page_index < len(self._data['sections']):
+            position = (self._page_index, self._section_index)
             media = self._data['sections'][self._page_index]['layout_content']['medias'][self._section_index]['media']
             self._section_index += 1
             if self._section_index >= len(self._data['sections'][self._page_index]['layout_content']['medias']):
                 self._section_index = 0
                 self._page_index += 1
+            self._total_index += 1
+            self._last_position = position
+            if self._prefetch:
+                self._start_prefetch()
             return self._media_wrapper(media)
         if self._data['more_available']:
-            self._page_index, self._section_index, self._data = 0, 0, self._query(self._data["next_max_id"])
+            data, self._best_before = self._next_page(self._data["next_max_id"])
+            self._page_index, self._section_index, self._data = 0, 0, data
             return self.__next__()
         raise StopIteration()
+
+    @property
+    def total_index(self) -> int:
+        """Number of items that have already been returned.
+
+        .. versionadded:: 4.11"""
+        return self._total_index
+
+    @property
+    def magic(self) -> str:
+        """Magic string for easily identifying a matching iterator file for resuming (hash of some parameters).
+
+        .. versionadded:: 4.11"""
+        magic_hash = hashlib.blake2b(digest_size=6)
+        magic_hash.update(json.dumps(["sections", self._query_path, self._context.username]).encode())
+        return base64.urlsafe_b64encode(magic_hash.digest()).decode()
+
+    def freeze(self) -> FrozenSectionIterator:
+        """Freeze the iterator for later resuming. As with :meth:`NodeIterator.freeze`, the item returned last is
+        returned again after resuming.
+
+        .. versionadded:: 4.11"""
+        if self._data is None:
+            return FrozenSectionIterator(query_path=self._query_path, context_username=self._context.username,
+                                         total_index=0, best_before=None, remaining_data=None)
+        page_index, section_index = self._last_position
+        sections = self._data['sections'][page_index:]
+        if sections:
+            layout_content = sections[0]['layout_content']
+            sections = [{**sections[0], 'layout_content': {**layout_content,
+                                                           'medias': layout_content['medias'][section_index:]}},
+                        *sections[1:]]
+        return FrozenSectionIterator(
+            query_path=self._query_path,
+            context_username=self._context.username,
+            total_index=max(self._total_index - 1, 0),
+            best_before=self._best_before.timestamp() if self._best_before else None,
+            remaining_data={**self._data, 'sections': sections},
+        )
+
+    def thaw(self, frozen: FrozenSectionIterator) -> None:
+        """
+        Use this iterator for resuming from earlier iteration.
+
+        :raises InvalidArgumentException:
+           If
+
+           - the iterator on which this method is called has already been used, or
+           - the given :class:`FrozenSectionIterator` does not match, i.e. belongs to a different iteration.
+
+        .. versionadded:: 4.11
+        """
+        if self._total_index or self._page_index or self._section_index:
+            raise InvalidArgumentException("thaw() called on already-used iterator.")
+        if self._query_path != frozen.query_path or self._context.username != frozen.context_username:
+            raise InvalidArgumentException("Mismatching resume information.")
+        if not frozen.best_before:
+            raise InvalidArgumentException("\"best before\" date missing.")
+        if frozen.remaining_data is None:
+            raise InvalidArgumentException("\"remaining_data\" missing.")
+        self._total_index = frozen.total_index
+        self._best_before = datetime.fromtimestamp(frozen.best_before)
+        self._data = frozen.remaining_data
+        self._prefetched = None
@@ -0,0 +1,129 @@
+import os
+import sqlite3
+import time
+from contextlib import contextmanager
+from typing import Optional
+
+from .instaloadercontext import InstaloaderContext, RateController
+
+
+class SharedRateController(RateController):
+    """:class:`RateController` whose request bookkeeping is shared by all processes on a host.
+
+    Every recorded query is also written to a SQLite database, and before each query the queries recorded by other
+    processes are read from it, all within one transaction that holds the database's write lock. Thus all processes
+    using the same database file, e.g. several web server workers and a command line sync, account their requests
+    against common sliding windows. Likewise, the waiting time determined after a 429 response is shared, so that
+    the other processes back off as well instead of running into 429 responses themselves.
+
+    Timestamps are taken from the wall clock, as monotonic clocks cannot be compared across processes and reboots.
+    This assumes that the clocks of the processes agree and are not stepped, e.g. by NTP: after a step, the sliding
+    windows are off by its size until the queries recorded before it have expired. Rows stamped further in the future
+    than the longest window can only stem from a clock that has been stepped back, and are discarded. Queries and
+    backoff times older than the longest window are deleted as well, at most once every :attr:`prune_interval`
+    seconds::
+
+       L = instaloader.Instaloader(rate_controller=lambda ctx: instaloader.SharedRateController(ctx, path))
+
+    :param context: The :class:`InstaloaderContext`.
+    :param path: Path of the SQLite database file.
+
+    .. versionadded:: 4.11
+    """
+
+    #: Length of the longest sliding window, i.e. of the history of queries that is kept
+    retention = 60 * 60
+    #: Minimum time between deletions of rows that have expired
+    prune_interval = 60
+
+    def __init__(self, context: InstaloaderContext, path: str):
+        super().__init__(context)
+        self.path = path
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._connection: Optional[sqlite3.Connection] = None
+        self._connection_pid: Optional[int] = None
+        self._last_rowid = 0
+        self._last_prune = 0.0
+
+    def _get_connection(self) -> sqlite3.Connection:
+        # A connection must not be used across fork(), e.g. by forked web server workers
+        if self._connection is None or self._connection_pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=60, check_same_thread=False, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("CREATE TABLE IF NOT EXISTS queries ("
+                               "id INTEGER PRIMARY KEY AUTOINCREMENT, query_type TEXT NOT NULL, "
+                               "timestamp REAL NOT NULL)")
+            connection.execute("CREATE INDEX IF NOT EXISTS queries_timestamp ON queries (timestamp)")
+            connection.execute("CREATE TABLE IF NOT EXISTS backoff (name TEXT PRIMARY KEY, until REAL NOT NULL)")
+            self._connection = connection
+            self._connection_pid = os.getpid()
+        return self._connection
+
+    @contextmanager
+    def _transaction(self):
+        connection = self._get_connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            yield connection
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        connection.execute("COMMIT")
+
+    def _current_time(self) -> float:
+        return time.time()
+
+    def _prune(self, connection: sqlite3.Connection, current_time: float) -> None:
+        """Delete queries and backoff times that have expired, or that lie too far in the future to be valid."""
+        if abs(current_time - self._last_prune) < self.prune_interval:
+            return
+        self._last_prune = current_time
+        connection.execute("DELETE FROM queries WHERE timestamp <= ? OR timestamp > ?",
+                           (current_time - self.retention, current_time + self.retention))
+        connection.execute("DELETE FROM backoff WHERE until <= ? OR until > ?",
+                           (current_time, current_time + self.retention))
+
+    def _sync(self, connection: sqlite3.Connection) -> None:
+        """Load queries and backoff times recorded by other processes since the last synchronization."""
+        current_time = self._current_time()
+        self._prune(connection, current_time)
+        for rowid, query_type, timestamp in connection.execute(
+                "SELECT id, query_type, timestamp FROM queries WHERE id > ? AND timestamp > ? AND timestamp <= ? "
+                "ORDER BY id", (self._last_rowid, current_time - self.retention, current_time + self.retention)):
+            super()._record_query(query_type, timestamp)
+            self._last_rowid = rowid
+        for name, until in connection.execute("SELECT name, until FROM backoff WHERE until <= ?",
+                                              (current_time + self.retention,)):
+            if name == 'iphone':
+                self._iphone_earliest_next_request_time = max(self._iphone_earliest_next_request_time, until)
+            else:
+                self._earliest_next_request_time = max(self._earliest_next_request_time, until)
+
+    def _record_query(self, query_type: str, current_time: float) -> None:
+        connection = self._get_connection()
+        self._last_rowid = connection.execute("INSERT INTO queries (query_type, timestamp) VALUES (?, ?)",
+                                              (query_type, current_time)).lastrowid
+        super()._record_query(query_type, current_time)
+
+    def _reserve_query(self, query_type: str) -> float:
+        with self._lock, self._transaction() as connection:
+            self._sync(connection)
+            return super()._reserve_query(query_type)
+
+    def _handle_429_waittime(self, query_type: str) -> float:
+        with self._lock, self._transaction() as connection:
+            self._sync(connection)
+            waittime = super()._handle_429_waittime(query_type)
+            connection.executemany("INSERT INTO backoff VALUES (?, ?) "
+                                   "ON CONFLICT (name) DO UPDATE SET until = MAX(until, excluded.until)",
+                                   [('iphone', self._iphone_earliest_next_request_time),
+                                    ('default', self._earliest_next_request_time)])
+        return waittime
+
+    def close(self) -> None:
+        """Close the database connection."""
+        with self._lock:
+            if self._connection is not None and self._connection_pid == os.getpid():
+                self._connection.close()
+            self._connection = None
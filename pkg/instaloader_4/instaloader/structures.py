@@ -6,14 +6,28 @@ from contextlib import suppress
 from datetime import datetime
 from itertools import islice
 from pathlib import Path
-from typing import Any, Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple, Union
+from typing import TYPE_CHECKING, Any, Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple, Union
 from unicodedata import normalize
 
 from . import __version__
 from .exceptions import *
 from .instaloadercontext import InstaloaderContext
 from .nodeiterator import FrozenNodeIterator, NodeIterator
-from .sectioniterator import SectionIterator
+from .sectioniterator import FrozenSectionIterator, SectionIterator
+
+try:
+    # optional, faster JSON serialization with json_serializer='orjson'
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    # optional, for '.json.zst' files
+    import zstandard
+except ImportError:
+    zstandard = None
+
+if TYPE_CHECKING:
+    from .asyncinstaloadercontext import AsyncInstaloaderContext
 
 
 class PostSidecarNode(NamedTuple):
@@ -183,8 +197,22 @@ class Post:
     :param context: :attr:`Instaloader.context` used for additional queries if neccessary..
     :param node: Node structure, as returned by Instagram.
     :param owner_profile: The Profile of the owner, if already known at creation.
+
+    .. versionchanged:: 4.11
+       Posts have ``__slots__``, see also :meth:`compact` to reduce memory use of posts kept in memory.
     """
 
+    __slots__ = ('_context', '_node', '_owner_profile', '_full_metadata_dict', '_location', '_iphone_struct_')
+
+    # Top-level node fields read by the properties, kept by compact()
+    COMPACT_FIELDS = frozenset({
+        '__typename', 'accessibility_caption', 'caption', 'code', 'date', 'display_src', 'display_url',
+        'edge_media_preview_like', 'edge_media_to_caption', 'edge_media_to_comment', 'edge_media_to_parent_comment',
+        'edge_media_to_sponsor_user', 'edge_media_to_tagged_user', 'edge_sidecar_to_children', 'id', 'is_video',
+        'likes', 'location', 'owner', 'pinned_for_users', 'shortcode', 'taken_at_timestamp', 'title', 'video_duration',
+        'video_url', 'video_view_count', 'viewer_has_liked',
+    })
+
     def __init__(self, context: InstaloaderContext, node: Dict[str, Any],
                  owner_profile: Optional['Profile'] = None):
         assert 'shortcode' in node or 'code' in node
@@ -201,12 +229,38 @@ class Post:
 
     @classmethod
     def from_shortcode(cls, context: InstaloaderContext, shortcode: str):
-        """Create a post object from a given shortcode"""
+        """Create a post object from a given shortcode
+
+        .. versionchanged:: 4.11
+           Uses :attr:`InstaloaderContext.metadata_cache`, if set."""
         # pylint:disable=protected-access
         post = cls(context, {'shortcode': shortcode})
         post._node = post._full_metadata
         return post
 
+    @classmethod
+    async def from_shortcode_async(cls, context: 'AsyncInstaloaderContext', shortcode: str):
+        """Create a post object from a given shortcode, fetching its metadata without blocking the event loop.
+
+        Properties that need further queries use the blocking :class:`InstaloaderContext` wrapped by *context*.
+
+        .. versionadded:: 4.11"""
+        # pylint:disable=protected-access
+        post = cls(context.context, {'shortcode': shortcode})
+        cache = context.context.metadata_cache
+        cached = cache.get(shortcode) if cache is not None else None
+        if cached is not None:
+            post._full_metadata_dict = cached
+        else:
+            post._set_full_metadata(await context.graphql_query(
+                '2b0673e0dc4580674a88d426fe00ea90',
+                {'shortcode': shortcode}
+            ))
+            if cache is not None:
+                cache.put(shortcode, post._full_metadata_dict)
+        post._node = post._full_metadata
+        return post
+
     @classmethod
     def from_mediaid(cls, context: InstaloaderContext, mediaid: int):
         """Create a post object from a given mediaid"""
@@ -266,7 +320,7 @@ class Post:
         return ["GraphImage", "GraphVideo", "GraphSidecar"]
 
     def _asdict(self):
-        node = self._node
+        node = dict(self._node)
         if self._full_metadata_dict:
             node.update(self._full_metadata_dict)
         if self._owner_profile:
@@ -277,6 +331,26 @@ class Post:
             node['iphone_struct'] = self._iphone_struct_
         return node
 
+    def compact(self, keep: Optional[Iterable[str]] = None) -> 'Post':
+        """Drop raw node fields that are not needed, to reduce the memory use of posts that are kept in memory.
+
+        The fields are merged with the full metadata, if it has been fetched, and reduced to ``keep``, which defaults
+        to the fields read by the properties of this class, :attr:`COMPACT_FIELDS`. Properties that read a dropped
+        field query the full metadata again. The iPhone struct is dropped as well.
+
+        :param keep: Top-level node fields to keep.
+        :return: This post, e.g. for ``map(Post.compact, profile.get_posts())``.
+
+        .. versionadded:: 4.11"""
+        keep = self.COMPACT_FIELDS if keep is None else frozenset(keep)
+        node = self._node
+        if self._full_metadata_dict:
+            node = {**node, **self._full_metadata_dict}
+        self._node = {key: value for key, value in node.items() if key in keep}
+        self._full_metadata_dict = None
+        self._iphone_struct_ = None
+        return self
+
     @property
     def shortcode(self) -> str:
         """Media shortcode. URL of the post is instagram.com/p/<shortcode>/."""
@@ -308,16 +382,25 @@ class Post:
 
     def _obtain_metadata(self):
         if not self._full_metadata_dict:
-            pic_json = self._context.graphql_query(
+            cache = self._context.metadata_cache
+            cached = cache.get(self.shortcode) if cache is not None else None
+            if cached is not None:
+                self._full_metadata_dict = cached
+                return
+            self._set_full_metadata(self._context.graphql_query(
                 '2b0673e0dc4580674a88d426fe00ea90',
                 {'shortcode': self.shortcode}
-            )
-            self._full_metadata_dict = pic_json['data']['shortcode_media']
-            if self._full_metadata_dict is None:
-                raise BadResponseException("Fetching Post metadata failed.")
-            if self.shortcode != self._full_metadata_dict['shortcode']:
-                self._node.update(self._full_metadata_dict)
-                raise PostChangedException
+            ))
+            if cache is not None:
+                cache.put(self.shortcode, self._full_metadata_dict)
+
+    def _set_full_metadata(self, pic_json: Dict[str, Any]):
+        self._full_metadata_dict = pic_json['data']['shortcode_media']
+        if self._full_metadata_dict is None:
+            raise BadResponseException("Fetching Post metadata failed.")
+        if self.shortcode != self._full_metadata_dict['shortcode']:
+            self._node.update(self._full_metadata_dict)
+            raise PostChangedException
 
     @property
     def _full_metadata(self) -> Dict[str, Any]:
@@ -449,6 +532,19 @@ class Post:
             return [edge['node']['is_video'] for edge in edges]
         return [self.is_video]
 
+    def _sidecar_node(self, idx: int, node: Dict[str, Any]) -> PostSidecarNode:
+        is_video = node['is_video']
+        display_url = node['display_url']
+        if not is_video and self._context.iphone_support and self._context.is_logged_in:
+            try:
+                carousel_media = self._iphone_struct['carousel_media']
+                orig_url = carousel_media[idx]['image_versions2']['candidates'][0]['url']
+                display_url = re.sub(r'([?&])se=\d+&?', r'\1', orig_url).rstrip('&')
+            except (InstaloaderException, KeyError, IndexError) as err:
+                self._context.error(f"Unable to fetch high quality image version of {self}: {err}")
+        return PostSidecarNode(is_video=is_video, display_url=display_url,
+                               video_url=node['video_url'] if is_video else None)
+
     def get_sidecar_nodes(self, start=0, end=-1) -> Iterator[PostSidecarNode]:
         """
         Sidecar nodes of a Post with typename==GraphSidecar.
@@ -467,18 +563,27 @@ class Post:
                 edges = self._full_metadata['edge_sidecar_to_children']['edges']
             for idx, edge in enumerate(edges):
                 if start <= idx <= end:
-                    node = edge['node']
-                    is_video = node['is_video']
-                    display_url = node['display_url']
-                    if not is_video and self._context.iphone_support and self._context.is_logged_in:
-                        try:
-                            carousel_media = self._iphone_struct['carousel_media']
-                            orig_url = carousel_media[idx]['image_versions2']['candidates'][0]['url']
-                            display_url = re.sub(r'([?&])se=\d+&?', r'\1', orig_url).rstrip('&')
-                        except (InstaloaderException, KeyError, IndexError) as err:
-                            self._context.error(f"Unable to fetch high quality image version of {self}: {err}")
-                    yield PostSidecarNode(is_video=is_video, display_url=display_url,
-                                          video_url=node['video_url'] if is_video else None)
+                    yield self._sidecar_node(idx, edge['node'])
+
+    def get_sidecar_node(self, index: int) -> PostSidecarNode:
+        """
+        Sidecar node at the given zero-based index of a Post with typename==GraphSidecar.
+
+        Only the requested node is resolved: The full metadata is only fetched if this node is a video whose URL is
+        missing, and the iPhone media info only if this node is an image.
+
+        :raises IndexError: If the Post has no sidecar node with that index.
+
+        .. versionadded:: 4.11
+        """
+        edges = self._field('edge_sidecar_to_children', 'edges') if self.typename == 'GraphSidecar' else []
+        if not 0 <= index < len(edges):
+            raise IndexError("{} has no sidecar node {}.".format(self, index))
+        node = edges[index]['node']
+        if node['is_video'] and 'video_url' not in node:
+            # video_url is only present in full metadata, issue #558.
+            node = self._full_metadata['edge_sidecar_to_children']['edges'][index]['node']
+        return self._sidecar_node(index, node)
 
     @property
     def caption(self) -> Optional[str]:
@@ -850,7 +955,13 @@ class Profile:
            print(followee.username)
 
     Also, this class implements == and is hashable.
+
+    .. versionchanged:: 4.11
+       Profiles have ``__slots__``.
     """
+
+    __slots__ = ('_context', '_has_public_story', '_node', '_has_full_metadata', '_iphone_struct_')
+
     def __init__(self, context: InstaloaderContext, node: Dict[str, Any]):
         assert 'username' in node
         self._context = context
@@ -1322,8 +1433,13 @@ class StoryItem:
     :param context: :class:`InstaloaderContext` instance used for additional queries if necessary.
     :param node: Dictionary containing the available information of the story item.
     :param owner_profile: :class:`Profile` instance representing the story owner.
+
+    .. versionchanged:: 4.11
+       StoryItems have ``__slots__``.
     """
 
+    __slots__ = ('_context', '_node', '_owner_profile', '_iphone_struct_')
+
     def __init__(self, context: InstaloaderContext, node: Dict[str, Any], owner_profile: Optional[Profile] = None):
         self._context = context
         self._node = node
@@ -2090,7 +2206,7 @@ class TitlePic:
         return self._date_utc.astimezone() if self._date_utc is not None else None
 
 
-JsonExportable = Union[Post, Profile, StoryItem, Hashtag, FrozenNodeIterator]
+JsonExportable = Union[Post, Profile, StoryItem, Hashtag, FrozenNodeIterator, FrozenSectionIterator]
 
 
 def get_json_structure(structure: JsonExportable) -> dict:
@@ -2107,24 +2223,54 @@ def get_json_structure(structure: JsonExportable) -> dict:
     }
 
 
-def save_structure_to_file(structure: JsonExportable, filename: str) -> None:
+JSON_SERIALIZERS = ('json', 'orjson')
+
+
+def _dump_json(json_structure: dict, serializer: str, pretty: bool) -> bytes:
+    if serializer == 'orjson' and orjson is not None:
+        try:
+            return orjson.dumps(json_structure, option=orjson.OPT_INDENT_2 | orjson.OPT_SORT_KEYS if pretty else 0)
+        except TypeError:
+            # e.g. integers that do not fit 64 bits, which the json module can serialize
+            pass
+    if pretty:
+        return json.dumps(json_structure, indent=4, sort_keys=True).encode()
+    return json.dumps(json_structure, separators=(',', ':')).encode()
+
+
+def save_structure_to_file(structure: JsonExportable, filename: str, serializer: str = 'json',
+                           compression_level: Optional[int] = None) -> None:
     """Saves a :class:`Post`, :class:`Profile`, :class:`StoryItem`, :class:`Hashtag` or :class:`FrozenNodeIterator` to a
-    '.json' or '.json.xz' file such that it can later be loaded by :func:`load_structure_from_file`.
+    '.json', '.json.xz' or '.json.zst' file such that it can later be loaded by :func:`load_structure_from_file`.
 
-    If the specified filename ends in '.xz', the file will be LZMA compressed. Otherwise, a pretty-printed JSON file
-    will be created.
+    If the specified filename ends in '.xz', the file will be LZMA compressed, if it ends in '.zst', it will be
+    Zstandard compressed, which requires the zstandard package. Otherwise, a pretty-printed JSON file will be created.
 
     :param structure: :class:`Post`, :class:`Profile`, :class:`StoryItem` or :class:`Hashtag`
-    :param filename: Filename, ends in '.json' or '.json.xz'
+    :param filename: Filename, ends in '.json', '.json.xz' or '.json.zst'
+    :param serializer: 'json', or 'orjson' to serialize with orjson if it is installed. orjson indents pretty-printed
+       files by two spaces instead of four.
+    :param compression_level: Zstandard compression level for '.zst' files, or None for the default level.
+
+    .. versionchanged:: 4.11
+       Support '.json.zst' files, add ``serializer`` and ``compression_level``.
     """
+    if serializer not in JSON_SERIALIZERS:
+        raise InvalidArgumentException("Unknown JSON serializer {}.".format(serializer))
     json_structure = get_json_structure(structure)
-    compress = filename.endswith('.xz')
-    if compress:
-        with lzma.open(filename, 'wt', check=lzma.CHECK_NONE) as fp:
-            json.dump(json_structure, fp=fp, separators=(',', ':'))
+    if filename.endswith('.zst'):
+        if zstandard is None:
+            raise InvalidArgumentException("Saving .zst files requires the zstandard package, "
+                                           "'pip install instaloader[zstd]'.")
+        compressor = zstandard.ZstdCompressor(level=compression_level if compression_level is not None else 3)
+        with open(filename, 'wb') as fp:
+            fp.write(compressor.compress(_dump_json(json_structure, serializer, pretty=False)))
+    elif filename.endswith('.xz'):
+        with lzma.open(filename, 'wb', check=lzma.CHECK_NONE) as fp:
+            fp.write(_dump_json(json_structure, serializer, pretty=False))
     else:
-        with open(filename, 'wt') as fp:
-            json.dump(json_structure, fp=fp, indent=4, sort_keys=True)
+        with open(filename, 'wb') as fp:
+            fp.write(_dump_json(json_structure, serializer, pretty=True))
 
 
 def load_structure(context: InstaloaderContext, json_structure: dict) -> JsonExportable:
@@ -2151,25 +2297,51 @@ def load_structure(context: InstaloaderContext, json_structure: dict) -> JsonExp
             if not 'first_node' in json_structure['node']:
                 json_structure['node']['first_node'] = None
             return FrozenNodeIterator(**json_structure['node'])
+        elif node_type == "FrozenSectionIterator":
+            return FrozenSectionIterator(**json_structure['node'])
     elif 'shortcode' in json_structure:
         # Post JSON created with Instaloader v3
         return Post.from_shortcode(context, json_structure['shortcode'])
     raise InvalidArgumentException("Passed json structure is not an Instaloader JSON")
 
 
-def load_structure_from_file(context: InstaloaderContext, filename: str) -> JsonExportable:
+def _load_json(data: bytes, serializer: str) -> dict:
+    if serializer == 'orjson' and orjson is not None:
+        try:
+            return orjson.loads(data)
+        except orjson.JSONDecodeError:
+            # e.g. NaN or infinite floats, which the json module writes and reads
+            pass
+    return json.loads(data)
+
+
+def load_structure_from_file(context: InstaloaderContext, filename: str, serializer: str = 'json') -> JsonExportable:
     """Loads a :class:`Post`, :class:`Profile`, :class:`StoryItem`, :class:`Hashtag` or :class:`FrozenNodeIterator` from
-    a '.json' or '.json.xz' file that has been saved by :func:`save_structure_to_file`.
+    a '.json', '.json.xz' or '.json.zst' file that has been saved by :func:`save_structure_to_file`.
 
     :param context: :attr:`Instaloader.context` linked to the new object, used for additional queries if neccessary.
-    :param filename: Filename, ends in '.json' or '.json.xz'
+    :param filename: Filename, ends in '.json', '.json.xz' or '.json.zst'
+    :param serializer: 'json', or 'orjson' to parse with orjson if it is installed. orjson reads integers beyond
+       64 bits as floats, files it cannot parse are parsed with the json module.
+
+    .. versionchanged:: 4.11
+       Support '.json.zst' files, add ``serializer``.
     """
-    compressed = filename.endswith('.xz')
-    if compressed:
-        fp = lzma.open(filename, 'rt')
+    if serializer not in JSON_SERIALIZERS:
+        raise InvalidArgumentException("Unknown JSON serializer {}.".format(serializer))
+    if filename.endswith('.zst'):
+        if zstandard is None:
+            raise InvalidArgumentException("Loading .zst files requires the zstandard package, "
+                                           "'pip install instaloader[zstd]'.")
+        with open(filename, 'rb') as fp:
+            try:
+                data = zstandard.ZstdDecompressor().stream_reader(fp).read()
+            except zstandard.ZstdError as err:
+                raise InvalidArgumentException("Invalid Zstandard file {}: {}".format(filename, err)) from err
+    elif filename.endswith('.xz'):
+        with lzma.open(filename, 'rb') as fp:
+            data = fp.read()
     else:
-        # pylint:disable=consider-using-with
-        fp = open(filename, 'rt')
-    json_structure = json.load(fp)
-    fp.close()
-    return load_structure(context, json_structure)
+        with open(filename, 'rb') as fp:
+            data = fp.read()
+    return load_structure(context, _load_json(data, serializer))
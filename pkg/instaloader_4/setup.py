@@ -24,6 +24,9 @@ if sys.version_info < (3, 8):
 requirements = ['requests>=2.4']
 optional_requirements = {
     'browser_cookie3': ['browser_cookie3>=0.19.1'],
+    'async': ['httpx>=0.26'],
+    'zstd': ['zstandard'],
+    'orjson': ['orjson'],
 }
 
 keywords = (['instagram', 'instagram-scraper', 'instagram-client', 'instagram-feed', 'downloader', 'videos', 'photos',
@@ -0,0 +1,159 @@
+import os
+import signal
+import threading
+import time
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import instaloader
+
+CHUNK = b'\xff' * 10000
+
+
+class MediaHandler(BaseHTTPRequestHandler):
+    """Serves every path as a JPEG of 30 chunks, slowly enough to still be streaming when the next request starts."""
+
+    def do_GET(self):
+        self.server.requests.append(self.path)
+        if self.path.startswith('/failing'):
+            self.send_response(500)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        if self.path.startswith('/missing'):
+            # Like an expired CDN URL, with a body that is never read
+            self.send_response(404)
+            self.send_header('Content-Length', str(len(CHUNK)))
+            self.end_headers()
+            self.wfile.write(CHUNK)
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'image/jpeg')
+        self.send_header('Content-Length', str(30 * len(CHUNK)))
+        self.end_headers()
+        for _ in range(30):
+            self.wfile.write(CHUNK)
+            time.sleep(0.005)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def media_server():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), MediaHandler)
+    server.daemon_threads = True
+    server.requests = []
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def media_url(server, path):
+    return 'http://127.0.0.1:{}/{}'.format(server.server_address[1], path)
+
+
+def sidecar_post(context, server, paths):
+    return instaloader.Post(context, {
+        '__typename': 'GraphSidecar', 'id': '3141592653589793238', 'shortcode': 'CuWrSwMIWTq',
+        'display_url': media_url(server, 'cover.jpg?x=1'), 'is_video': False, 'taken_at_timestamp': 1700000000,
+        'owner': {'id': '25025320', 'username': 'instagram'}, 'edge_media_to_caption': {'edges': []},
+        'edge_sidecar_to_children': {'edges': [
+            {'node': {'display_url': media_url(server, path + '?x=1'), 'is_video': False}} for path in paths]}})
+
+
+def returns_in_time(function, timeout=10):
+    """Calls function in a thread, and returns whether it returned or raised within timeout seconds."""
+    def call():
+        try:
+            function()
+        except Exception:  # pylint:disable=broad-except
+            pass
+
+    thread = threading.Thread(target=call, daemon=True)
+    thread.start()
+    thread.join(timeout)
+    return not thread.is_alive()
+
+
+@pytest.fixture
+def loader(tmp_path):
+    with instaloader.Instaloader(quiet=True, dirname_pattern=str(tmp_path), filename_pattern='{shortcode}',
+                                 save_metadata=False, post_metadata_txt_pattern='', sidecar_workers=4) as loader:
+        yield loader
+
+
+def test_sidecar_skips_existing_files_and_sets_mtime(media_server, loader, tmp_path):
+    post = sidecar_post(loader.context, media_server, ['1.jpg', '2.jpg', '3.jpg'])
+    existing = tmp_path / 'CuWrSwMIWTq_2.jpg'
+    existing.write_bytes(b'existing')
+    assert loader.download_post(post, 'target') is False
+    assert existing.read_bytes() == b'existing'
+    assert sorted(media_server.requests) == ['/1.jpg?x=1', '/3.jpg?x=1']
+    for index in (1, 3):
+        filename = tmp_path / 'CuWrSwMIWTq_{}.jpg'.format(index)
+        assert filename.stat().st_size == 30 * len(CHUNK)
+        assert os.path.getmtime(filename) == datetime.fromtimestamp(1700000000).timestamp()
+    media_server.requests.clear()
+    existing.unlink()
+    assert loader.download_post(post, 'target') is False
+    assert media_server.requests == ['/2.jpg?x=1']
+
+
+@pytest.mark.skipif(os.name == 'nt', reason="SIGINT cannot be sent to the own process")
+def test_interrupt_skips_retried_sidecar_download(media_server, loader, tmp_path):
+    loader.context.max_connection_attempts = 1000
+    post = sidecar_post(loader.context, media_server, ['1.jpg', 'failing.jpg', '3.jpg'])
+    # ^C, while the main thread waits for the downloads
+    interrupt = threading.Timer(0.5, os.kill, (os.getpid(), signal.SIGINT))
+    interrupt.start()
+    started = time.monotonic()
+    with pytest.raises(instaloader.ConnectionException):
+        loader.download_post(post, 'target')
+    # ^C skipped the download that was being retried, and only that one
+    assert time.monotonic() - started < 10
+    assert (tmp_path / 'CuWrSwMIWTq_1.jpg').is_file() and (tmp_path / 'CuWrSwMIWTq_3.jpg').is_file()
+    assert not (tmp_path / 'CuWrSwMIWTq_2.jpg').exists()
+
+
+def test_idle_session_is_replaced_without_closing_it(media_server, monkeypatch):
+    context = instaloader.InstaloaderContext(quiet=True)
+    context.anonymous_pool_idle_timeout = 0.01
+    streaming = context.get_raw(media_url(media_server, 'first.jpg'))
+    idle_session = context._get_pooled_anonymous_session()
+    closed = []
+    monkeypatch.setattr(idle_session, 'close', lambda: closed.append(idle_session))
+    time.sleep(0.05)
+    # Replaces the idle session, while the first response is still being read from it
+    replaced = context.get_raw(media_url(media_server, 'second.jpg'))
+    assert context._get_pooled_anonymous_session() is not idle_session
+    assert not closed
+    assert len(streaming.raw.read()) == len(replaced.raw.read()) == 30 * len(CHUNK)
+    context.close()
+
+
+def test_failed_downloads_release_their_connections(media_server):
+    context = instaloader.InstaloaderContext(quiet=True, anonymous_pool_size=2)
+
+    failed = []
+
+    def get_missing():
+        for index in range(context.anonymous_pool_size + 1):
+            with pytest.raises(instaloader.QueryReturnedNotFoundException):
+                context.get_raw(media_url(media_server, 'missing{}.jpg'.format(index)))
+            failed.append(index)
+
+    assert returns_in_time(get_missing)
+    assert failed == [0, 1, 2]
+    context.close()
+
+
+def test_sidecar_with_more_failing_slides_than_connections_returns(media_server, loader):
+    loader.context.anonymous_pool_size = 1
+    loader.context.sleep = False
+    post = sidecar_post(loader.context, media_server, ['missing{}.jpg'.format(index) for index in range(6)])
+    assert returns_in_time(lambda: loader.download_post(post, 'target'))
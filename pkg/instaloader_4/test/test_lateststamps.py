@@ -0,0 +1,42 @@
+import sqlite3
+import time
+from datetime import datetime, timezone
+
+import instaloader
+from instaloader.__main__ import _main
+from instaloader.lateststamps import SqliteLatestStamps
+
+TIMESTAMP = datetime(2024, 5, 1, 12, 30, tzinfo=timezone.utc)
+
+
+def stored_stamps(path):
+    with sqlite3.connect(str(path)) as connection:
+        return connection.execute("SELECT profile, option FROM stamps").fetchall()
+
+
+def test_pending_updates_are_written_after_flush_interval(tmp_path):
+    path = tmp_path / 'stamps.sqlite3'
+    stamps = SqliteLatestStamps(str(path), flush_interval=0.2)
+    stamps.set_last_post_timestamp('someone', TIMESTAMP)
+    assert stamps.get_last_post_timestamp('someone') == TIMESTAMP
+    assert stored_stamps(path) == []
+    # Written without waiting for a further update or close()
+    deadline = time.monotonic() + 5
+    while not stored_stamps(path) and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert stored_stamps(path) == [('someone', SqliteLatestStamps.POST_TIMESTAMP)]
+    stamps.close()
+
+
+def test_import_latest_stamps_from_command_line(tmp_path):
+    ini_path = tmp_path / 'stamps.ini'
+    ini_path.write_text("[someone]\nprofile-id = 123\npost-timestamp = {}\n"
+                        .format(TIMESTAMP.strftime(SqliteLatestStamps.ISO_FORMAT)))
+    path = tmp_path / 'stamps.sqlite3'
+    loader = instaloader.Instaloader(quiet=True)
+    _main(loader, [], latest_stamps_file=str(path), import_latest_stamps_file=str(ini_path))
+    loader.close()
+    stamps = SqliteLatestStamps(str(path))
+    assert stamps.get_profile_id('someone') == 123
+    assert stamps.get_last_post_timestamp('someone') == TIMESTAMP
+    stamps.close()
@@ -0,0 +1,51 @@
+import os
+
+import pytest
+
+from instaloader import MediaStore
+
+URL = 'https://scontent.cdninstagram.com/v/t51.2885-15/12345_n.jpg?stp=dst-jpg_e35&_nc_ht=x&oh=signature'
+
+
+@pytest.fixture
+def store(tmp_path):
+    return MediaStore(str(tmp_path / 'store'))
+
+
+def downloaded(path, mtime, content=b'media'):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(content)
+    os.utime(path, (mtime, mtime))
+    return str(path)
+
+
+def test_links_only_files_of_the_same_mtime(store, tmp_path):
+    first = downloaded(tmp_path / 'a' / 'post.jpg', 1700000000)
+    store.add(URL, first)
+    same = store.link_into_place(URL, str(tmp_path / 'b' / 'post'), 1700000000)
+    assert os.path.samefile(first, same)
+    other = store.link_into_place(URL, str(tmp_path / 'c' / 'post'), 1600000000)
+    assert not os.path.samefile(first, other)
+    assert os.path.getmtime(other) == 1600000000
+    assert os.path.getmtime(first) == os.path.getmtime(same) == 1700000000
+
+
+def test_add_keeps_copy_of_differing_mtime(store, tmp_path):
+    first = downloaded(tmp_path / 'a' / 'post.jpg', 1700000000)
+    store.add(URL, first)
+    second = downloaded(tmp_path / 'b' / 'post.jpg', 1600000000)
+    store.add(URL, second)
+    assert not os.path.samefile(first, second)
+    assert os.path.getmtime(first) == 1700000000 and os.path.getmtime(second) == 1600000000
+    third = downloaded(tmp_path / 'c' / 'post.jpg', 1700000000)
+    store.add(URL, third)
+    assert os.path.samefile(first, third)
+
+
+def test_link_into_existing_file(store, tmp_path):
+    store.add(URL, downloaded(tmp_path / 'a' / 'post.jpg', 1700000000))
+    existing = downloaded(tmp_path / 'b' / 'post.jpg', 1700000000, b'other')
+    with pytest.raises(FileExistsError):
+        store.link_into_place(URL, str(tmp_path / 'b' / 'post'))
+    assert open(existing, 'rb').read() == b'other'
+    assert store.link_into_place(URL.replace('12345', '67890'), str(tmp_path / 'c' / 'post')) is None
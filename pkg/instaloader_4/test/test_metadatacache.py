@@ -0,0 +1,38 @@
+import time
+
+from instaloader.metadatacache import MetadataCache
+
+
+def sizes(cache):
+    connection = cache._connection
+    total_size = connection.execute("SELECT value FROM meta WHERE key = 'total_size'").fetchone()[0]
+    return total_size, connection.execute("SELECT COALESCE(SUM(size), 0) FROM post_metadata").fetchone()[0]
+
+
+def test_total_size_is_kept_up_to_date(tmp_path):
+    cache = MetadataCache(str(tmp_path / 'metadata.sqlite3'), ttl=60)
+    cache.put('a', {'caption': 'x' * 100})
+    cache.put('b', {'caption': 'y' * 200})
+    cache.put('a', {'caption': 'z' * 50})
+    total_size, summed_size = sizes(cache)
+    assert total_size == summed_size > 0
+    # Expired entries are deleted by get()
+    cache._connection.execute("UPDATE post_metadata SET created = ? WHERE shortcode = 'b'", (time.time() - 120,))
+    assert cache.get('b') is None
+    assert sizes(cache)[0] == sizes(cache)[1]
+    cache.close()
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    path = str(tmp_path / 'metadata.sqlite3')
+    cache = MetadataCache(path, max_size=250)
+    for shortcode in 'abc':
+        cache.put(shortcode, {'caption': shortcode * 100})
+        time.sleep(0.01)
+    assert cache.get('a') is None and cache.get('b') is not None and cache.get('c') is not None
+    cache.close()
+    # The total is taken over when the database is opened again
+    cache = MetadataCache(path, max_size=250)
+    total_size, summed_size = sizes(cache)
+    assert total_size == summed_size <= 250
+    cache.close()
@@ -0,0 +1,103 @@
+import pytest
+
+import instaloader
+from instaloader.exceptions import ConnectionException, QueryReturnedBadRequestException
+
+
+class PagedContext(instaloader.InstaloaderContext):
+    """Serves a GraphQL pagination of ``total`` nodes, rejecting pages longer than ``max_page_length``."""
+
+    def __init__(self, total: int, max_page_length: int = 100, failing_cursor: str = None, **kwargs):
+        super().__init__(quiet=True, **kwargs)
+        self.total = total
+        self.max_page_length = max_page_length
+        self.failing_cursor = failing_cursor
+        self.queries = []
+
+    def graphql_query(self, query_hash, variables, referer=None):
+        self.queries.append(dict(variables))
+        if variables.get('after') is not None and variables['after'] == self.failing_cursor:
+            raise ConnectionException("Connection refused")
+        if variables['first'] > self.max_page_length:
+            raise QueryReturnedBadRequestException("400 Bad Request")
+        start = int(variables.get('after', 0))
+        end = min(start + variables['first'], self.total)
+        return {'edges': [{'node': {'id': index}} for index in range(start, end)],
+                'page_info': {'has_next_page': end < self.total, 'end_cursor': str(end)}}
+
+
+def node_iterator(context, **kwargs):
+    return instaloader.NodeIterator(context, 'hash', lambda data: data, lambda node: node['id'], **kwargs)
+
+
+def test_rejected_page_length_caps_growth():
+    context = PagedContext(total=1000, max_page_length=40)
+    iterator = node_iterator(context)
+    assert [node for node in iterator] == list(range(1000))
+    requested = [query['first'] for query in context.queries]
+    assert requested[:2] == [50, 25]
+    # Grows again after the rejection, but never to a page length that was rejected
+    rejected = [first for first in requested if first > 40]
+    assert len(rejected) == len(set(rejected))
+    assert all(first < 50 for first in requested[1:])
+    assert iterator._page_length_limit == min(rejected) - 1
+
+
+def test_prefetch_starts_at_half_page():
+    context = PagedContext(total=200)
+    iterator = node_iterator(context, prefetch=True)
+    for _ in range(24):
+        next(iterator)
+    assert iterator._prefetched is None
+    next(iterator)
+    iterator._prefetched[1].result()
+    assert [query.get('after') for query in context.queries] == [None, '50']
+    assert [next(iterator) for _ in range(50)] == list(range(25, 75))
+    # The prefetched page was used, and the one after it is not prefetched before its half
+    assert [query.get('after') for query in context.queries] == [None, '50']
+
+
+def test_close_stops_prefetching():
+    context = PagedContext(total=200)
+    iterator = node_iterator(context, prefetch=True)
+    for _ in range(10):
+        next(iterator)
+    iterator.close()
+    assert [next(iterator) for _ in range(40)] == list(range(10, 50))
+    assert [query.get('after') for query in context.queries] == [None]
+
+
+def test_failed_prefetch_is_not_queried_again():
+    context = PagedContext(total=200, failing_cursor='50')
+    iterator = node_iterator(context, prefetch=True)
+    with pytest.raises(ConnectionException):
+        for _ in iterator:
+            pass
+    assert [query.get('after') for query in context.queries] == [None, '50']
+
+
+class SectionsContext(instaloader.InstaloaderContext):
+    """Serves one page with one section of three medias."""
+
+    def __init__(self):
+        super().__init__(quiet=True)
+        self.queries = []
+
+    def get_json(self, path, params, *args, **kwargs):
+        self.queries.append(path)
+        return {'sections': [{'layout_content': {'medias': [{'media': index} for index in range(3)]}}],
+                'more_available': False}
+
+
+def test_section_iterator_queries_first_page_lazily():
+    context = SectionsContext()
+    iterator = instaloader.SectionIterator(context, lambda data: data, lambda media: media, 'explore/locations/1/')
+    assert context.queries == []
+    assert list(iterator) == [0, 1, 2]
+    assert context.queries == ['explore/locations/1/']
+    # Resuming takes the first page from the frozen state
+    frozen = iterator.freeze()
+    resumed = instaloader.SectionIterator(context, lambda data: data, lambda media: media, 'explore/locations/1/')
+    resumed.thaw(frozen)
+    assert list(resumed) == [2]
+    assert context.queries == ['explore/locations/1/']
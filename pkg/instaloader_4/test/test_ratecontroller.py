@@ -0,0 +1,108 @@
+import asyncio
+import random
+import time
+
+import instaloader
+from instaloader.instaloadercontext import RateController, _SlidingWindow
+from instaloader.sharedratecontroller import SharedRateController
+
+
+class SlowRateController(RateController):
+    """Blocks in the bookkeeping, like a SharedRateController waiting for the database lock."""
+
+    def _reserve_query(self, query_type):
+        time.sleep(0.3)
+        return super()._reserve_query(query_type)
+
+
+def test_wait_before_query_async_does_not_block_event_loop():
+    controller = SlowRateController(instaloader.InstaloaderContext(quiet=True))
+    ticks = []
+
+    async def tick():
+        for _ in range(5):
+            ticks.append(time.monotonic())
+            await asyncio.sleep(0.05)
+
+    async def main():
+        started = time.monotonic()
+        await asyncio.gather(controller.wait_before_query_async('other'), tick())
+        return started
+
+    started = asyncio.run(main())
+    # The ticks went on while the reservation was blocked
+    assert ticks[-1] - started < 0.3
+
+
+class ClockedSharedRateController(SharedRateController):
+    now = 1_700_000_000.0
+
+    def _current_time(self):
+        return self.now
+
+
+def test_shared_rate_controller_prunes_expired_rows(tmp_path):
+    context = instaloader.InstaloaderContext(quiet=True)
+    controller = ClockedSharedRateController(context, str(tmp_path / 'ratestate.sqlite3'))
+    controller.wait_before_query('other')
+    with controller._transaction() as connection:
+        connection.execute("INSERT INTO backoff VALUES ('default', ?)", (controller.now + 10,))
+        # Stamped by a clock that was stepped back since
+        connection.execute("INSERT INTO queries (query_type, timestamp) VALUES ('other', ?)",
+                           (controller.now + 3 * controller.retention,))
+    ClockedSharedRateController.now += controller.retention + controller.prune_interval
+    controller.wait_before_query('other')
+    connection = controller._get_connection()
+    assert connection.execute("SELECT timestamp FROM queries").fetchall() == [(controller.now,)]
+    assert connection.execute("SELECT * FROM backoff").fetchall() == []
+    controller.close()
+
+
+def test_sliding_window_matches_list_implementation():
+    # The windows replaced filtering a list of all timestamps on each call
+    rng = random.Random(4711)
+    for length in (10, 600, 1800):
+        window = _SlidingWindow(length)
+        timestamps = []
+        current_time = 0.0
+        for _ in range(2000):
+            current_time += rng.choice((0.0, rng.expovariate(1 / 5), rng.uniform(0, 2 * length)))
+            if rng.random() < 0.6:
+                window.add(current_time)
+                timestamps.append(current_time)
+            in_window = [t for t in timestamps if t > current_time - length]
+            assert window.count(current_time) == len(in_window)
+            assert window.oldest(current_time) == min(in_window, default=current_time)
+
+
+def list_query_waittime(controller, history, query_type, current_time):
+    """query_waittime() as computed from the list of all timestamps before the sliding windows were introduced."""
+    def reqs_in_sliding_window(query_types, length):
+        return [t for qt in query_types for t in history.get(qt, []) if t > current_time - length]
+
+    per_type = reqs_in_sliding_window([query_type], 660)
+    next_request_times = [0.0 if len(per_type) < controller.count_per_sliding_window(query_type)
+                          else min(per_type) + 660 + 6]
+    if query_type not in ('iphone', 'other'):
+        graphql = reqs_in_sliding_window([qt for qt in history if qt not in ('iphone', 'other')], 600)
+        next_request_times.append(0.0 if len(graphql) < 275 else min(graphql) + 600)
+    if query_type == 'iphone':
+        iphone = reqs_in_sliding_window(['iphone'], 1800)
+        if len(iphone) >= 199:
+            next_request_times.append(min(iphone) + 1800 + 18)
+    return max(0.0, max(next_request_times) - current_time)
+
+
+def test_query_waittime_matches_list_implementation():
+    rng = random.Random(1123)
+    controller = RateController(instaloader.InstaloaderContext(quiet=True))
+    history = {}
+    current_time = 0.0
+    for _ in range(5000):
+        current_time += rng.expovariate(1 / 2)
+        query_type = rng.choice(('other', 'iphone', 'abcdef', '123456'))
+        waittime = controller.query_waittime(query_type, current_time)
+        assert waittime == list_query_waittime(controller, history, query_type, current_time)
+        if waittime == 0:
+            controller._record_query(query_type, current_time)
+            history.setdefault(query_type, []).append(current_time)
@@ -0,0 +1,105 @@
+"""Memory use of Posts kept in memory, e.g. to filter or batch a large feed
+
+Builds Posts from synthetic nodes shaped like the ones of a profile or hashtag feed. Needs no network access. Run as
+``python test/test_slots.py [--count N]`` to report the memory they take, as they are and after Post.compact().
+"""
+
+import sys
+import tracemalloc
+from argparse import ArgumentParser
+from pathlib import Path
+
+if __name__ == '__main__':
+    # Import the instaloader package from this source tree, as conftest.py does for the tests
+    sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+import instaloader  # pylint:disable=wrong-import-position
+
+
+def feed_node(index: int) -> dict:
+    """A node as found in a profile feed, including the fields no Post property reads."""
+    return {
+        '__typename': 'GraphSidecar',
+        'id': str(3141592653589793238 + index),
+        'shortcode': instaloader.Post.mediaid_to_shortcode(3141592653589793238 + index),
+        'dimensions': {'height': 1350, 'width': 1080},
+        'display_url': 'https://scontent.cdninstagram.com/v/t51.2885-15/{}_n.jpg?stp=dst-jpg&_nc_ht=x'.format(index),
+        'display_resources': [{'src': 'https://scontent.cdninstagram.com/v/{}_{}.jpg'.format(index, width),
+                               'config_width': width, 'config_height': width * 5 // 4}
+                              for width in (640, 750, 1080)],
+        'thumbnail_src': 'https://scontent.cdninstagram.com/v/t51.2885-15/{}_s.jpg'.format(index),
+        'thumbnail_resources': [{'src': 'https://scontent.cdninstagram.com/v/{}_t{}.jpg'.format(index, width),
+                                 'config_width': width, 'config_height': width}
+                                for width in (150, 240, 320, 480, 640)],
+        'is_video': False,
+        'accessibility_caption': 'Photo by someone on a sunny day.',
+        'edge_media_to_caption': {'edges': [{'node': {'text': 'Caption #{} with #hashtags and @mentions '
+                                                              .format(index) * 4}}]},
+        'edge_media_to_comment': {'count': 12},
+        'edge_media_preview_like': {'count': 345},
+        'edge_media_to_tagged_user': {'edges': []},
+        'edge_sidecar_to_children': {'edges': [
+            {'node': {'display_url': 'https://scontent.cdninstagram.com/v/{}_{}.jpg'.format(index, child),
+                      'is_video': False}}
+            for child in range(3)]},
+        'owner': {'id': '25025320', 'username': 'instagram'},
+        'taken_at_timestamp': 1700000000 + index,
+        'location': None,
+        'comments_disabled': False,
+        'sharing_friction_info': {'should_have_sharing_friction': False, 'bloks_app_url': None},
+        'media_overlay_info': None,
+        'fact_check_overall_rating': None,
+        'fact_check_information': None,
+        'gating_info': None,
+        'media_preview': 'ACoq' + 'x' * 240,
+        'coauthor_producers': [],
+        'pinned_for_users': [],
+        'viewer_can_reshare': True,
+        'clips_music_attribution_info': None,
+    }
+
+
+def measure(count: int, compact: bool) -> int:
+    context = instaloader.InstaloaderContext(quiet=True)
+    tracemalloc.start()
+    posts = [instaloader.Post(context, feed_node(index)) for index in range(count)]
+    if compact:
+        posts = [post.compact() for post in posts]
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    assert all(post.mediacount == 3 for post in posts)
+    return size
+
+
+def test_structures_have_no_instance_dict():
+    context = instaloader.InstaloaderContext(quiet=True)
+    profile = instaloader.Profile(context, {'id': '25025320', 'username': 'instagram'})
+    for structure in (instaloader.Post(context, feed_node(0)), profile,
+                      instaloader.StoryItem(context, {'id': '1', 'taken_at_timestamp': 1700000000}, profile)):
+        assert not hasattr(structure, '__dict__')
+
+
+def test_compact_keeps_compact_fields():
+    post = instaloader.Post(instaloader.InstaloaderContext(quiet=True), feed_node(0))
+    caption = post.caption
+    assert post.compact() is post
+    assert set(post._node) == set(feed_node(0)) & instaloader.Post.COMPACT_FIELDS
+    # The properties read the kept fields, without querying the full metadata
+    assert (post.shortcode, post.caption, post.likes, post.mediacount) == (feed_node(0)['shortcode'], caption, 345, 3)
+
+
+def test_compact_reduces_memory():
+    assert measure(200, compact=True) < 0.8 * measure(200, compact=False)
+
+
+def main():
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument('--count', type=int, default=10000, help="Number of posts")
+    args = parser.parse_args()
+    full = measure(args.count, compact=False)
+    compact = measure(args.count, compact=True)
+    print("{} posts: {:.1f} MiB, compacted {:.1f} MiB ({:.0%} less)".format(
+        args.count, full / 2 ** 20, compact / 2 ** 20, 1 - compact / full))
+
+
+if __name__ == '__main__':
+    main()
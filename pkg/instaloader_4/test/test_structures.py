@@ -0,0 +1,52 @@
+import pytest
+
+import instaloader
+from instaloader.structures import load_structure_from_file, save_structure_to_file
+
+
+def post_node(**fields):
+    return {'__typename': 'GraphImage', 'id': '3141592653589793238', 'shortcode': 'CuWrSwMIWTq',
+            'display_url': 'https://scontent.cdninstagram.com/v/t51/1_n.jpg', 'is_video': False,
+            'taken_at_timestamp': 1700000000, 'owner': {'id': '25025320', 'username': 'instagram'},
+            'edge_media_to_caption': {'edges': [{'node': {'text': 'A caption'}}]}, **fields}
+
+
+@pytest.fixture
+def context():
+    return instaloader.InstaloaderContext(quiet=True)
+
+
+@pytest.mark.parametrize('serializer', instaloader.structures.JSON_SERIALIZERS)
+@pytest.mark.parametrize('suffix', ['json', 'json.xz'])
+def test_round_trip(tmp_path, context, serializer, suffix):
+    post = instaloader.Post(context, post_node())
+    filename = str(tmp_path / 'post.{}'.format(suffix))
+    save_structure_to_file(post, filename, serializer)
+    loaded = load_structure_from_file(context, filename, serializer)
+    assert isinstance(loaded, instaloader.Post)
+    assert loaded._asdict() == post._asdict()
+
+
+def test_zstd_round_trip(tmp_path, context):
+    pytest.importorskip('zstandard')
+    post = instaloader.Post(context, post_node())
+    filename = str(tmp_path / 'post.json.zst')
+    save_structure_to_file(post, filename, compression_level=19)
+    assert load_structure_from_file(context, filename)._asdict() == post._asdict()
+
+
+def test_default_load_keeps_json_semantics(tmp_path, context):
+    # Written by the json module, which orjson reads differently
+    post = instaloader.Post(context, post_node(big_number=2 ** 70, ratio=float('nan')))
+    filename = str(tmp_path / 'post.json')
+    save_structure_to_file(post, filename)
+    node = load_structure_from_file(context, filename)._asdict()
+    assert node['big_number'] == 2 ** 70
+    assert node['ratio'] != node['ratio']
+    # orjson cannot parse NaN, so the opted-in orjson load falls back to the json module
+    assert load_structure_from_file(context, filename, 'orjson')._asdict()['shortcode'] == 'CuWrSwMIWTq'
+
+
+def test_unknown_serializer(tmp_path, context):
+    with pytest.raises(instaloader.InvalidArgumentException):
+        load_structure_from_file(context, str(tmp_path / 'post.json'), 'yaml')
@@ -1,4 +1,7 @@
+import itertools
 import os
+import queue
+import threading
 import time
 import requests
 import asyncio
@@ -6,30 +9,42 @@ import json
 import logging
 from termcolor import colored
 import argparse
+from datetime import datetime, timezone
 from transitions import Machine
+from typing import Optional
 from dotenv import load_dotenv
 from pathlib import Path
-from services.at_downloader import ATDownloader
+from services.at_downloader import ATDownloader, FetchWatermarks
 from tqdm import tqdm
-from scripts.parse_for_instagram import parse, filter_instagram_urls, write_to_file
+from scripts.parse_for_instagram import (parse, filter_instagram_urls, write_to_file, read_records, file_path,
+                                         save_data_file)
 from services.image_service import ImageService
+from services.loader_pool import LoaderPool
+from services.push_service import PushService
+from services.sync_journal import SyncJournal
 from dto.Model import IgRecord
 
 # Load environment variables from .env file
 load_dotenv()
 
+pipeline_queue_size = int(os.getenv("PIPELINE_QUEUE_SIZE", 100))
+
 # Configure logging
 logging.basicConfig(filename='syncer.log', level=logging.ERROR,
                     format='%(asctime)s %(levelname)s:%(message)s')
 
 
 class AutomatedSyncer:
-    states = ['start', 'downloading_data', 'parsing_data', 'downloading_images', 'pushing_images', 'end']
+    states = ['start', 'downloading_data', 'parsing_data', 'downloading_images', 'pushing_images', 'streaming', 'end']
 
-    def __init__(self):
+    def __init__(self, journal: SyncJournal = None, incremental: bool = False, watermarks: FetchWatermarks = None):
         self.downloaded_images = None
-        self.filtered_records = None
         self.raw_data = {}
+        self.journal = journal or SyncJournal()
+        self.resuming = False
+        # Incremental runs only fetch the rows modified since the last complete fetch
+        self.incremental = incremental
+        self.watermarks = watermarks or FetchWatermarks()
         self.machine = Machine(model=self, states=AutomatedSyncer.states, initial='start')
         self.machine.add_transition('start_sync', 'start', 'downloading_data', after='on_downloading_data')
         self.machine.add_transition('parse_data', 'downloading_data', 'parsing_data', after='on_parsing_data')
@@ -37,89 +52,252 @@ class AutomatedSyncer:
                                     after='on_downloading_images')
         self.machine.add_transition('push_images', 'downloading_images', 'pushing_images', after='on_pushing_images')
         self.machine.add_transition('finish', 'pushing_images', 'end', after='on_end')
+        # Streaming mode: fetch, filter, download and push concurrently instead of phase by phase
+        self.machine.add_transition('start_streaming', 'start', 'streaming', after='on_streaming')
+        self.machine.add_transition('finish', 'streaming', 'end', after='on_end')
 
     def start_sync(self):
         print(colored('Starting the automated syncer', 'green'))
+        self.resuming = self.journal.begin('phased')
+        if self.resuming:
+            print(colored(f'Resuming unfinished run: {self.journal.counts()}', 'yellow'))
         self.trigger('start_sync')
 
+    def start_streaming(self):
+        print(colored('Starting the automated syncer in streaming mode', 'green'))
+        self.resuming = self.journal.begin('streaming')
+        if self.resuming:
+            print(colored(f'Resuming unfinished run: {self.journal.counts()}', 'yellow'))
+        self.trigger('start_streaming')
+
+    @staticmethod
+    def airtable_downloader() -> ATDownloader:
+        return ATDownloader(
+            api_key=os.getenv("AIRTABLE_API_KEY"),
+            base_id=os.getenv("AIRTABLE_BASE_ID"),
+            table_name=os.getenv("AIRTABLE_TABLE_NAME"),
+            file_path=file_path
+        )
+
+    def modified_since(self):
+        if not self.incremental:
+            return None
+        return self.watermarks.modified_since(os.getenv("AIRTABLE_BASE_ID"), os.getenv("AIRTABLE_TABLE_NAME"))
+
+    @staticmethod
+    def fetch_partial(fetched: Optional[int]) -> bool:
+        max_items = int(os.getenv("MAX_ITEMS", 20000))
+        # Without a new fetch, or if it stopped at MAX_ITEMS, later rows have not been seen yet
+        return fetched is None or (max_items != -1 and fetched >= max_items)
+
+    def save_watermark(self):
+        """Advance the watermark once every record went through download and push, by the same rule in both modes.
+
+        It is kept while any record has failed, see SyncJournal.watermark."""
+        watermark = self.journal.watermark()
+        if watermark is None:
+            if self.incremental:
+                print(colored('Not advancing the fetch watermark, as records failed or were not fetched', 'yellow'))
+            return
+        self.watermarks.save_watermark(os.getenv("AIRTABLE_BASE_ID"), os.getenv("AIRTABLE_TABLE_NAME"),
+                                       datetime.fromtimestamp(watermark, timezone.utc))
+
+    def record_pushed(self, batch, success: bool, error: str = None):
+        for downloaded_image in batch:
+            self.journal.record_pushed(downloaded_image["external_id"],
+                                       error=None if success else error or "push failed")
+
     def on_downloading_data(self):
         print(colored('Downloading data', 'green'))
-        base_dir = Path(__file__).resolve().parents[1]
-        file_path = base_dir / "downloads" / "json" / "data.json"
-        api_key = os.getenv("AIRTABLE_API_KEY")
-        base_id = os.getenv("AIRTABLE_BASE_ID")
+        if self.resuming and self.journal.fetch_completed:
+            print(colored('Data was fetched by the resumed run already', 'yellow'))
+            self.trigger('parse_data')
+            return
         table_name = os.getenv("AIRTABLE_TABLE_NAME")
+        airtable_downloader = self.airtable_downloader()
 
-        airtable_downloader = ATDownloader(
-            api_key=api_key,
-            base_id=base_id,
-            table_name=table_name,
-            file_path=file_path
+        # Records are written to file while the following pages are fetched
+        data = airtable_downloader.iter_airtable_data(
+            table=table_name,
+            filter_column="Image Link",
+            page_size=int(os.getenv("PAGE_SIZE", 100)),
+            max_items=int(os.getenv("MAX_ITEMS", 20000)),
+            modified_since=self.modified_since()
         )
-
-        # Fetch data with progress bar
-        with tqdm(total=int(os.getenv("MAX_ITEMS", 20000)), desc="Fetching Data") as pbar:
-            data = airtable_downloader.fetch_airtable_data(
-                table=table_name,
-                filter_column="Image Link",
-                page_size=int(os.getenv("PAGE_SIZE", 100)),
-                max_items=int(os.getenv("MAX_ITEMS", 20000))
-            )
-            pbar.update(len(data))
-
-        airtable_downloader.write_to_file(data)
+        # A resumed run overwrites its own partial output without asking
+        fetched = airtable_downloader.write_to_file(tqdm(data, desc="Fetching Data"),
+                                                    overwrite=True if self.resuming else None)
+        self.journal.record_fetched(read_records(file_path), completed=True, partial=self.fetch_partial(fetched))
         self.trigger('parse_data')
 
     def on_parsing_data(self):
         print(colored('Parsing data', 'green'))
-        records = parse()
-
-        # Progress bar for filtering records
-        with tqdm(total=len(records), desc="Filtering Instagram URLs") as pbar:
-            filtered_records = []
-            for record in records:
-                if record.is_instagram_url(record.image_link):
-                    filtered_records.append(record)
-                pbar.update(1)
-
-        write_to_file(filtered_records)
-        self.filtered_records = filtered_records
+        write_to_file(filter_instagram_urls(parse()))
         self.trigger('download_images')
 
     def on_downloading_images(self):
-        image_service = ImageService(self.filtered_records)
-        downloaded_images = image_service.process()
-        self.downloaded_images = downloaded_images
+        downloaded_images = {}
+        record_ids = []
+        pending_records = []
+        skipped = 0
+        # Failed records of earlier runs are retried, even if this run did not fetch them again
+        for record in itertools.chain(read_records(save_data_file), self.journal.retry_records()):
+            if self.journal.is_pushed(record.id):
+                skipped += 1
+                continue
+            record_ids.append(record.id)
+            downloaded_image = self.journal.downloaded_result(record.id)
+            if downloaded_image is not None:
+                downloaded_images[record.id] = downloaded_image
+                skipped += 1
+            else:
+                pending_records.append(record)
+        if skipped:
+            print(colored(f'Skipping {skipped} records downloaded by the resumed run', 'yellow'))
+        image_service = ImageService(pending_records)
+        for downloaded_image in image_service.process():
+            self.journal.record_downloaded(downloaded_image)
+            downloaded_images[downloaded_image["external_id"]] = downloaded_image
+        self.downloaded_images = [downloaded_images[record_id] for record_id in record_ids
+                                  if record_id in downloaded_images]
         self.trigger('push_images')
 
     def on_pushing_images(self):
         print(colored('Pushing images to platform', 'green'))
-        header = {
-            'Content-Type': 'application/json',
-            'Authorization': f'Token {os.getenv("AUTHORIZATION_TOKEN")}'
-        }
-        url = "https://api.dev.gastromind.co/api/v1/products/update_asset/"
-
         success = True
 
         with tqdm(total=len(self.downloaded_images), desc="Pushing Images", ncols=100,
-                  bar_format='{l_bar}{bar}| {n_fmt}/{total_fmt} [{elapsed}<{remaining}, {rate_fmt}] {postfix}') as pbar:
+                  bar_format='{l_bar}{bar}| {n_fmt}/{total_fmt} [{elapsed}<{remaining}, {rate_fmt}] {postfix}') as pbar, \
+                PushService() as pusher:
             for downloaded_image in self.downloaded_images:
-                jsonData = json.dumps(downloaded_image, indent=4)
-                response = requests.post(url=url, headers=header, data=jsonData)
-                if response.status_code != 200:
-                    logging.error(f"Error pushing data to platform: {downloaded_image}")
-                    logging.error(response.text)
-                    pbar.set_postfix(status='X')  # Show failure indicator
+                if 'error' in downloaded_image:
+                    logging.error(f"Skipping push of failed download: {downloaded_image}")
+                    pbar.set_postfix(status='X')
                     success = False
-                else:
-                    pbar.set_postfix(status='✓')  # Show success indicator
-                pbar.update(1)
+                    pbar.update(1)
+            for batch, pushed in pusher.push(downloaded_image for downloaded_image in self.downloaded_images
+                                             if 'error' not in downloaded_image):
+                self.record_pushed(batch, pushed)
+                pbar.set_postfix(status='✓' if pushed else 'X')  # Show success or failure indicator
+                success = success and pushed
+                pbar.update(len(batch))
 
         if not success:
             print(colored('Some images failed to push.', 'red'))
 
         self.trigger('finish')
 
+    def on_streaming(self):
+        """Run Airtable fetch -> URL filter -> download -> push as a pipeline.
+
+        Stages are connected by bounded queues, so records are pushed while later Airtable pages are still being
+        fetched, and memory use does not grow with the size of the table."""
+        print(colored('Streaming records to platform', 'green'))
+        records = queue.Queue(maxsize=pipeline_queue_size)
+        downloaded_images = queue.Queue(maxsize=pipeline_queue_size)
+        loader_pool = LoaderPool()
+        pusher = PushService()
+        image_service = ImageService([], loader_pool=loader_pool)
+        download_workers = image_service.max_workers
+        lock = threading.Lock()
+        failed = 0
+
+        def download_stage():
+            while (record := records.get()) is not None:
+                try:
+                    link = image_service.shortcode_of(record)
+                    downloaded_image = image_service.download_image(link['shortcode'], record.id, link['img_index'])
+                except Exception as e:
+                    logging.error(f"Error downloading image for record {record.id} ({record.image_link}): {e}")
+                    downloaded_image = {"external_id": record.id, "error": str(e)}
+                self.journal.record_downloaded(downloaded_image)
+                downloaded_images.put(downloaded_image)
+
+        def push_stage():
+            nonlocal failed
+            done = False
+            while not done:
+                # Push what is queued, up to one batch, without waiting for more than the first item
+                batch = []
+                while len(batch) < pusher.batch_size:
+                    try:
+                        downloaded_image = downloaded_images.get(block=not batch)
+                    except queue.Empty:
+                        break
+                    if downloaded_image is None:
+                        done = True
+                        break
+                    batch.append(downloaded_image)
+                skipped = [downloaded_image for downloaded_image in batch if 'error' in downloaded_image]
+                for downloaded_image in skipped:
+                    logging.error(f"Skipping push of failed download: {downloaded_image}")
+                batch = [downloaded_image for downloaded_image in batch if 'error' not in downloaded_image]
+                error = None
+                try:
+                    success = pusher.push_batch(batch) if batch else True
+                except Exception as e:
+                    # Go on with the next batch: without this stage, the download workers would block on the queue
+                    logging.error(f"Error pushing batch {batch}: {e}")
+                    success, error = False, str(e)
+                self.record_pushed(batch, success, error)
+                with lock:
+                    failed += len(skipped) + (0 if success else len(batch))
+                    pbar.set_postfix(status='✓' if success and not skipped else 'X')
+                    pbar.update(len(skipped) + len(batch))
+
+        def enqueue(record: IgRecord):
+            if self.journal.is_pushed(record.id):
+                return
+            downloaded_image = self.journal.downloaded_result(record.id)
+            if downloaded_image is not None:
+                # Downloaded by the resumed run, only the push is left
+                downloaded_images.put(downloaded_image)
+            else:
+                records.put(record)
+
+        downloaders = [threading.Thread(target=download_stage, name=f"download-{i}")
+                       for i in range(download_workers)]
+        pushers = [threading.Thread(target=push_stage, name=f"push-{i}") for i in range(pusher.max_workers)]
+        fetched = 0
+        with tqdm(desc="Pushing Images", ncols=100) as pbar:
+            for thread in downloaders + pushers:
+                thread.start()
+            try:
+                for record in self.airtable_downloader().iter_airtable_data(
+                        table=os.getenv("AIRTABLE_TABLE_NAME"),
+                        filter_column="Image Link",
+                        page_size=int(os.getenv("PAGE_SIZE", 100)),
+                        max_items=int(os.getenv("MAX_ITEMS", 20000)),
+                        modified_since=self.modified_since()):
+                    fetched += 1
+                    if not record.is_syncable:
+                        continue
+                    self.journal.record_fetched([record])
+                    enqueue(record)
+                self.journal.record_fetched([], completed=True, partial=self.fetch_partial(fetched))
+                # Failed records of earlier runs are retried, even if this run did not fetch them again
+                for record in self.journal.retry_records():
+                    enqueue(record)
+            finally:
+                # Shut the stages down in order, once everything before them has been processed
+                for _ in downloaders:
+                    records.put(None)
+                for thread in downloaders:
+                    thread.join()
+                for _ in pushers:
+                    downloaded_images.put(None)
+                for thread in pushers:
+                    thread.join()
+                loader_pool.close()
+                pusher.close()
+
+        if failed:
+            print(colored(f'{failed} images failed to download or push.', 'red'))
+
+        self.trigger('finish')
+
     def on_end(self):
-        print(colored('Automated syncer has finished', 'green'))
+        # Only now that every fetched record went through download and push, later runs may skip them
+        self.save_watermark()
+        self.journal.finish()
+        print(colored(f'Automated syncer has finished: {self.journal.counts()}', 'green'))
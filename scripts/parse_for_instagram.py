@@ -1,40 +1,46 @@
-import json
-from typing import List
+from typing import Iterable, Iterator
+import orjson
 from dto.Model import IgRecord as ImageRecord
 from pathlib import Path
 import os
-from termcolor import colored
 from tqdm import tqdm
 
 base_dir = Path(__file__).resolve().parents[1]
-file_path = base_dir / "downloads" / "json" / "data.json"
-save_data_file = base_dir / "downloads" / "json" / "instagram.json"
+# Intermediate files are JSON Lines, one record per line, so they are written and read as streams
+file_path = base_dir / "downloads" / "json" / "data.jsonl"
+save_data_file = base_dir / "downloads" / "json" / "instagram.jsonl"
 
 
-def parse() -> List[ImageRecord]:
+def read_records(path) -> Iterator[ImageRecord]:
+    with open(path, 'rb') as file:
+        for line in file:
+            if not line.strip():
+                continue
+            record = orjson.loads(line)
+            _id = record.get('id')
+            image_link = record.get('image_link')
+            if _id and image_link:
+                yield ImageRecord(id=_id, image_link=image_link)
+
+
+def parse() -> Iterator[ImageRecord]:
     try:
-        with open(file_path, 'r') as file:
-            data = json.load(file)
-            records = []
-            for record in tqdm(data, desc="Parsing Data"):
-                _id = record.get('id')
-                image_link = record.get('image_link')
-                if _id and image_link:
-                    records.append(ImageRecord(id=_id, image_link=image_link))
-            return records
+        yield from tqdm(read_records(file_path), desc="Parsing Data")
     except Exception as e:
         print(f"An error occurred while parsing the JSON file: {e}")
-        return []
 
 
-def filter_instagram_urls(data: List[ImageRecord]) -> List[ImageRecord]:
-    return [record for record in tqdm(data, desc="Filtering Instagram URLs") if
-            record.is_instagram_url(record.image_link)]
+def filter_instagram_urls(data: Iterable[ImageRecord]) -> Iterator[ImageRecord]:
+    return (record for record in tqdm(data, desc="Filtering Instagram URLs") if record.is_syncable)
 
 
-def write_to_file(data: List[ImageRecord]) -> bool:
+def write_to_file(data: Iterable[ImageRecord]) -> int:
+    """Write the records to save_data_file as they come and return their number."""
     os.makedirs(os.path.dirname(save_data_file), exist_ok=True)
-    with open(save_data_file, 'w') as f:
-        json.dump([record.dict() for record in data], f, indent=4)
+    count = 0
+    with open(save_data_file, 'wb') as f:
+        for record in data:
+            f.write(orjson.dumps(record.model_dump(), option=orjson.OPT_APPEND_NEWLINE))
+            count += 1
 
-    return True
+    return count
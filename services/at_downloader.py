@@ -1,9 +1,56 @@
-import json
+import configparser
 import os
-from typing import List
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Iterable, Iterator, List, Optional
+import orjson
 from airtable import Airtable
 from termcolor import colored
 from dto.Model import IgRecord as ImageRecord
+from dotenv import load_dotenv
+
+# Load environment variables from .env file
+load_dotenv()
+
+watermark_file = (os.getenv("AIRTABLE_WATERMARK_FILE") or
+                  str(Path(__file__).resolve().parents[1] / "cache" / "airtable_watermarks.ini"))
+
+
+class FetchWatermarks:
+    """Start time of the last complete fetch per Airtable table, stored like instaloader's LatestStamps.
+
+    Rows modified after it are the only ones an incremental fetch has to request. As the watermark is taken from
+    our clock, fetches look back OVERLAP further, so that clock skew to Airtable cannot make them miss rows."""
+    WATERMARK = 'last-fetch'
+    ISO_FORMAT = '%Y-%m-%dT%H:%M:%S.%f%z'
+    OVERLAP = timedelta(minutes=5)
+
+    def __init__(self, file: str = None):
+        self.file = file or watermark_file
+        self.data = configparser.ConfigParser()
+        self.data.read(self.file)
+
+    def get_watermark(self, base_id: str, table: str) -> Optional[datetime]:
+        """Returns the start time of the last complete fetch of the table."""
+        try:
+            return datetime.strptime(self.data.get(f"{base_id}/{table}", self.WATERMARK), self.ISO_FORMAT)
+        except (configparser.Error, ValueError):
+            return None
+
+    def modified_since(self, base_id: str, table: str) -> Optional[datetime]:
+        """Returns the time after which modified rows have to be fetched, or None if all have to be."""
+        watermark = self.get_watermark(base_id, table)
+        return watermark - self.OVERLAP if watermark is not None else None
+
+    def save_watermark(self, base_id: str, table: str, timestamp: datetime):
+        """Stores the start time of a complete fetch of the table."""
+        section = f"{base_id}/{table}"
+        if not self.data.has_section(section):
+            self.data.add_section(section)
+        self.data.set(section, self.WATERMARK, timestamp.strftime(self.ISO_FORMAT))
+        os.makedirs(os.path.dirname(self.file) or ".", exist_ok=True)
+        with open(self.file, 'w') as f:
+            self.data.write(f)
 
 
 class ATDownloader:
@@ -17,29 +64,54 @@ class ATDownloader:
     def connect_airtable(self):
         return self.airtable
 
-    def fetch_airtable_data(self, table, filter_column, page_size, max_items) -> List[ImageRecord]:
-        formula = f"NOT({{{filter_column}}} = '')" if filter_column else None
+    def fetch_airtable_data(self, table, filter_column, page_size, max_items,
+                            modified_since: datetime = None) -> List[ImageRecord]:
+        return list(self.iter_airtable_data(table, filter_column, page_size, max_items, modified_since))
+
+    def iter_airtable_data(self, table, filter_column, page_size, max_items,
+                           modified_since: datetime = None) -> Iterator[ImageRecord]:
+        """Yield the records page by page, as Airtable returns them.
+
+        With modified_since, only rows whose filter_column (or, without one, any field) was modified after that
+        time are requested."""
+        conditions = []
+        if filter_column:
+            conditions.append(f"NOT({{{filter_column}}} = '')")
+        if modified_since is not None:
+            last_modified = f"LAST_MODIFIED_TIME({{{filter_column}}})" if filter_column else "LAST_MODIFIED_TIME()"
+            conditions.append(f"IS_AFTER({last_modified}, DATETIME_PARSE('{modified_since.isoformat()}'))")
+        if len(conditions) > 1:
+            formula = f"AND({', '.join(conditions)})"
+        else:
+            formula = conditions[0] if conditions else None
         fields = ["Id"]
         if filter_column and filter_column not in fields:
             fields.append(filter_column)
 
-        records = []
         total_fetched = 0
         for record in self.airtable.iterate(table_name=table, batch_size=page_size, filter_by_formula=formula,
                                             fields=fields):
-            records.append(record)
+            yield ImageRecord(id=record["id"], image_link=record["fields"].get(filter_column, ""))
             total_fetched += 1
             if max_items != -1 and total_fetched >= max_items:
                 break
 
-        return [ImageRecord(id=record["id"], image_link=record["fields"].get(filter_column, "")) for record in records]
+    def write_to_file(self, data: Iterable[ImageRecord], overwrite: bool = None) -> Optional[int]:
+        """Write the records to file_path as JSON Lines, consuming data as it comes, and return their number.
 
-    def write_to_file(self, data: List[ImageRecord]):
+        If the file exists, overwrite decides whether to replace it; by default the user is asked. If it is kept,
+        data is not consumed and None is returned."""
         os.makedirs(os.path.dirname(self.file_path), exist_ok=True)
         if os.path.exists(self.file_path):
-            confirmation = input(colored("File already exists. Do you want to overwrite it? (y/n): ", 'yellow'))
-            if confirmation.lower() != 'y':
-                return
+            if overwrite is None:
+                confirmation = input(colored("File already exists. Do you want to overwrite it? (y/n): ", 'yellow'))
+                overwrite = confirmation.lower() == 'y'
+            if not overwrite:
+                return None
 
-        with open(self.file_path, 'w') as f:
-            json.dump([record.dict() for record in data], f, indent=4)
+        count = 0
+        with open(self.file_path, 'wb') as f:
+            for record in data:
+                f.write(orjson.dumps(record.model_dump(), option=orjson.OPT_APPEND_NEWLINE))
+                count += 1
+        return count
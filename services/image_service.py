@@ -1,9 +1,10 @@
 import logging
 import os
-from dto.Model import IgRecord
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dto.Model import IgRecord, InstagramLink, InvalidLinkError, classify_records, shortcode_from_link
 from typing import List
-from urllib.parse import urlparse, parse_qs
 from pkg.instaloader_4 import instaloader
+from services.loader_pool import LoaderPool
 from pathlib import Path
 from dotenv import load_dotenv
 from tqdm import tqdm
@@ -12,6 +13,7 @@ from tqdm import tqdm
 load_dotenv()
 
 max_image_download_limit = int(os.getenv("DOWNLOAD_IMAGE_LIMIT", 50))
+max_download_workers = int(os.getenv("DOWNLOAD_WORKERS", 4))
 server_host = os.getenv("SERVER_HOST", "localhost")
 
 # Configure logging
@@ -24,27 +26,64 @@ logging.basicConfig(filename='syncer.log', level=logging.INFO,
 
 
 class ImageService:
-    def __init__(self, items: List[IgRecord]):
+    def __init__(self, items: List[IgRecord], max_workers: int = None, loader_pool: LoaderPool = None):
         self.items = items
         self.shortCodeList = {}
+        # Records whose links were rejected without any network access, with the reason
+        self.rejected = {}
         self.base_dir = Path(__file__).resolve().parents[1]
+        self.max_workers = max(1, max_workers or max_download_workers)
+        self.loader_pool = loader_pool
 
-    def process(self):
+    @staticmethod
+    def shortcode_of(item: IgRecord, link: InstagramLink = None) -> dict:
+        """:raises InvalidLinkError: If the record does not link to a post or reel."""
+        link = link or item.link
+        return {'shortcode': shortcode_from_link(link, item.image_link), 'img_index': link.img_index}
+
+    def collect_shortcodes(self):
+        links = classify_records(self.items)
         for item in self.items:
-            parsed_url = urlparse(item.image_link)
-            query_params = parse_qs(parsed_url.query)
-            img_index = query_params.get('img_index', [None])[0]
-            shortcode = item.image_link.split("/")[-2]
-            self.shortCodeList[item.id] = {'shortcode': shortcode, 'img_index': img_index}
-        return self.parse()
+            try:
+                self.shortCodeList[item.id] = self.shortcode_of(item, links[item.id])
+            except InvalidLinkError as e:
+                logging.error(f"Rejecting record {item.id}: {e}")
+                self.rejected[item.id] = str(e)
+        return self.shortCodeList
+
+    def process(self):
+        self.collect_shortcodes()
+        if self.loader_pool is not None:
+            return self.parse()
+        # Without a pool owned by the caller, use a private one for this batch
+        self.loader_pool = LoaderPool(size=self.max_workers)
+        try:
+            return self.parse()
+        finally:
+            self.loader_pool.close()
+            self.loader_pool = None
 
     def parse(self):
-        recordList = []
-        with tqdm(total=len(self.shortCodeList), desc="Downloading Images") as pbar:
-            for recordID, record in self.shortCodeList.items():
-                shortcode = record['shortcode']
-                img_index = record['img_index']
-                recordList.append(self.download_image(shortcode, recordID, img_index))
+        # Results are in the order of the records, with rejected records at their places
+        order = list(dict.fromkeys(item.id for item in self.items
+                                   if item.id in self.shortCodeList or item.id in self.rejected))
+        recordList = [{"external_id": recordID, "error": self.rejected[recordID]} if recordID in self.rejected
+                      else None for recordID in order]
+        with tqdm(total=len(self.shortCodeList), desc="Downloading Images") as pbar, \
+                ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = {executor.submit(self.download_image, self.shortCodeList[recordID]['shortcode'], recordID,
+                                       self.shortCodeList[recordID]['img_index']): index
+                       for index, recordID in enumerate(order) if recordID not in self.rejected}
+            for future in as_completed(futures):
+                index = futures[future]
+                recordID = order[index]
+                try:
+                    recordList[index] = future.result()
+                except Exception as e:
+                    # A failing record must not abort the rest of the batch
+                    logging.error(f"Error downloading image for record {recordID} "
+                                  f"({self.shortCodeList[recordID]['shortcode']}): {e}")
+                    recordList[index] = {"external_id": recordID, "error": str(e)}
                 pbar.update(1)
         return recordList
 
@@ -58,21 +97,20 @@ class ImageService:
 
         os.makedirs(image_dir, exist_ok=True)
 
-        L = instaloader.Instaloader()
-        post = instaloader.Post.from_shortcode(L.context, shortcode)
-        filename = f"{shortcode}"
-
-        if img_index is not None and post.typename == "GraphSidecar":
-            nodes = list(post.get_sidecar_nodes())
-            img_index = int(img_index)
-            if img_index <= len(nodes):
-                node = nodes[img_index - 1]
-                filename = f"{shortcode}_{img_index}"
-                L.download_pic(filename=str(image_dir / filename), url=node.display_url, mtime=post.date_local)
+        with self.loader_pool.borrow() as L:
+            post = instaloader.Post.from_shortcode(L.context, shortcode)
+            filename = f"{shortcode}"
+
+            if img_index is not None and post.typename == "GraphSidecar":
+                img_index = int(img_index)
+                if 1 <= img_index <= post.mediacount:
+                    node = post.get_sidecar_node(img_index - 1)
+                    filename = f"{shortcode}_{img_index}"
+                    L.download_pic(filename=str(image_dir / filename), url=node.display_url, mtime=post.date_local)
+                else:
+                    raise ValueError(f"Invalid img_index {img_index} for post with shortcode {shortcode}")
             else:
-                raise ValueError(f"Invalid img_index {img_index} for post with shortcode {shortcode}")
-        else:
-            L.download_pic(filename=str(image_dir / filename), url=post.url, mtime=post.date_local)
+                L.download_pic(filename=str(image_dir / filename), url=post.url, mtime=post.date_local)
 
         imageURL = f"http://{server_host}/downloads/images/{shortcode}/{filename}"
         return {"asset_file_url": imageURL, "external_id": recordID}
@@ -0,0 +1,216 @@
+import logging
+import os
+import shutil
+import threading
+import time
+import uuid
+from concurrent.futures import CancelledError, Future, ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+from dto.Model import IgRecord
+from services.image_service import ImageService
+from services.loader_pool import LoaderPool
+from services.post_service import PostService, server_host
+from dotenv import load_dotenv
+
+# Load environment variables from .env file
+load_dotenv()
+
+max_job_workers = int(os.getenv("JOB_WORKERS", os.getenv("DOWNLOAD_WORKERS", 4)))
+job_retention_seconds = int(os.getenv("JOB_RETENTION_SECONDS", 3600))
+
+
+class Job:
+    """Progress and results of one bulk request, filled in by the JobManager's workers."""
+
+    def __init__(self, kind: str, record_ids: List[str]):
+        self.id = str(uuid.uuid4())
+        self.kind = kind
+        self.created_at = time.time()
+        self.finished_at: Optional[float] = None
+        self.records = {record_id: {"status": "pending"} for record_id in record_ids}
+        self.result = None
+        self.error: Optional[str] = None
+        self._lock = threading.Lock()
+
+    def set_record(self, record_id: str, status: str, **fields) -> bool:
+        """Store the outcome of one record. Returns True if this was the last pending record."""
+        with self._lock:
+            self.records[record_id] = {"status": status, **fields}
+            return not self._counts()["pending"]
+
+    def done_records(self) -> Dict[str, dict]:
+        """The records that are done, by id."""
+        with self._lock:
+            return {record_id: record for record_id, record in self.records.items() if record["status"] == "done"}
+
+    def finish(self, result=None, error: str = None):
+        with self._lock:
+            self.result = result
+            self.error = error
+            self.finished_at = time.time()
+
+    def _counts(self) -> Dict[str, int]:
+        counts = {"done": 0, "failed": 0, "pending": 0}
+        for record in self.records.values():
+            counts[record["status"]] += 1
+        return counts
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            return {
+                "job_id": self.id,
+                "kind": self.kind,
+                "status": "completed" if self.finished_at is not None else "running",
+                **self._counts(),
+                "result": self.result,
+                "error": self.error,
+                "records": [{"external_id": record_id, **record} for record_id, record in self.records.items()],
+            }
+
+
+class JobManager:
+    """Runs bulk image/post requests in the background.
+
+    Downloads are deduplicated by shortcode: while a download for a shortcode is queued or running, further
+    records asking for the same media - from the same or from concurrent jobs - share its result instead of
+    downloading it again.
+    """
+
+    def __init__(self, loader_pool: LoaderPool, max_workers: int = None):
+        self.loader_pool = loader_pool
+        self.executor = ThreadPoolExecutor(max_workers=max(1, max_workers or max_job_workers),
+                                           thread_name_prefix="job")
+        self.jobs: Dict[str, Job] = {}
+        self._in_flight: Dict[Tuple, Future] = {}
+        # Reentrant, as a future that is already done runs its callback (_forget) right away
+        self._lock = threading.RLock()
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self.jobs.get(job_id)
+
+    def _add_job(self, job: Job):
+        with self._lock:
+            expired = [job_id for job_id, other in self.jobs.items()
+                       if other.finished_at is not None and time.time() - other.finished_at > job_retention_seconds]
+            for job_id in expired:
+                del self.jobs[job_id]
+            self.jobs[job.id] = job
+
+    def _shared(self, key: Tuple, fn: Callable, *args) -> Future:
+        """Return the in-flight future for key, or submit fn(*args) as a new one."""
+        with self._lock:
+            future = self._in_flight.get(key)
+            if future is None:
+                future = self.executor.submit(fn, *args)
+                self._in_flight[key] = future
+                future.add_done_callback(lambda _: self._forget(key, future))
+            return future
+
+    def _forget(self, key: Tuple, future: Future):
+        with self._lock:
+            if self._in_flight.get(key) is future:
+                del self._in_flight[key]
+
+    def submit_images(self, items: List[IgRecord]) -> Job:
+        service = ImageService(items, loader_pool=self.loader_pool)
+        records = service.collect_shortcodes()
+        job = Job("image", list(records) + list(service.rejected))
+        self._add_job(job)
+        self._reject(job, service.rejected)
+        if not records:
+            job.finish()
+        for recordID, record in records.items():
+            key = ("image", record['shortcode'], record['img_index'])
+            future = self._shared(key, service.download_image, record['shortcode'], recordID, record['img_index'])
+            future.add_done_callback(lambda f, recordID=recordID: self._image_done(job, recordID, f))
+        return job
+
+    @staticmethod
+    def _reject(job: Job, rejected: Dict[str, str]):
+        # Invalid links are reported right away, they never reach a worker
+        for recordID, error in rejected.items():
+            job.set_record(recordID, "failed", error=error)
+
+    def _image_done(self, job: Job, recordID: str, future: Future):
+        try:
+            # The shared result may belong to another record, so the external id is replaced
+            result = {**future.result(), "external_id": recordID}
+            last = job.set_record(recordID, "done", asset_file_url=result["asset_file_url"])
+        except CancelledError:
+            last = job.set_record(recordID, "failed", error="Cancelled on shutdown")
+        except Exception as e:
+            logging.error(f"Job {job.id}: error downloading image for record {recordID}: {e}")
+            last = job.set_record(recordID, "failed", error=str(e))
+        if last:
+            job.finish(result=[{"external_id": record_id, "asset_file_url": record["asset_file_url"]}
+                               for record_id, record in job.done_records().items()])
+
+    def submit_posts(self, items: List[IgRecord]) -> Job:
+        service = PostService(items, loader_pool=self.loader_pool)
+        records = service.collect_shortcodes()
+        service.check_limit()
+        job = Job("post", list(records) + list(service.rejected))
+        self._add_job(job)
+        self._reject(job, service.rejected)
+        if not records:
+            self._finish_posts(job, service)
+        for recordID, shortcode in records.items():
+            future = self._shared(("post", shortcode), self._download_post, service, shortcode, recordID)
+            future.add_done_callback(lambda f, recordID=recordID: self._post_done(job, service, recordID, f))
+        return job
+
+    @staticmethod
+    def _download_post(service: PostService, shortcode: str, recordID: str):
+        directory = service.base_dir / 'downloads' / 'posts' / recordID
+        # A post that has been downloaded completely before costs no query
+        if service.is_downloaded(recordID):
+            return directory
+        if not service.download_post(shortcode, recordID):
+            raise RuntimeError(f"Downloading post {shortcode} failed")
+        return directory
+
+    def _post_done(self, job: Job, service: PostService, recordID: str, future: Future):
+        try:
+            source = future.result()
+        except CancelledError:
+            self._post_record_done(job, service, recordID, error="Cancelled on shutdown")
+            return
+        except Exception as e:
+            self._post_record_done(job, service, recordID, error=str(e))
+            return
+        target = service.base_dir / 'downloads' / 'posts' / recordID
+        if source == target:
+            self._post_record_done(job, service, recordID)
+            return
+        # Shared download of another record: copy it, in a worker rather than in this callback
+        try:
+            copy = self.executor.submit(shutil.copytree, source, target, dirs_exist_ok=True)
+        except RuntimeError:
+            # The executor has been shut down
+            self._post_record_done(job, service, recordID, error="Cancelled on shutdown")
+            return
+        copy.add_done_callback(lambda f: self._post_record_done(
+            job, service, recordID, error="Cancelled on shutdown" if f.cancelled() else
+            str(f.exception()) if f.exception() else None))
+
+    def _post_record_done(self, job: Job, service: PostService, recordID: str, error: str = None):
+        if error:
+            logging.error(f"Job {job.id}: error downloading post for record {recordID}: {error}")
+            last = job.set_record(recordID, "failed", error=error)
+        else:
+            last = job.set_record(recordID, "done")
+        if last:
+            self._finish_posts(job, service)
+
+    @staticmethod
+    def _finish_posts(job: Job, service: PostService):
+        # The zip itself is streamed on request, see iter_post_zip()
+        job.finish(result=f"http://{server_host}/jobs/{job.id}/zip")
+
+    def iter_post_zip(self, job: Job):
+        return PostService([]).iter_zip(list(job.done_records()))
+
+    def close(self):
+        """Cancel the queued downloads and wait for the running ones, which use the loader pool until they end."""
+        self.executor.shutdown(wait=True, cancel_futures=True)
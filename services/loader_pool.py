@@ -0,0 +1,124 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import List
+from pkg.instaloader_4 import instaloader
+from dotenv import load_dotenv
+
+# Load environment variables from .env file
+load_dotenv()
+
+loader_pool_size = int(os.getenv("LOADER_POOL_SIZE", os.getenv("DOWNLOAD_WORKERS", 4)))
+loader_acquire_timeout = float(os.getenv("LOADER_ACQUIRE_TIMEOUT", 300))
+# Outside of downloads/, which is served publicly, yet on the same file system so that media can be hardlinked
+media_store_dir = (os.getenv("MEDIA_STORE_DIR") or
+                   str(Path(__file__).resolve().parents[1] / "cache" / "media_store"))
+metadata_cache_path = (os.getenv("METADATA_CACHE_PATH") or
+                       str(Path(__file__).resolve().parents[1] / "cache" / "metadata.sqlite3"))
+metadata_cache_ttl = int(os.getenv("METADATA_CACHE_TTL", 12 * 60 * 60))
+metadata_cache_max_size = int(os.getenv("METADATA_CACHE_MAX_SIZE", 256 * 1024 * 1024))
+rate_state_path = (os.getenv("RATE_STATE_PATH") or
+                   str(Path(__file__).resolve().parents[1] / "cache" / "ratestate.sqlite3"))
+
+
+class LoaderPool:
+    """Thread-safe pool of Instaloader instances.
+
+    Loaders are created lazily up to ``size`` and handed out one at a time via :meth:`borrow`, so their
+    sessions, open connections and caches survive across records. All loaders share one RateController,
+    which makes the sliding-window rate limiting apply to everything that goes through the pool - and, as
+    its state lives in RATE_STATE_PATH, also to the other server workers and syncer runs on this host, one
+    MediaStore, so media shared by several records is downloaded and stored only once, and one persistent
+    MetadataCache, so posts fetched before do not cost a GraphQL query again.
+
+    Borrowing waits at most LOADER_ACQUIRE_TIMEOUT seconds for a loader to be returned. :meth:`close` closes the
+    idle loaders right away and the borrowed ones when they are returned.
+    """
+
+    def __init__(self, size: int = None, **loader_kwargs):
+        self.size = max(1, size or loader_pool_size)
+        loader_kwargs.setdefault("media_store", instaloader.MediaStore(media_store_dir))
+        self._metadata_cache = None
+        if "metadata_cache" not in loader_kwargs:
+            self._metadata_cache = instaloader.MetadataCache(metadata_cache_path, ttl=metadata_cache_ttl,
+                                                             max_size=metadata_cache_max_size)
+            loader_kwargs["metadata_cache"] = self._metadata_cache
+        self.loader_kwargs = loader_kwargs
+        self.rate_controller = None
+        self.acquire_timeout = loader_acquire_timeout
+        self._idle: List[instaloader.Instaloader] = []
+        self._loaders: List[instaloader.Instaloader] = []
+        self._borrowed = 0
+        self._lock = threading.Lock()
+        self._returned = threading.Condition(self._lock)
+        self._closed = False
+
+    def _get_rate_controller(self, context) -> instaloader.RateController:
+        # Called from Instaloader.__init__ while self._lock is held
+        if self.rate_controller is None:
+            self.rate_controller = instaloader.SharedRateController(context, rate_state_path)
+        return self.rate_controller
+
+    def _acquire(self) -> instaloader.Instaloader:
+        deadline = time.monotonic() + self.acquire_timeout
+        with self._lock:
+            while True:
+                if self._closed:
+                    raise RuntimeError("LoaderPool is closed")
+                if self._idle:
+                    loader = self._idle.pop()
+                    break
+                if len(self._loaders) < self.size:
+                    loader = instaloader.Instaloader(rate_controller=self._get_rate_controller, **self.loader_kwargs)
+                    self._loaders.append(loader)
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise TimeoutError(f"No loader was returned to the pool within {self.acquire_timeout} s")
+                # Woken up by a returned loader or by close()
+                self._returned.wait(remaining)
+            self._borrowed += 1
+            return loader
+
+    def _release(self, loader: instaloader.Instaloader):
+        with self._lock:
+            self._borrowed -= 1
+            if not self._closed:
+                self._idle.append(loader)
+                self._returned.notify()
+                return
+            self._loaders.remove(loader)
+            loader.close()
+            if not self._borrowed:
+                self._close_shared()
+
+    @contextmanager
+    def borrow(self):
+        """Borrow a loader for the duration of the with-block."""
+        loader = self._acquire()
+        try:
+            yield loader
+        finally:
+            self._release(loader)
+
+    def _close_shared(self):
+        # Called with self._lock held, once no loader uses them anymore
+        if self.rate_controller is not None:
+            self.rate_controller.close()
+        if self._metadata_cache is not None:
+            self._metadata_cache.close()
+
+    def close(self):
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._returned.notify_all()
+            for loader in self._idle:
+                self._loaders.remove(loader)
+                loader.close()
+            self._idle.clear()
+            if not self._borrowed:
+                self._close_shared()
@@ -1,13 +1,15 @@
+import io
+import logging
 import shutil
 import os
 import zipfile
 from datetime import datetime
-import uuid
 from pathlib import Path
 from pkg.instaloader_4 import instaloader
 import contextlib
-from typing import List
-from dto.Model import IgRecord
+from typing import Iterable, Iterator, List
+from dto.Model import IgRecord, InvalidLinkError, classify_records, shortcode_from_link
+from services.loader_pool import LoaderPool
 from dotenv import load_dotenv
 
 # Load environment variables from .env file
@@ -16,30 +18,74 @@ load_dotenv()
 max_image_download_limit = os.getenv("DOWNLOAD_IMAGE_LIMIT", 50) or 50
 server_host = os.getenv("SERVER_HOST", "localhost:8000") or "localhost:8000"
 
+# Payloads that are already compressed gain nothing from deflate
+stored_extensions = {'.jpg', '.jpeg', '.png', '.webp', '.mp4', '.xz'}
+zip_chunk_size = 1024 * 1024
+# Written into a record directory once its post has been downloaded completely
+download_marker = '.downloaded'
+
+
+class _ZipStream(io.RawIOBase):
+    """Unseekable sink for ZipFile that buffers written bytes until they are popped."""
+
+    def __init__(self):
+        super().__init__()
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        self._chunks.append(bytes(b))
+        return len(b)
+
+    def pop(self) -> bytes:
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
 
 class PostService:
-    def __init__(self, items: List[IgRecord]):
+    def __init__(self, items: List[IgRecord], loader_pool: LoaderPool = None):
         self.items = items
         self.shortCodeList = {}
+        # Records whose links were rejected without any network access, with the reason
+        self.rejected = {}
         self.base_dir = Path(__file__).resolve().parents[1]
+        self.loader_pool = loader_pool
 
-    def process(self):
+    def collect_shortcodes(self):
+        links = classify_records(self.items)
         for item in self.items:
-            shortcode = item.image_link.split("/")[-2]
-            self.shortCodeList[item.id] = shortcode
-        return self.parse()
-
-    def parse(self):
+            try:
+                self.shortCodeList[item.id] = shortcode_from_link(links[item.id], item.image_link)
+            except InvalidLinkError as e:
+                logging.error(f"Rejecting record {item.id}: {e}")
+                self.rejected[item.id] = str(e)
+        return self.shortCodeList
+
+    def check_limit(self):
         if len(self.shortCodeList) > int(max_image_download_limit):
             raise ValueError(f"Exceeded the maximum limit of {max_image_download_limit} images")
 
+    def process(self):
+        self.collect_shortcodes()
+        if self.loader_pool is not None:
+            return self.parse()
+        # Without a pool owned by the caller, use a private one for this batch
+        self.loader_pool = LoaderPool(size=1)
+        try:
+            return self.parse()
+        finally:
+            self.loader_pool.close()
+            self.loader_pool = None
+
+    def parse(self):
+        self.check_limit()
+
         posts_dir_path = self.base_dir / "downloads" / "posts"
         posts_dir_path.mkdir(parents=True, exist_ok=True)
 
-        # Generate a unique zip filename using UUID
-        zip_filename = f"{uuid.uuid4()}.zip"
-        zip_path = posts_dir_path.parent / zip_filename
-
         # Check for existing post folders before downloading
         for recordID, shortcode in self.shortCodeList.items():
             shortcode_dir = posts_dir_path / shortcode
@@ -47,31 +93,55 @@ class PostService:
                 # If the shortcode directory doesn't exist, download the post
                 self.download_post(shortcode, recordID)
 
-        # Create the zip file containing the entire 'posts' folder
-        with zipfile.ZipFile(zip_path, "w") as zipf:
-            for root, _, files in os.walk(posts_dir_path):
-                for file in files:
-                    file_path = Path(root) / file
-                    zipf.write(file_path, file_path.relative_to(posts_dir_path))
+        # Streamed while it is built, no zip is written to disk
+        return self.iter_zip()
 
-        return f"http://{server_host}/downloads/{zip_filename}"
+    def iter_zip(self, record_ids: Iterable[str] = None) -> Iterator[bytes]:
+        """Yield a zip archive of the given (by default: the requested) record directories while it is built."""
+        posts_dir_path = self.base_dir / "downloads" / "posts"
+        stream = _ZipStream()
+        with zipfile.ZipFile(stream, "w", compression=zipfile.ZIP_DEFLATED) as zipf:
+            for recordID in (record_ids if record_ids is not None else self.shortCodeList):
+                record_dir = posts_dir_path / recordID
+                if not record_dir.is_dir():
+                    continue
+                for root, _, files in os.walk(record_dir):
+                    for file in sorted(files):
+                        if file == download_marker:
+                            continue
+                        file_path = Path(root) / file
+                        zinfo = zipfile.ZipInfo.from_file(file_path, file_path.relative_to(posts_dir_path))
+                        if file_path.suffix.lower() in stored_extensions:
+                            zinfo.compress_type = zipfile.ZIP_STORED
+                        else:
+                            zinfo.compress_type = zipfile.ZIP_DEFLATED
+                        with open(file_path, "rb") as src, zipf.open(zinfo, "w") as dest:
+                            while chunk := src.read(zip_chunk_size):
+                                dest.write(chunk)
+                                yield stream.pop()
+        yield stream.pop()
 
     def download_post(self, shortcode: str, recordID: str):
         directory = self.base_dir / 'downloads' / 'posts' / recordID
         directory.mkdir(parents=True, exist_ok=True)
 
         try:
-            # Temporarily remove the context lib redirect to see the errors
-            L = instaloader.Instaloader()
+            with self.loader_pool.borrow() as L:
+                # Load the post using the shortcode
+                post = instaloader.Post.from_shortcode(L.context, shortcode)
 
-            # Load the post using the shortcode
-            post = instaloader.Post.from_shortcode(L.context, shortcode)
-
-            # Download and save the post
-            L.download_post(post, target=directory)
+                # Download and save the post
+                L.download_post(post, target=directory)
 
+            (directory / download_marker).touch()
             return True
         except Exception as e:
             # Provide more detailed information on the error
             print(f"An error occurred while downloading post {recordID} with shortcode {shortcode}: {e}")
+            # A partial download must not be taken for a complete one later
+            shutil.rmtree(directory, ignore_errors=True)
             return False
+
+    def is_downloaded(self, recordID: str) -> bool:
+        """Whether the post of a record has been downloaded completely, by this or an earlier request."""
+        return (self.base_dir / 'downloads' / 'posts' / recordID / download_marker).is_file()
@@ -0,0 +1,99 @@
+import json
+import logging
+import os
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Iterable, Iterator, List, Tuple
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from dotenv import load_dotenv
+
+# Load environment variables from .env file
+load_dotenv()
+
+push_url = os.getenv("PUSH_URL", "https://api.dev.gastromind.co/api/v1/products/update_asset/")
+push_workers = int(os.getenv("PUSH_WORKERS", 2))
+push_batch_size = int(os.getenv("PUSH_BATCH_SIZE", 1))
+push_retries = int(os.getenv("PUSH_RETRIES", 5))
+push_backoff_factor = float(os.getenv("PUSH_BACKOFF_FACTOR", 0.5))
+push_timeout = float(os.getenv("PUSH_TIMEOUT", 30))
+
+
+class PushService:
+    """Pushes downloaded assets, i.e. ``{"asset_file_url", "external_id"}`` payloads, to the platform.
+
+    All requests go through one session whose connection pool is sized for ``max_workers`` concurrent pushes.
+    Only requests that the platform has not processed are retried, with exponential backoff honoring Retry-After:
+    those that could not connect and those answered with 429 or 503. A POST that timed out or failed with another
+    error may have been applied already, so it is not retried, to not push duplicates. With ``batch_size`` > 1, up
+    to that many payloads are sent as a JSON array in one request, which requires the platform endpoint to accept
+    arrays.
+    """
+
+    def __init__(self, url: str = None, max_workers: int = None, batch_size: int = None, retries: int = None,
+                 backoff_factor: float = None):
+        self.url = url or push_url
+        self.max_workers = max(1, max_workers or push_workers)
+        self.batch_size = max(1, batch_size or push_batch_size)
+        self.headers = {
+            'Content-Type': 'application/json',
+            'Authorization': f'Token {os.getenv("AUTHORIZATION_TOKEN")}'
+        }
+        retries = push_retries if retries is None else retries
+        retry = Retry(total=retries, connect=retries, read=0, other=0, status=retries,
+                      backoff_factor=push_backoff_factor if backoff_factor is None else backoff_factor,
+                      status_forcelist=[429, 503], allowed_methods=frozenset({'POST'}), raise_on_status=False)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.max_workers, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def push_batch(self, payloads: List[dict]) -> bool:
+        """Push payloads in one request. A single payload is sent as object, several as array."""
+        data = json.dumps(payloads[0] if len(payloads) == 1 else payloads)
+        try:
+            response = self.session.post(url=self.url, headers=self.headers, data=data, timeout=push_timeout)
+        except requests.RequestException as e:
+            logging.error(f"Error pushing data to platform: {payloads}: {e}")
+            return False
+        if response.status_code != 200:
+            logging.error(f"Error pushing data to platform: {payloads}")
+            logging.error(response.text)
+            return False
+        return True
+
+    def batches(self, payloads: Iterable[dict]) -> Iterator[List[dict]]:
+        batch = []
+        for payload in payloads:
+            batch.append(payload)
+            if len(batch) == self.batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def push(self, payloads: Iterable[dict]) -> Iterator[Tuple[List[dict], bool]]:
+        """Push payloads concurrently, yielding each batch with its success as it completes.
+
+        At most two batches per worker are in flight, so payloads are consumed as they are pushed."""
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="push") as executor:
+            futures = {}
+            for batch in self.batches(payloads):
+                if len(futures) >= 2 * self.max_workers:
+                    done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        yield futures.pop(future), future.result()
+                futures[executor.submit(self.push_batch, batch)] = batch
+            while futures:
+                done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield futures.pop(future), future.result()
+
+    def close(self):
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
@@ -0,0 +1,158 @@
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Iterable, Iterator, Optional
+from dto.Model import IgRecord
+from dotenv import load_dotenv
+
+# Load environment variables from .env file
+load_dotenv()
+
+sync_journal_path = (os.getenv("SYNC_JOURNAL_PATH") or
+                     str(Path(__file__).resolve().parents[1] / "cache" / "sync_journal.sqlite3"))
+
+
+class SyncJournal:
+    """Durable per-record progress of a sync run.
+
+    Every record is journaled when it is fetched from Airtable, downloaded and pushed, with timestamps and the
+    error of a failed step. A run that did not finish, e.g. because the syncer crashed, is resumed by the next
+    one: the Airtable fetch is skipped if it had completed, downloaded records are not downloaded again and
+    pushed records are not pushed again, so only the remaining and the failed work is redone.
+
+    Records that failed are kept when a new run starts, and are retried by it even if it does not fetch them again,
+    e.g. because it is incremental, see :meth:`retry_records`. While there are failed records, the fetch watermark
+    is not advanced either, see :meth:`watermark`.
+    """
+
+    def __init__(self, path: str = None):
+        self.path = path or sync_journal_path
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(self.path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.execute("CREATE TABLE IF NOT EXISTS records ("
+                                 "id TEXT PRIMARY KEY, image_link TEXT NOT NULL, status TEXT NOT NULL, "
+                                 "asset_file_url TEXT, error TEXT, "
+                                 "fetched_at REAL, downloaded_at REAL, pushed_at REAL)")
+        self._connection.execute("CREATE TABLE IF NOT EXISTS run (key TEXT PRIMARY KEY, value TEXT)")
+
+    def _get(self, key: str) -> Optional[str]:
+        row = self._connection.execute("SELECT value FROM run WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _set(self, key: str, value: str):
+        self._connection.execute("INSERT OR REPLACE INTO run VALUES (?, ?)", (key, value))
+
+    def begin(self, mode: str) -> bool:
+        """Start a run, or resume the unfinished run of the same mode. Returns True when resuming."""
+        with self._lock:
+            if self._get("status") == "running" and self._get("mode") == mode:
+                return True
+            self._connection.execute("BEGIN IMMEDIATE")
+            self._connection.execute("DELETE FROM records WHERE status != 'failed'")
+            self._connection.execute("DELETE FROM run")
+            self._set("status", "running")
+            self._set("mode", mode)
+            self._set("started_at", str(time.time()))
+            self._connection.execute("COMMIT")
+            return False
+
+    def finish(self):
+        with self._lock:
+            self._set("status", "finished")
+            self._set("finished_at", str(time.time()))
+
+    @property
+    def fetch_completed(self) -> bool:
+        with self._lock:
+            return self._get("fetch_completed") is not None
+
+    def record_fetched(self, records: Iterable[IgRecord], completed: bool = False, partial: bool = False):
+        """Journal fetched records. The progress of a known record is kept unless its image link changed.
+
+        A fetch that is ``completed`` but ``partial`` did not see every modified row, e.g. because it stopped at
+        MAX_ITEMS, so the watermark must not advance past it."""
+        now = time.time()
+        with self._lock:
+            self._connection.execute("BEGIN IMMEDIATE")
+            self._connection.executemany(
+                "INSERT INTO records (id, image_link, status, fetched_at) VALUES (?, ?, 'fetched', ?) "
+                "ON CONFLICT (id) DO UPDATE SET fetched_at = excluded.fetched_at, "
+                "status = CASE WHEN image_link = excluded.image_link THEN status ELSE 'fetched' END, "
+                "asset_file_url = CASE WHEN image_link = excluded.image_link THEN asset_file_url END, "
+                "downloaded_at = CASE WHEN image_link = excluded.image_link THEN downloaded_at END, "
+                "pushed_at = CASE WHEN image_link = excluded.image_link THEN pushed_at END, "
+                "image_link = excluded.image_link",
+                ((record.id, record.image_link, now) for record in records))
+            if completed:
+                self._set("fetch_completed", str(now))
+                if partial:
+                    self._set("fetch_partial", str(now))
+            self._connection.execute("COMMIT")
+
+    def record_downloaded(self, downloaded_image: dict):
+        """Journal the result of ImageService.download_image, or the error dict of a failed download."""
+        with self._lock:
+            if "error" in downloaded_image:
+                self._connection.execute("UPDATE records SET status = 'failed', error = ? WHERE id = ?",
+                                         (downloaded_image["error"], downloaded_image["external_id"]))
+            else:
+                self._connection.execute(
+                    "UPDATE records SET status = 'downloaded', asset_file_url = ?, error = NULL, downloaded_at = ? "
+                    "WHERE id = ?",
+                    (downloaded_image["asset_file_url"], time.time(), downloaded_image["external_id"]))
+
+    def record_pushed(self, record_id: str, error: str = None):
+        with self._lock:
+            if error:
+                self._connection.execute("UPDATE records SET status = 'failed', error = ? WHERE id = ?",
+                                         (error, record_id))
+            else:
+                self._connection.execute("UPDATE records SET status = 'pushed', error = NULL, pushed_at = ? "
+                                         "WHERE id = ?", (time.time(), record_id))
+
+    def retry_records(self) -> Iterator[IgRecord]:
+        """Records that failed in an earlier run and have not been fetched by this one."""
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT id, image_link FROM records WHERE status = 'failed' AND "
+                "fetched_at < (SELECT CAST(value AS REAL) FROM run WHERE key = 'started_at')").fetchall()
+        return (IgRecord(id=record_id, image_link=image_link) for record_id, image_link in rows)
+
+    def watermark(self) -> Optional[float]:
+        """The time up to which the fetch watermark may advance once this run is over, or None to keep it.
+
+        This is the start of the run, which precedes its fetch, also when it was resumed. It is None while the fetch
+        is incomplete or partial, or while any record has failed, in this run or an earlier one: the rows of failed
+        records have to stay newer than the watermark, so that the next incremental run fetches them again."""
+        with self._lock:
+            if self._get("fetch_completed") is None or self._get("fetch_partial") is not None:
+                return None
+            if self._connection.execute("SELECT 1 FROM records WHERE status = 'failed' LIMIT 1").fetchone():
+                return None
+            return float(self._get("started_at"))
+
+    def is_pushed(self, record_id: str) -> bool:
+        with self._lock:
+            row = self._connection.execute("SELECT status FROM records WHERE id = ?", (record_id,)).fetchone()
+        return row is not None and row[0] == "pushed"
+
+    def downloaded_result(self, record_id: str) -> Optional[dict]:
+        """The download result of a record that was downloaded but not pushed yet, if any."""
+        with self._lock:
+            row = self._connection.execute("SELECT asset_file_url FROM records "
+                                           "WHERE id = ? AND status != 'pushed' AND downloaded_at IS NOT NULL",
+                                           (record_id,)).fetchone()
+        return {"asset_file_url": row[0], "external_id": record_id} if row else None
+
+    def counts(self) -> dict:
+        with self._lock:
+            return dict(self._connection.execute("SELECT status, COUNT(*) FROM records GROUP BY status").fetchall())
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
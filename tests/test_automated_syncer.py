@@ -0,0 +1,52 @@
+import threading
+
+from dto.Model import IgRecord
+from scripts import automated_syncer
+from scripts.automated_syncer import AutomatedSyncer
+from services import push_service
+from services.at_downloader import FetchWatermarks
+from services.image_service import ImageService
+from services.push_service import PushService
+from services.sync_journal import SyncJournal
+
+
+class StubDownloader:
+    def __init__(self, records):
+        self.records = records
+
+    def iter_airtable_data(self, **kwargs):
+        return iter(self.records)
+
+
+class StubLoaderPool:
+    def close(self):
+        pass
+
+
+def test_streaming_journals_push_errors_and_finishes(tmp_path, monkeypatch):
+    records = [IgRecord(id=f"rec{index}", image_link=f"https://www.instagram.com/p/CuWrSwMIWT{chr(97 + index)}/")
+               for index in range(8)]
+    monkeypatch.setattr(automated_syncer, "pipeline_queue_size", 1)
+    monkeypatch.setattr(automated_syncer, "LoaderPool", StubLoaderPool)
+    # A single push stage, which the run depends on
+    monkeypatch.setattr(push_service, "push_workers", 1)
+    monkeypatch.setattr(AutomatedSyncer, "airtable_downloader", staticmethod(lambda: StubDownloader(records)))
+    monkeypatch.setattr(ImageService, "download_image", lambda self, shortcode, recordID, img_index=None: {
+        "asset_file_url": f"http://localhost/{shortcode}.jpg", "external_id": recordID})
+
+    def push_batch(self, payloads):
+        if payloads[0]["external_id"] == "rec1":
+            raise TypeError("Object of type bytes is not JSON serializable")
+        return True
+
+    monkeypatch.setattr(PushService, "push_batch", push_batch)
+    journal = SyncJournal(str(tmp_path / "journal.sqlite3"))
+    syncer = AutomatedSyncer(journal=journal, watermarks=FetchWatermarks(str(tmp_path / "watermarks.ini")))
+    thread = threading.Thread(target=syncer.start_streaming, daemon=True)
+    thread.start()
+    thread.join(10)
+    # The error ended neither the push stage nor the run
+    assert not thread.is_alive()
+    assert syncer.state == "end"
+    assert journal.counts() == {"pushed": 7, "failed": 1}
+    journal.close()
@@ -0,0 +1,30 @@
+import random
+import time
+
+from dto.Model import IgRecord
+from services.image_service import ImageService
+
+
+class StubImageService(ImageService):
+    """Downloads nothing, finishing in random order."""
+
+    def download_image(self, shortcode, recordID, img_index=None):
+        time.sleep(random.random() / 50)
+        if recordID == "failing":
+            raise RuntimeError("download failed")
+        return {"asset_file_url": f"http://localhost/{shortcode}.jpg", "external_id": recordID}
+
+
+def test_results_are_in_input_order():
+    links = {"post1": "https://www.instagram.com/p/CuWrSwMIWTq/",
+             "story": "https://www.instagram.com/stories/instagram/3141592653/",
+             "post2": "https://www.instagram.com/p/CuWrSwMIWTr/",
+             "failing": "https://www.instagram.com/p/CuWrSwMIWTs/",
+             "other": "https://example.com/image.jpg",
+             "post3": "https://www.instagram.com/reel/CuWrSwMIWTt/"}
+    service = StubImageService([IgRecord(id=record_id, image_link=link) for record_id, link in links.items()],
+                               max_workers=4, loader_pool=object())
+    results = service.process()
+    assert [result["external_id"] for result in results] == list(links)
+    assert [record_id for record_id, result in zip(links, results) if "error" in result] == \
+        ["story", "failing", "other"]
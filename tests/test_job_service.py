@@ -0,0 +1,66 @@
+import threading
+import time
+
+from dto.Model import IgRecord
+from services.image_service import ImageService
+from services.job_service import JobManager
+from services.post_service import PostService, download_marker
+
+
+def records(count):
+    return [IgRecord(id=f"rec{index}", image_link=f"https://www.instagram.com/p/CuWrSwMIWT{chr(97 + index)}/")
+            for index in range(count)]
+
+
+def test_close_waits_for_running_downloads(monkeypatch):
+    running = threading.Event()
+    finished = []
+
+    def download_image(self, shortcode, recordID, img_index=None):
+        running.set()
+        time.sleep(0.2)
+        finished.append(recordID)
+        return {"asset_file_url": f"http://localhost/{shortcode}.jpg", "external_id": recordID}
+
+    monkeypatch.setattr(ImageService, "download_image", download_image)
+    manager = JobManager(loader_pool=object(), max_workers=1)
+    job = manager.submit_images(records(3))
+    running.wait(5)
+    manager.close()
+    # The running download ended before close() returned, the queued ones were cancelled
+    assert finished == ["rec0"]
+    result = job.to_dict()
+    assert result["status"] == "completed"
+    assert (result["done"], result["failed"]) == (1, 2)
+    assert job.result == [{"external_id": "rec0", "asset_file_url": "http://localhost/CuWrSwMIWTa.jpg"}]
+
+
+def test_downloaded_post_is_not_downloaded_again(tmp_path, monkeypatch):
+    downloads = []
+    monkeypatch.setattr(PostService, "download_post",
+                        lambda self, shortcode, recordID: downloads.append(recordID) or True)
+    service = PostService([])
+    service.base_dir = tmp_path
+    directory = tmp_path / "downloads" / "posts" / "rec0"
+    directory.mkdir(parents=True)
+    (directory / "post.jpg").write_bytes(b"jpeg")
+    (directory / download_marker).touch()
+    # Left behind by a download that failed halfway
+    partial = tmp_path / "downloads" / "posts" / "rec1"
+    partial.mkdir(parents=True)
+    (partial / "post_1.jpg").write_bytes(b"jpeg")
+    assert JobManager._download_post(service, "CuWrSwMIWTa", "rec0") == directory
+    JobManager._download_post(service, "CuWrSwMIWTb", "rec1")
+    assert downloads == ["rec1"]
+
+
+def test_failed_post_download_is_removed(tmp_path):
+    class FailingLoaderPool:
+        def borrow(self):
+            raise ConnectionError("Connection refused")
+
+    service = PostService([], loader_pool=FailingLoaderPool())
+    service.base_dir = tmp_path
+    assert not service.download_post("CuWrSwMIWTa", "rec0")
+    assert not (tmp_path / "downloads" / "posts" / "rec0").exists()
+    assert not service.is_downloaded("rec0")
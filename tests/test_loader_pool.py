@@ -0,0 +1,49 @@
+import threading
+
+import pytest
+
+from services import loader_pool
+from services.loader_pool import LoaderPool
+
+
+@pytest.fixture
+def pool(tmp_path, monkeypatch):
+    monkeypatch.setattr(loader_pool, "rate_state_path", str(tmp_path / "ratestate.sqlite3"))
+    pool = LoaderPool(size=1, media_store=None, metadata_cache=None)
+    yield pool
+    pool.close()
+
+
+def test_borrow_times_out(pool):
+    pool.acquire_timeout = 0.1
+    with pool.borrow():
+        with pytest.raises(TimeoutError):
+            with pool.borrow():
+                pass
+
+
+def test_close_wakes_waiting_borrowers(pool, monkeypatch):
+    errors = []
+    closed = []
+
+    def borrow():
+        try:
+            with pool.borrow():
+                pass
+        except RuntimeError as e:
+            errors.append(e)
+
+    with pool.borrow() as loader:
+        monkeypatch.setattr(loader, "close", lambda: closed.append(loader))
+        monkeypatch.setattr(pool.rate_controller, "close", lambda: closed.append(pool.rate_controller))
+        waiting = threading.Thread(target=borrow)
+        waiting.start()
+        waiting.join(0.2)
+        pool.close()
+        waiting.join(5)
+        assert not waiting.is_alive()
+        assert errors
+        # The borrowed loader and the shared rate controller stay open until the loader is returned
+        assert closed == []
+    assert closed == [loader, pool.rate_controller]
+    assert pool._loaders == [] and pool._idle == []
@@ -0,0 +1,19 @@
+from dto.Model import IgRecord, classify_records, parse_shortcode
+
+
+def test_link_follows_image_link():
+    record = IgRecord(id="rec1", image_link="https://www.instagram.com/p/CuWrSwMIWTq/")
+    assert record.link.kind == "post"
+    story = record.model_copy(update={"id": "rec2",
+                                      "image_link": "https://www.instagram.com/stories/instagram/3141592653/"})
+    assert story.link.kind == "story"
+    assert not story.is_syncable
+    record.image_link = "https://www.instagram.com/reel/CuWrSwMIWTq/?img_index=2"
+    assert record.link == ("reel", "CuWrSwMIWTq", 2)
+    assert classify_records([record, story]) == {"rec1": record.link, "rec2": story.link}
+
+
+def test_media_id_query_is_read_for_post_links_without_shortcode():
+    shortcode = parse_shortcode("https://www.instagram.com/?media_id=3141592653589793238")
+    assert parse_shortcode("https://www.instagram.com/p/?media_id=3141592653589793238") == shortcode
+    assert parse_shortcode("https://www.instagram.com/p/CuWrSwMIWTq/?media_id=3141592653589793238") == "CuWrSwMIWTq"
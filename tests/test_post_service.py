@@ -0,0 +1,20 @@
+import io
+import zipfile
+
+from services.post_service import PostService, download_marker
+
+
+def test_zip_is_streamed_without_file(tmp_path):
+    record_dir = tmp_path / "downloads" / "posts" / "rec1"
+    record_dir.mkdir(parents=True)
+    (record_dir / "post.jpg").write_bytes(b"\xff\xd8" * 1000)
+    (record_dir / "post.txt").write_text("caption " * 100)
+    (record_dir / download_marker).touch()
+    service = PostService([])
+    service.base_dir = tmp_path
+    service.shortCodeList = {"rec1": "CuWrSwMIWTq", "missing": "CuWrSwMIWTr"}
+    archive = zipfile.ZipFile(io.BytesIO(b"".join(service.iter_zip())))
+    assert {info.filename: info.compress_type for info in archive.infolist()} == {
+        "rec1/post.jpg": zipfile.ZIP_STORED, "rec1/post.txt": zipfile.ZIP_DEFLATED}
+    assert archive.read("rec1/post.txt") == b"caption " * 100
+    assert sorted(path.name for path in (tmp_path / "downloads").iterdir()) == ["posts"]
@@ -0,0 +1,116 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from services.push_service import PushService
+
+
+class StandIn:
+    """Local stand-in for the platform endpoint, answering with the given status codes in turn, then 200."""
+
+    def __init__(self, statuses=(), reject=()):
+        self.statuses = list(statuses)
+        self.reject = set(reject)
+        self.bodies = []
+        self.lock = threading.Lock()
+        stand_in = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+                payloads = body if isinstance(body, list) else [body]
+                with stand_in.lock:
+                    stand_in.bodies.append(body)
+                    if any(payload['external_id'] in stand_in.reject for payload in payloads):
+                        status = 400
+                    else:
+                        status = stand_in.statuses.pop(0) if stand_in.statuses else 200
+                self.send_response(status)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f'http://127.0.0.1:{self.server.server_address[1]}/update_asset/'
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def stand_in():
+    servers = []
+
+    def start(*args, **kwargs):
+        servers.append(StandIn(*args, **kwargs))
+        return servers[-1]
+
+    yield start
+    for server in servers:
+        server.close()
+
+
+def payload(external_id):
+    return {"asset_file_url": f"http://localhost/{external_id}.jpg", "external_id": external_id}
+
+
+def test_retries_503_then_succeeds(stand_in):
+    server = stand_in(statuses=[503, 503])
+    with PushService(url=server.url, max_workers=1, retries=3, backoff_factor=0) as pusher:
+        assert pusher.push_batch([payload("rec1")])
+    assert server.bodies == [payload("rec1")] * 3
+
+
+def test_gives_up_after_retries(stand_in):
+    server = stand_in(statuses=[503] * 5)
+    with PushService(url=server.url, max_workers=1, retries=2, backoff_factor=0) as pusher:
+        assert not pusher.push_batch([payload("rec1")])
+    assert len(server.bodies) == 3
+
+
+def test_does_not_retry_500(stand_in):
+    # The platform may have applied the update already
+    server = stand_in(statuses=[500])
+    with PushService(url=server.url, max_workers=1, retries=3, backoff_factor=0) as pusher:
+        assert not pusher.push_batch([payload("rec1")])
+    assert len(server.bodies) == 1
+
+
+def test_batch_payload_shape(stand_in):
+    server = stand_in()
+    with PushService(url=server.url, max_workers=1, batch_size=2, backoff_factor=0) as pusher:
+        results = list(pusher.push([payload("rec1"), payload("rec2"), payload("rec3")]))
+    assert sorted(server.bodies, key=lambda body: isinstance(body, dict)) == [
+        [payload("rec1"), payload("rec2")], payload("rec3")]
+    assert all(ok for _, ok in results)
+
+
+def test_result_per_external_id(stand_in):
+    server = stand_in(statuses=[503], reject={"rec2"})
+    with PushService(url=server.url, max_workers=2, retries=3, backoff_factor=0) as pusher:
+        results = {batch[0]["external_id"]: ok
+                   for batch, ok in pusher.push(payload(f"rec{i}") for i in range(1, 6))}
+    assert results == {"rec1": True, "rec2": False, "rec3": True, "rec4": True, "rec5": True}
+    assert len(server.bodies) == 6
+
+
+def test_bounds_in_flight_batches(stand_in):
+    server = stand_in()
+    consumed = []
+
+    def payloads():
+        for i in range(20):
+            consumed.append(i)
+            yield payload(f"rec{i}")
+
+    with PushService(url=server.url, max_workers=2, backoff_factor=0) as pusher:
+        results = pusher.push(payloads())
+        next(results)
+        assert len(consumed) <= 2 * pusher.max_workers + 1
+        assert len(list(results)) == 19
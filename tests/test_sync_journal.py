@@ -0,0 +1,67 @@
+from dto.Model import IgRecord
+from services.sync_journal import SyncJournal
+
+
+def record(record_id):
+    return IgRecord(id=record_id, image_link=f"https://www.instagram.com/p/{record_id}/")
+
+
+def finished_run(journal):
+    journal.begin("phased")
+    journal.record_fetched([record("ok"), record("failed_download"), record("failed_push")], completed=True)
+    journal.record_downloaded({"asset_file_url": "http://localhost/ok.jpg", "external_id": "ok"})
+    journal.record_downloaded({"external_id": "failed_download", "error": "404"})
+    journal.record_downloaded({"asset_file_url": "http://localhost/push.jpg", "external_id": "failed_push"})
+    journal.record_pushed("ok")
+    journal.record_pushed("failed_push", error="push failed")
+    journal.finish()
+
+
+def test_new_run_keeps_failed_records(tmp_path):
+    journal = SyncJournal(str(tmp_path / "journal.sqlite3"))
+    finished_run(journal)
+    assert not journal.begin("phased")
+    assert journal.counts() == {"failed": 2}
+    assert sorted(r.id for r in journal.retry_records()) == ["failed_download", "failed_push"]
+    # A failed push is only pushed again, a failed download is downloaded again
+    assert journal.downloaded_result("failed_push") == {"asset_file_url": "http://localhost/push.jpg",
+                                                        "external_id": "failed_push"}
+    assert journal.downloaded_result("failed_download") is None
+    journal.close()
+
+
+def test_refetched_failed_records_are_not_retried_twice(tmp_path):
+    journal = SyncJournal(str(tmp_path / "journal.sqlite3"))
+    finished_run(journal)
+    journal.begin("phased")
+    journal.record_fetched([record("failed_download")])
+    assert [r.id for r in journal.retry_records()] == ["failed_push"]
+    journal.record_downloaded({"asset_file_url": "http://localhost/retry.jpg", "external_id": "failed_push"})
+    journal.record_pushed("failed_push")
+    assert journal.counts() == {"failed": 1, "pushed": 1}
+    journal.close()
+
+
+def test_watermark_waits_for_failed_records(tmp_path):
+    journal = SyncJournal(str(tmp_path / "journal.sqlite3"))
+    finished_run(journal)
+    journal.begin("phased")
+    assert journal.watermark() is None
+    journal.record_fetched([], completed=True)
+    # The failed records of the earlier run keep the watermark where it was
+    assert journal.watermark() is None
+    for record_id in ("failed_download", "failed_push"):
+        journal.record_downloaded({"asset_file_url": "http://localhost/retry.jpg", "external_id": record_id})
+        journal.record_pushed(record_id)
+    assert journal.watermark() is not None
+    journal.close()
+
+
+def test_watermark_is_kept_after_partial_fetch(tmp_path):
+    journal = SyncJournal(str(tmp_path / "journal.sqlite3"))
+    journal.begin("streaming")
+    journal.record_fetched([record("ok")], completed=True, partial=True)
+    journal.record_downloaded({"asset_file_url": "http://localhost/ok.jpg", "external_id": "ok"})
+    journal.record_pushed("ok")
+    assert journal.watermark() is None
+    journal.close()